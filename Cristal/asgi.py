@@ -3,6 +3,10 @@ ASGI config for Cristal project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (uvicorn, daphne...) so the reception board's
+live channel (``recepcion/eventos/<piso_id>/``, Server-Sent Events) can keep
+its connections open without tying up a worker thread per tab.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
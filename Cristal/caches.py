@@ -0,0 +1,47 @@
+"""
+Configuración de ``CACHES`` según el entorno.
+
+``CRISTAL_CACHE`` elige el modo y ``CRISTAL_CACHE_UBICACION`` su destino:
+
+- ``local`` (por defecto): memoria de cada proceso. Sirve con un solo worker;
+  con varios, cada uno ve sus propias versiones y cachés.
+- ``archivo``: un directorio compartido por los workers de la misma máquina.
+- ``bd``: la tabla ``cristal_cache`` de la base de datos (crearla con
+  ``manage.py createcachetable``); compartida por todas las máquinas.
+- ``redis``: un servidor compatible con Redis (Redis, Valkey...), p. ej.
+  ``redis://127.0.0.1:6379/1``. Requiere el paquete ``redis``.
+
+En ``archivo`` y ``bd`` ``incr`` no es atómico; dos invalidaciones
+simultáneas pueden subir la versión una sola vez, lo que basta para
+descartar lo viejo.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+MODOS = ('local', 'archivo', 'bd', 'redis')
+TABLA_CACHE = 'cristal_cache'
+
+
+def configurar_caches(modo='local', ubicacion=None, base_dir=None):
+    """Devuelve el dict ``CACHES`` para ``modo``."""
+    if modo == 'local':
+        backend, ubicacion = 'django.core.cache.backends.locmem.LocMemCache', ubicacion or 'cristal'
+    elif modo == 'archivo':
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        if not ubicacion:
+            if base_dir is None:
+                raise ImproperlyConfigured("CRISTAL_CACHE=archivo necesita CRISTAL_CACHE_UBICACION.")
+            ubicacion = str(base_dir / 'cache')
+    elif modo == 'bd':
+        backend, ubicacion = 'django.core.cache.backends.db.DatabaseCache', ubicacion or TABLA_CACHE
+    elif modo == 'redis':
+        backend = 'django.core.cache.backends.redis.RedisCache'
+        ubicacion = ubicacion or 'redis://127.0.0.1:6379/1'
+    else:
+        raise ImproperlyConfigured(f"CRISTAL_CACHE debe ser uno de {', '.join(MODOS)}; no {modo!r}.")
+    return {
+        'default': {
+            'BACKEND': backend,
+            'LOCATION': ubicacion,
+            'KEY_PREFIX': 'cristal',
+        },
+    }
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from .caches import configurar_caches
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,6 +24,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-#%n)$ehbbf0)-ozo)*ku$1_+r-div$=o-eiv328q2hhq_us9r-'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 AUTH_USER_MODEL = 'Cristal_app.CustomUser'
+# Igual que ModelBackend, pero con los permisos en la caché compartida
+AUTHENTICATION_BACKENDS = ['Cristal_app.permisos.PermisosCacheBackend']
 DEFAULT_FROM_EMAIL = 'no-reply@tudominio.com'
 SERVER_EMAIL = 'no-reply@tudominio.com'
 DEBUG = True
@@ -47,6 +51,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Cristal_app.estaticos.EstaticosMiddleware',
+    'Cristal_app.consultas.PresupuestoConsultasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,11 +74,16 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'Cristal_app.layout.contexto',
             ],
         },
     },
 ]
 
+# El canal en vivo del tablero de recepción (Server-Sent Events) necesita
+# servir la app por ASGI (Cristal.asgi.application, p. ej. con uvicorn o
+# daphne). Bajo WSGI o runserver el tablero consulta los cambios del piso
+# cada pocos segundos en lugar de mantener una conexión abierta por pestaña.
 WSGI_APPLICATION = 'Cristal.wsgi.application'
 
 # Database
@@ -89,6 +100,15 @@ DATABASES = {
     }
 }
 
+# Caché compartida por las versiones e invalidaciones de la app (ver Cristal/caches.py)
+CACHES = configurar_caches(
+    os.environ.get('CRISTAL_CACHE', 'local'),
+    os.environ.get('CRISTAL_CACHE_UBICACION'),
+    BASE_DIR,
+)
+# Fragmentos del layout (menú lateral y barra superior); se invalidan por versión
+LAYOUT_CACHE_TIMEOUT = 60 * 60 * 24
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -128,6 +148,24 @@ STATICFILES_DIRS = [
 # El directorio donde Django recolectará todos los archivos estáticos en producción
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Archivos subidos (imágenes de producto y sus miniaturas, ver Cristal_app/imagenes.py)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# collectstatic solo copia lo que la app referencia, con hash en el nombre y
+# variantes .gz/.br (ver Cristal_app/estaticos.py)
+STATICFILES_FINDERS = [
+    'Cristal_app.estaticos.ReferenciadosFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+]
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'Cristal_app.estaticos.EstaticosStorage'},
+}
+# La app sirve STATIC_ROOT si no hay un servidor web delante; por defecto,
+# cuando DEBUG está apagado
+# ESTATICOS_SERVIR = True
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -142,4 +180,17 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # Configuración del framework de sitios
-SITE_ID = 1
\ No newline at end of file
+SITE_ID = 1
+# Presupuesto de consultas por request (ver Cristal_app/consultas.py).
+# En producción solo se registra en el log; los tests lo vuelven estricto.
+PRESUPUESTO_CONSULTAS_ESTRICTO = False
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'Cristal_app.consultas': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include, reverse_lazy
 from django.contrib.auth import views as auth_views
@@ -33,4 +35,7 @@ urlpatterns = [
     path('reset/done/',
          auth_views.PasswordResetCompleteView.as_view(template_name='Cristal_app/autenticacion/password_reset_complete.html'),
          name='password_reset_complete'),
-]
\ No newline at end of file
+]
+
+# En desarrollo runserver sirve los archivos subidos; en producción, el servidor web
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class CristalAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Cristal_app'
-    verbose_name = 'Sistema Hotel'
\ No newline at end of file
+    verbose_name = 'Sistema Hotel'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (conecta los receptores)
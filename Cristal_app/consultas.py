@@ -0,0 +1,185 @@
+# Cristal_app/consultas.py
+"""
+Presupuesto de consultas por request.
+
+``PresupuestoConsultasMiddleware`` cuenta las consultas y el tiempo de BD de
+cada request y agrupa las consultas por forma (el SQL sin valores). Si una
+misma forma se repite muchas veces es casi siempre un N+1: una plantilla que
+sigue una FK fila por fila sin ``select_related``.
+
+Cada nombre de URL tiene un máximo de consultas en ``PRESUPUESTOS`` (se puede
+sobrescribir con ``settings.PRESUPUESTO_CONSULTAS``). Pasarse, o repetir una
+forma, se registra en el logger ``Cristal_app.consultas``; con
+``settings.PRESUPUESTO_CONSULTAS_ESTRICTO = True`` (los tests) además lanza
+``PresupuestoConsultasExcedido``.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('Cristal_app.consultas')
+
+# Máximo de consultas por nombre de URL. Incluye sesión, usuario y savepoints.
+# Un número vale para cualquier método; un dict fija el máximo por método y
+# deja sin presupuesto los que no nombra (solo se vigilan los N+1).
+PRESUPUESTOS = {
+    'home': 4,
+    'recepcion': 8,
+    'recepcion_cambios': 5,
+    'registrar_consumo': {'GET': 2, 'POST': 20},
+    'ocupar_habitacion': {'GET': 5, 'POST': 28},
+    'checkin_grupal': {'GET': 5, 'POST': 22},
+    'checkout_habitacion': {'GET': 3, 'POST': 22},
+    'marcar_limpieza': {'GET': 3, 'POST': 9},
+    'marcar_disponible': {'GET': 3, 'POST': 9},
+    'disponibilidad': 4,
+    'reporte_ocupacion': 5,
+    'reporte_ventas': 4,
+    # Solo cuenta hasta devolver la respuesta; las filas se leen al enviarla
+    'exportar': 4,
+    # POST: unas pocas consultas por lote, sin tope fijo (se vigilan los N+1)
+    'importar': {'GET': 3},
+    'importar_reporte': 2,
+
+    'user_list': 5,
+    'user_create': {'GET': 3},
+    'user_update': {'GET': 7},
+    'user_delete': {'GET': 3},
+    'group_list': 3,
+    'group_create': {'GET': 2},
+    'group_update': {'GET': 3},
+    'group_delete': {'GET': 3},
+
+    'proveedor_list': 3,
+    'proveedor_create': {'GET': 2},
+    'proveedor_update': {'GET': 3},
+    'proveedor_delete': {'GET': 3},
+    'categoria_list': 3,
+    'categoria_create': {'GET': 2},
+    'categoria_update': {'GET': 3},
+    'categoria_delete': {'GET': 3},
+    'producto_list': 4,
+    'producto_create': {'GET': 3},
+    'producto_update': {'GET': 4, 'POST': 9},
+    'producto_delete': {'GET': 3},
+    'producto_imagen': 3,
+
+    'compra_list': 5,
+    'compra_create': {'GET': 4, 'POST': 13},
+    'compra_update': {'GET': 9},
+    'compra_delete': {'GET': 3},
+    'venta_list': 4,
+    'venta_create': {'GET': 3, 'POST': 10},
+    'venta_update': {'GET': 8},
+    'venta_delete': {'GET': 3},
+
+    'cliente_list': 3,
+    'cliente_buscar': 3,
+    'cliente_create': {'GET': 2},
+    'cliente_update': {'GET': 3},
+    'cliente_delete': {'GET': 3},
+
+    'tipohabitacion_list': 3,
+    'tipohabitacion_create': {'GET': 2},
+    'tipohabitacion_update': {'GET': 3},
+    'tipohabitacion_delete': {'GET': 3},
+    'piso_list': 3,
+    'piso_create': {'GET': 2},
+    'piso_update': {'GET': 3},
+    'piso_delete': {'GET': 3},
+    'habitacion_list': 3,
+    'habitacion_create': {'GET': 4},
+    'habitacion_update': {'GET': 5},
+    'habitacion_delete': {'GET': 3},
+}
+
+# Veces que puede repetirse una misma forma de consulta antes de avisar
+REPETICIONES_MAXIMAS = 5
+
+_LISTA_PARAMETROS = re.compile(r'\((?:%s|\?)(?:\s*,\s*(?:%s|\?))*\)')
+_SAVEPOINT = re.compile(r'"s\d+_x\d+"')
+_NUMERO = re.compile(r'\b\d+\b')
+
+
+class PresupuestoConsultasExcedido(Exception):
+    """Un request hizo más consultas de las permitidas o repitió una forma."""
+
+
+def forma(sql):
+    """SQL sin valores concretos: listas ``IN``, números y nombres de savepoint."""
+    sql = _LISTA_PARAMETROS.sub('(...)', sql)
+    sql = _SAVEPOINT.sub('"s"', sql)
+    return _NUMERO.sub('N', sql)
+
+
+def presupuesto(url_name, metodo='GET'):
+    """Máximo de consultas de ``url_name`` para ``metodo``, o None si no tiene."""
+    valor = getattr(settings, 'PRESUPUESTO_CONSULTAS', {}).get(url_name, PRESUPUESTOS.get(url_name))
+    if isinstance(valor, dict):
+        return valor.get(metodo)
+    return valor
+
+
+class MedidorConsultas:
+    """``execute_wrapper`` que acumula consultas, tiempo y formas repetidas."""
+
+    def __init__(self):
+        self.total = 0
+        self.tiempo = 0.0
+        self.formas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo += time.perf_counter() - inicio
+            self.total += 1
+            self.formas[forma(sql)] += 1
+
+    def repetidas(self, maximo=REPETICIONES_MAXIMAS):
+        """Formas que se ejecutaron más de ``maximo`` veces, con su cuenta."""
+        return [(f, n) for f, n in self.formas.most_common() if n > maximo]
+
+
+class PresupuestoConsultasMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medidor = MedidorConsultas()
+        with ExitStack() as stack:
+            for conexion in connections.all():
+                stack.enter_context(conexion.execute_wrapper(medidor))
+            response = self.get_response(request)
+
+        request.consultas = medidor
+        if settings.DEBUG:
+            response['Server-Timing'] = f'db;dur={medidor.tiempo * 1000:.1f};desc="{medidor.total} consultas"'
+        self.revisar(request, medidor)
+        return response
+
+    def revisar(self, request, medidor):
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        problemas = []
+
+        maximo = presupuesto(url_name, request.method)
+        if maximo is not None and medidor.total > maximo:
+            problemas.append(f'{medidor.total} consultas (presupuesto {maximo})')
+        repetidas = getattr(settings, 'PRESUPUESTO_CONSULTAS_REPETICIONES', REPETICIONES_MAXIMAS)
+        for sql, n in medidor.repetidas(repetidas):
+            problemas.append(f'posible N+1, {n} veces: {sql[:200]}')
+        if not problemas:
+            return
+
+        mensaje = f'{request.method} {request.path} ({url_name}): ' + '; '.join(problemas)
+        logger.warning(mensaje)
+        if getattr(settings, 'PRESUPUESTO_CONSULTAS_ESTRICTO', False):
+            raise PresupuestoConsultasExcedido(mensaje)
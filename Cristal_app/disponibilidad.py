@@ -0,0 +1,142 @@
+# Cristal_app/disponibilidad.py
+"""
+Búsqueda de habitaciones libres por rango de fechas.
+
+Una noche ``d`` va desde ``d`` a la HORA_CHECKOUT hasta el día siguiente a la
+misma hora (hora local del hotel). Para cada noche se guarda en caché el
+conjunto de habitaciones ocupadas por reservas PENDIENTE/ACTIVA; las noches que
+faltan se calculan juntas con una sola consulta sobre el índice parcial
+``reserva_ocupa_rango_idx``. Así búsquedas que se solapan comparten buckets y
+una búsqueda en caché cuesta solo la consulta de habitaciones.
+
+Cada noche tiene su propia versión en caché: una reserva que cambia invalida
+solo las noches de su rango anterior y del nuevo (ver ``signals.py``), no las
+de todo el calendario.
+"""
+import time
+from datetime import datetime, time as dtime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Habitacion, Reserva
+
+HORA_CHECKOUT = getattr(settings, 'HOTEL_HORA_CHECKOUT', 12)
+DISPONIBILIDAD_CACHE_TIMEOUT = getattr(settings, 'DISPONIBILIDAD_CACHE_TIMEOUT', 60 * 60)
+
+# Estados de reserva que bloquean la habitación
+ESTADOS_QUE_OCUPAN = ('PENDIENTE', 'ACTIVA')
+
+_VER_KEY = 'disponibilidad:ver'
+_VER_NOCHE_KEY = 'disponibilidad:ver:{dia}'
+_NOCHE_KEY = 'disponibilidad:{ver}:{dia}:{ver_noche}'
+
+
+def _version():
+    ver = cache.get(_VER_KEY)
+    if ver is None:
+        cache.add(_VER_KEY, time.time_ns(), None)
+        ver = cache.get(_VER_KEY)
+    return ver
+
+
+def _versiones_noches(noches):
+    """``{dia: versión}`` de cada noche; cada una se invalida por separado."""
+    claves = {dia: _VER_NOCHE_KEY.format(dia=dia.isoformat()) for dia in noches}
+    versiones = cache.get_many(claves.values())
+    for clave in set(claves.values()) - versiones.keys():
+        cache.add(clave, time.time_ns(), None)
+        versiones[clave] = cache.get(clave)
+    return {dia: versiones[clave] for dia, clave in claves.items()}
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, time.time_ns(), None)
+
+
+def invalidar():
+    """Descarta todos los buckets al confirmar la transacción."""
+    transaction.on_commit(lambda: _incrementar(_VER_KEY))
+
+
+def invalidar_rangos(rangos):
+    """
+    Descarta al confirmar la transacción solo los buckets de las noches que
+    tocan los rangos ``(fecha_entrada, fecha_salida)`` dados; para una
+    reserva que cambió, su rango anterior y el nuevo.
+    """
+    noches = set()
+    for entrada, salida in rangos:
+        noches.update(_noches(noche_de(entrada), noche_de(salida - timedelta(microseconds=1)) + timedelta(days=1)))
+    claves = [_VER_NOCHE_KEY.format(dia=dia.isoformat()) for dia in sorted(noches)]
+
+    def _incrementar_noches():
+        for clave in claves:
+            _incrementar(clave)
+
+    if claves:
+        transaction.on_commit(_incrementar_noches)
+
+
+def inicio_noche(dia):
+    """Instante en que empieza la noche ``dia`` (aware, zona del hotel)."""
+    return timezone.make_aware(datetime.combine(dia, dtime(HORA_CHECKOUT)))
+
+
+def noche_de(instante):
+    """Día de la noche que contiene ``instante``."""
+    return (timezone.localtime(instante) - timedelta(hours=HORA_CHECKOUT)).date()
+
+
+def _noches(entrada, salida):
+    return [entrada + timedelta(days=i) for i in range((salida - entrada).days)]
+
+
+def _ocupadas_por_noche(noches):
+    """``{dia: set(habitacion_id)}`` para las noches dadas, usando la caché."""
+    ver = _version()
+    versiones = _versiones_noches(noches)
+    claves = {dia: _NOCHE_KEY.format(ver=ver, dia=dia.isoformat(), ver_noche=versiones[dia]) for dia in noches}
+    en_cache = cache.get_many(claves.values())
+    resultado = {dia: en_cache[k] for dia, k in claves.items() if k in en_cache}
+
+    faltan = [dia for dia in noches if dia not in resultado]
+    if faltan:
+        desde, hasta = inicio_noche(faltan[0]), inicio_noche(faltan[-1] + timedelta(days=1))
+        nuevas = {dia: set() for dia in faltan}
+        reservas = (Reserva.objects
+                    .filter(estado__in=ESTADOS_QUE_OCUPAN,
+                            fecha_salida__gt=desde, fecha_entrada__lt=hasta)
+                    .values_list('habitacion_id', 'fecha_entrada', 'fecha_salida'))
+        for habitacion_id, entrada, salida in reservas:
+            dia = max(noche_de(entrada), faltan[0])
+            ultima = min(noche_de(salida - timedelta(microseconds=1)), faltan[-1])
+            while dia <= ultima:
+                if dia in nuevas:
+                    nuevas[dia].add(habitacion_id)
+                dia += timedelta(days=1)
+        cache.set_many({claves[dia]: ids for dia, ids in nuevas.items()}, DISPONIBILIDAD_CACHE_TIMEOUT)
+        resultado.update(nuevas)
+    return resultado
+
+
+def habitaciones_libres(entrada, salida, tipo=None, piso=None):
+    """
+    Habitaciones activas libres todas las noches de ``entrada`` a ``salida``
+    (fechas; ``salida`` es el día de partida). Se puede filtrar por tipo o piso.
+    """
+    if salida <= entrada:
+        return []
+    ocupadas = set().union(*_ocupadas_por_noche(_noches(entrada, salida)).values())
+
+    habitaciones = Habitacion.objects.filter(activo=True).select_related('tipo', 'piso')
+    if tipo is not None:
+        habitaciones = habitaciones.filter(tipo=tipo)
+    if piso is not None:
+        habitaciones = habitaciones.filter(piso=piso)
+    return [h for h in habitaciones.order_by('piso__numero', 'numero') if h.pk not in ocupadas]
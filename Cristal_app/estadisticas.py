@@ -0,0 +1,123 @@
+# Cristal_app/estadisticas.py
+"""
+Acumulados diarios para el tablero.
+
+Check-in, checkout y consumos suman sus deltas en la fila
+``EstadisticaDiaria`` del día con un ``UPDATE ... SET x = x + delta``, así el
+tablero lee una semana con una sola consulta en vez de recorrer ``Reserva``.
+Los ingresos (habitación y productos) se imputan al día de entrada de la
+reserva. ``recalcular()`` reconstruye la tabla desde las reservas.
+
+El UPDATE corre al confirmar la transacción del check-in o consumo, como
+sentencia propia: así ninguna transacción retiene el bloqueo de la fila del
+día y las operaciones del hotel no se serializan en ella. Si el proceso cae
+entre el commit y el UPDATE se pierde ese delta; ``recalcular()`` lo repone.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import EstadisticaDiaria, Habitacion, Reserva
+
+_CERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=12, decimal_places=2))
+# Reservas que pasaron por check-in: las únicas que suma registrar_checkins
+CON_CHECKIN = ('ACTIVA', 'FINALIZADA')
+
+
+def dia(instante):
+    """Día (hora local del hotel) de un instante."""
+    return timezone.localdate(instante)
+
+
+def registrar(fecha, **deltas):
+    """Suma ``deltas`` (campo=cantidad) en la fila de ``fecha`` al confirmar la transacción."""
+    deltas = {campo: valor for campo, valor in deltas.items() if valor}
+    if deltas:
+        # robust: un fallo del acumulado no convierte en error un check-in ya confirmado
+        transaction.on_commit(lambda: _sumar(fecha, deltas), robust=True)
+
+
+def _sumar(fecha, deltas):
+    cambios = {campo: F(campo) + valor for campo, valor in deltas.items()}
+    if not EstadisticaDiaria.objects.filter(fecha=fecha).update(**cambios):
+        # Otra transacción puede crear la fila a la vez: se ignora el
+        # conflicto y se suma sobre la fila que haya quedado.
+        EstadisticaDiaria.objects.bulk_create([EstadisticaDiaria(fecha=fecha)], ignore_conflicts=True)
+        EstadisticaDiaria.objects.filter(fecha=fecha).update(**cambios)
+
+
+def registrar_checkins(reservas):
+    """Check-in de reservas nuevas (ya con costos calculados), agrupadas por día."""
+    por_dia = {}
+    for r in reservas:
+        checkins, ingresos = por_dia.get(dia(r.fecha_entrada), (0, Decimal('0.00')))
+        por_dia[dia(r.fecha_entrada)] = (checkins + 1, ingresos + (r.costo_total or 0) - (r.costo_productos or 0))
+    for fecha, (checkins, ingresos) in por_dia.items():
+        registrar(fecha, checkins=checkins, ingresos_habitaciones=ingresos)
+
+
+def semana(desde, hasta):
+    """``{'reservas', 'ingresos'}`` de ``desde`` a ``hasta`` (inclusive), en una consulta."""
+    return EstadisticaDiaria.objects.filter(fecha__range=[desde, hasta]).aggregate(
+        reservas=Coalesce(Sum('checkins'), 0),
+        ingresos=Coalesce(Sum(F('ingresos_habitaciones') + F('ingresos_productos')), _CERO),
+    )
+
+
+def habitaciones_por_estado():
+    """Conteo en vivo de habitaciones por estado con un solo agregado condicional."""
+    return Habitacion.objects.aggregate(
+        total=Count('pk'),
+        disponibles=Count('pk', filter=Q(estado='DISPONIBLE')),
+        ocupadas=Count('pk', filter=Q(estado='OCUPADA')),
+        limpieza=Count('pk', filter=Q(estado='LIMPIEZA')),
+    )
+
+
+def recalcular(desde=None, hasta=None):
+    """Reconstruye los acumulados del rango (o de todo) a partir de las reservas."""
+    tz = timezone.get_current_timezone()
+    # Las mismas reservas que sumó el camino incremental: una PENDIENTE aún
+    # no hizo check-in y una CANCELADA nunca lo hará
+    reservas = Reserva.objects.filter(estado__in=CON_CHECKIN)
+    filas = {}
+
+    def _fila(fecha):
+        return filas.setdefault(fecha, EstadisticaDiaria(fecha=fecha))
+
+    entradas = (reservas
+                .annotate(dia=TruncDate('fecha_entrada', tzinfo=tz))
+                .values('dia')
+                .annotate(checkins=Count('pk'),
+                          habitaciones=Coalesce(Sum(F('costo_total') - F('costo_productos')), _CERO),
+                          productos=Coalesce(Sum('costo_productos'), _CERO))
+                .order_by())
+    salidas = (reservas.filter(estado='FINALIZADA')
+               .annotate(dia=TruncDate('fecha_salida', tzinfo=tz))
+               .values('dia')
+               .annotate(checkouts=Count('pk'))
+               .order_by())
+    if desde is not None:
+        entradas, salidas = entradas.filter(dia__gte=desde), salidas.filter(dia__gte=desde)
+    if hasta is not None:
+        entradas, salidas = entradas.filter(dia__lte=hasta), salidas.filter(dia__lte=hasta)
+
+    for e in entradas:
+        fila = _fila(e['dia'])
+        fila.checkins, fila.ingresos_habitaciones, fila.ingresos_productos = (
+            e['checkins'], e['habitaciones'], e['productos'])
+    for s in salidas:
+        _fila(s['dia']).checkouts = s['checkouts']
+
+    with transaction.atomic():
+        existentes = EstadisticaDiaria.objects.all()
+        if desde is not None:
+            existentes = existentes.filter(fecha__gte=desde)
+        if hasta is not None:
+            existentes = existentes.filter(fecha__lte=hasta)
+        existentes.delete()
+        EstadisticaDiaria.objects.bulk_create(filas.values())
+    return len(filas)
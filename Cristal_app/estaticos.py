@@ -0,0 +1,212 @@
+# Cristal_app/estaticos.py
+"""
+Pipeline de archivos estáticos.
+
+``static/adminlte`` trae todos los plugins de AdminLTE, pero las plantillas
+usan unos pocos. ``ReferenciadosFinder`` hace que ``collectstatic`` copie
+solo los archivos nombrados en plantillas y en el código de la app (los
+``{% static %}`` y los ``Media`` de los widgets) más lo que esos CSS/JS
+referencian (fuentes, imágenes, source maps); en desarrollo ``find()`` sigue
+encontrando cualquier archivo.
+
+``EstaticosStorage`` agrega el hash del contenido a cada nombre (manifest)
+y deja al lado de cada archivo de texto sus variantes ``.gz`` y, si el
+paquete ``brotli`` está instalado, ``.br``.
+
+``EstaticosMiddleware`` sirve ``STATIC_ROOT`` desde la app cuando no hay un
+servidor web delante: elige la variante comprimida según
+``Accept-Encoding`` (con ``Vary: Accept-Encoding``) y marca los nombres con
+hash como inmutables por un año, así que las visitas siguientes no piden
+ningún estático.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import FileSystemFinder
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.contrib.staticfiles.utils import matches_patterns
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # opcional: sin él solo se generan las variantes gzip
+    brotli = None
+
+# Extensiones que vale la pena comprimir (las imágenes y woff ya lo están)
+COMPRIMIBLES = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.ttf', '.otf', '.eot', '.ico'}
+# Variantes en orden de preferencia: (codificación, extensión)
+VARIANTES = (('br', '.br'), ('gzip', '.gz'))
+# Cabeceras para nombres con hash y para el resto
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_CORTO = 'public, max-age=300'
+
+# Rutas entre comillas que terminan en una extensión de estático
+_RUTA_CITADA = re.compile(r'''["']([\w@.\-/]+\.(?:css|js|png|jpe?g|gif|svg|webp|ico|woff2?|ttf|eot|otf))["']''')
+_URL_CSS = re.compile(r'''url\(\s*["']?([^"')]+?)["']?\s*\)|@import\s+["']([^"']+)["']''')
+_SOURCE_MAP = re.compile(r'sourceMappingURL=([^\s*]+)')
+
+
+# =======================
+# QUÉ SE RECOLECTA
+# =======================
+def _fuentes_de_referencias():
+    """Plantillas y módulos de la app (sin los tests) y de ``TEMPLATES['DIRS']``."""
+    raices = [Path(d) for conf in settings.TEMPLATES for d in conf.get('DIRS', [])]
+    raices.append(Path(__file__).resolve().parent)
+    for raiz in raices:
+        for ruta in raiz.rglob('*'):
+            if ruta.suffix in ('.html', '.txt', '.py', '.js') and ruta.name != 'tests.py' and ruta.is_file():
+                yield ruta
+
+
+def referencias_directas():
+    """Rutas de estáticos nombradas en plantillas y en el código de la app."""
+    rutas = set()
+    for archivo in _fuentes_de_referencias():
+        rutas.update(_RUTA_CITADA.findall(archivo.read_text(encoding='utf-8', errors='ignore')))
+    return rutas
+
+
+def _dependencias(ruta, contenido):
+    """Rutas que referencia un CSS o JS, relativas al directorio de estáticos."""
+    encontradas = list(_SOURCE_MAP.findall(contenido))
+    if ruta.endswith('.css'):
+        encontradas += [url or importada for url, importada in _URL_CSS.findall(contenido)]
+    base = posixpath.dirname(ruta)
+    for url in encontradas:
+        url = url.split('#')[0].split('?')[0].strip()
+        if not url or url.startswith(('data:', 'http:', 'https:', '//', '/')):
+            continue
+        yield posixpath.normpath(posixpath.join(base, url))
+
+
+class ReferenciadosFinder(FileSystemFinder):
+    """``FileSystemFinder`` que solo lista lo que la app usa."""
+
+    def referenciados(self, storage):
+        pendientes = [r for r in referencias_directas() if storage.exists(r)]
+        vistos = set()
+        while pendientes:
+            ruta = pendientes.pop()
+            if ruta in vistos:
+                continue
+            vistos.add(ruta)
+            if ruta.endswith(('.css', '.js')):
+                with storage.open(ruta) as f:
+                    contenido = f.read().decode('utf-8', errors='ignore')
+                pendientes.extend(d for d in _dependencias(ruta, contenido) if storage.exists(d))
+        return vistos
+
+    def list(self, ignore_patterns):
+        for storage in self.storages.values():
+            for ruta in sorted(self.referenciados(storage)):
+                if not matches_patterns(ruta, ignore_patterns):
+                    yield ruta, storage
+
+
+# =======================
+# NOMBRES CON HASH Y COMPRESIÓN
+# =======================
+def _comprimir(contenido):
+    """``{extensión: bytes}`` de las variantes que ahorran al menos un 5%."""
+    variantes = {'.gz': gzip.compress(contenido, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes['.br'] = brotli.compress(contenido, quality=11)
+    return {ext: datos for ext, datos in variantes.items() if len(datos) < len(contenido) * 0.95}
+
+
+class EstaticosStorage(ManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        # Sin manifest (desarrollo, tests) o con un archivo no recolectado se
+        # usa el nombre original en lugar de fallar al renderizar.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        procesados = []
+        for original, procesado, hecho in super().post_process(paths, dry_run, **options):
+            if procesado and not isinstance(procesado, Exception):
+                procesados.append(procesado)
+            yield original, procesado, hecho
+        if dry_run:
+            return
+        for nombre in {*paths, *procesados}:
+            if os.path.splitext(nombre)[1] not in COMPRIMIBLES or not self.exists(nombre):
+                continue
+            with self.open(nombre) as f:
+                contenido = f.read()
+            for ext, datos in _comprimir(contenido).items():
+                if self.exists(nombre + ext):
+                    self.delete(nombre + ext)
+                self._save(nombre + ext, ContentFile(datos))
+
+
+# =======================
+# SERVIR DESDE LA APP
+# =======================
+def _aceptadas(request):
+    return {c.split(';')[0].strip() for c in request.headers.get('Accept-Encoding', '').split(',')}
+
+
+class EstaticosMiddleware:
+    """
+    Sirve ``STATIC_URL`` desde ``STATIC_ROOT`` si ``ESTATICOS_SERVIR`` (por
+    defecto, cuando ``DEBUG`` está apagado). Va primero: no toca la sesión
+    ni la BD.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefijo = '/' + settings.STATIC_URL.lstrip('/')
+        self.activo = getattr(settings, 'ESTATICOS_SERVIR', not settings.DEBUG) and settings.STATIC_ROOT
+        # El manifest se lee al crear el storage; un deploy reinicia los workers
+        self.con_hash = frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if self.activo and request.path.startswith(self.prefijo) and request.method in ('GET', 'HEAD'):
+            return self.servir(request, request.path[len(self.prefijo):])
+        return self.get_response(request)
+
+    def servir(self, request, nombre):
+        try:
+            ruta = Path(safe_join(settings.STATIC_ROOT, nombre))
+        except ValueError:
+            raise Http404(nombre)
+        if not ruta.is_file():
+            raise Http404(nombre)
+
+        comprimible = ruta.suffix in COMPRIMIBLES
+        codificacion, archivo = None, ruta
+        if comprimible:
+            aceptadas = _aceptadas(request)
+            for cod, ext in VARIANTES:
+                variante = ruta.with_name(ruta.name + ext)
+                if cod in aceptadas and variante.is_file():
+                    codificacion, archivo = cod, variante
+                    break
+
+        estado = archivo.stat()
+        if not was_modified_since(request.headers.get('If-Modified-Since'), estado.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            tipo, _ = mimetypes.guess_type(ruta.name)
+            response = FileResponse(archivo.open('rb'), content_type=tipo or 'application/octet-stream')
+            response['Last-Modified'] = http_date(estado.st_mtime)
+            if codificacion:
+                response['Content-Encoding'] = codificacion
+        if comprimible:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = CACHE_INMUTABLE if nombre in self.con_hash else CACHE_CORTO
+        return response
@@ -0,0 +1,286 @@
+# Cristal_app/exportar.py
+"""
+Exportación en streaming a CSV y XLSX.
+
+Cada exportación recorre su consulta con ``.iterator(chunk_size=...)`` (en
+PostgreSQL, un cursor del lado del servidor) y va enviando el archivo por
+partes con ``StreamingHttpResponse``: la memoria usada es la misma para mil
+filas que para dos millones.
+
+El XLSX se arma sin dependencias: un ZIP escrito sobre un destino no
+buscable (``zipfile`` usa entonces descriptores de datos) con una única hoja
+de cadenas en línea, que se vacía hacia la respuesta a medida que crece.
+
+Bajo ASGI la respuesta recibe un iterador asíncrono que pide cada parte al
+generador en el hilo de la petición: Django consume un iterador síncrono
+entero con ``sync_to_async(list)`` antes de enviarlo, y el archivo quedaría
+completo en memoria.
+"""
+import csv
+import re
+import zipfile
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .forms import ClienteFiltroForm, CompraFiltroForm, RangoFechasFiltroForm, VentaFiltroForm
+from .models import Cliente, DetalleCompra, DetalleVenta, Reserva
+
+# Filas que se leen de la BD por vuelta del cursor
+CHUNK = 2000
+# Filas por cada parte enviada al cliente
+FILAS_POR_PARTE = 500
+
+_IMPORTE = DecimalField(max_digits=12, decimal_places=2)
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+Exportacion = namedtuple('Exportacion', 'permiso form_class lookups encabezado filas')
+
+
+# =======================
+# FORMATO DE CELDAS
+# =======================
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(valor, bool):
+        return 'Sí' if valor else 'No'
+    return str(valor)
+
+
+class _Eco:
+    """Pseudo-archivo para ``csv.writer``: devuelve la línea en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _csv(encabezado, filas):
+    writer = csv.writer(_Eco())
+    # El BOM hace que Excel abra el archivo como UTF-8
+    parte = ['\ufeff' + writer.writerow(encabezado)]
+    for fila in filas:
+        parte.append(writer.writerow([_texto(v) for v in fila]))
+        if len(parte) >= FILAS_POR_PARTE:
+            yield ''.join(parte)
+            parte = []
+    yield ''.join(parte)
+
+
+class _Tubo:
+    """Destino de ``ZipFile`` sin ``tell()``: acumula lo escrito hasta vaciarlo."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes.clear()
+        return datos
+
+
+_NS_HOJA = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_NS_PAQ = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_ESTRUCTURA_XLSX = {
+    '[Content_Types].xml': (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        f'<Relationships xmlns="{_NS_PAQ}">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        f'<workbook xmlns="{_NS_HOJA}" xmlns:r="{_NS_REL}">'
+        '<sheets><sheet name="Datos" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        f'<Relationships xmlns="{_NS_PAQ}">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+# Caracteres de control que XML no admite
+_CONTROL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _celda_xlsx(valor):
+    if isinstance(valor, (int, Decimal, float)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_CONTROL.sub('', _texto(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xlsx(fila):
+    return '<row>' + ''.join(_celda_xlsx(v) for v in fila) + '</row>'
+
+
+def _xlsx(encabezado, filas):
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, 'w', zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _ESTRUCTURA_XLSX.items():
+            libro.writestr(nombre, _XML + contenido)
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write(f'{_XML}<worksheet xmlns="{_NS_HOJA}"><sheetData>'.encode())
+            hoja.write(_fila_xlsx(encabezado).encode())
+            for i, fila in enumerate(filas, 1):
+                hoja.write(_fila_xlsx(fila).encode())
+                if i % FILAS_POR_PARTE == 0:
+                    yield tubo.vaciar()
+            hoja.write(b'</sheetData></worksheet>')
+    yield tubo.vaciar()
+
+
+async def _asincrono(partes):
+    """Recorre ``partes`` de a una por vez sin bloquear el event loop."""
+    # thread_sensitive: todas las vueltas corren en el hilo de la petición,
+    # que es el dueño de la conexión y del cursor de la consulta
+    siguiente = sync_to_async(next, thread_sensitive=True)
+    fin = object()
+    try:
+        while (parte := await siguiente(partes, fin)) is not fin:
+            yield parte
+    finally:
+        # si el cliente corta la descarga, el cursor se cierra en su hilo
+        await sync_to_async(partes.close, thread_sensitive=True)()
+
+
+# =======================
+# EXPORTACIONES
+# =======================
+def _ventas(filtros):
+    return (DetalleVenta.objects
+            .filter(**filtros)
+            .annotate(subtotal=ExpressionWrapper(F('cantidad') * F('precio_unitario'), output_field=_IMPORTE))
+            .order_by('venta__fecha_venta', 'venta_id', 'pk')
+            .values_list('venta_id', 'venta__fecha_venta', 'venta__usuario__username',
+                         'venta__cliente__dni', 'venta__cliente__nombrecompleto',
+                         'producto__nombre', 'producto__categoria__nombre',
+                         'cantidad', 'precio_unitario', 'subtotal', 'venta__total_venta')
+            .iterator(chunk_size=CHUNK))
+
+
+def _compras(filtros):
+    return (DetalleCompra.objects
+            .filter(**filtros)
+            .annotate(subtotal=ExpressionWrapper(F('cantidad') * F('costo_unitario'), output_field=_IMPORTE))
+            .order_by('compra__fecha_compra', 'compra_id', 'pk')
+            .values_list('compra_id', 'compra__fecha_compra', 'compra__usuario__username',
+                         'compra__proveedor__nombre', 'producto__nombre', 'producto__categoria__nombre',
+                         'cantidad', 'costo_unitario', 'subtotal', 'compra__total_compra')
+            .iterator(chunk_size=CHUNK))
+
+
+def _reservas(filtros):
+    reservas = (Reserva.objects
+                .filter(**filtros)
+                .select_related('cliente', 'habitacion', 'pago__tipo_pago')
+                .prefetch_related('acompanantes')
+                .order_by('fecha_entrada', 'pk')
+                .iterator(chunk_size=CHUNK))
+    for r in reservas:
+        pago = getattr(r, 'pago', None)
+        yield (
+            r.pk, r.habitacion.numero, r.cliente.dni, r.cliente.nombrecompleto, r.get_estado_display(),
+            r.fecha_entrada, r.fecha_salida, r.descuento_porcentaje,
+            r.costo_habitacion, r.costo_productos, r.costo_total,
+            pago.tipo_pago.nombre if pago and pago.tipo_pago else None,
+            pago.monto_recibido if pago else None,
+            pago.fecha_pago if pago else None,
+            '; '.join(f'{a.nombre_completo} ({a.dni})' for a in r.acompanantes.all()),
+        )
+
+
+def _clientes(filtros):
+    return (Cliente.objects
+            .filter(**filtros)
+            .order_by('pk')
+            .values_list('pk', 'dni', 'nombrecompleto', 'telefono', 'email', 'activo', 'fecha_creacion')
+            .iterator(chunk_size=CHUNK))
+
+
+EXPORTACIONES = {
+    'ventas': Exportacion(
+        'Cristal_app.view_venta', VentaFiltroForm,
+        {'desde': 'venta__fecha_venta__gte', 'hasta': 'venta__fecha_venta__lt', 'usuario': 'venta__usuario'},
+        ['Venta', 'Fecha', 'Usuario', 'DNI cliente', 'Cliente', 'Producto', 'Categoría',
+         'Cantidad', 'Precio unitario', 'Subtotal', 'Total venta'],
+        _ventas,
+    ),
+    'compras': Exportacion(
+        'Cristal_app.view_compra', CompraFiltroForm,
+        {'desde': 'compra__fecha_compra__gte', 'hasta': 'compra__fecha_compra__lt',
+         'proveedor': 'compra__proveedor', 'usuario': 'compra__usuario'},
+        ['Compra', 'Fecha', 'Usuario', 'Proveedor', 'Producto', 'Categoría',
+         'Cantidad', 'Costo unitario', 'Subtotal', 'Total compra'],
+        _compras,
+    ),
+    'reservas': Exportacion(
+        'Cristal_app.view_reserva', RangoFechasFiltroForm,
+        {'desde': 'fecha_entrada__gte', 'hasta': 'fecha_entrada__lt'},
+        ['Reserva', 'Habitación', 'DNI cliente', 'Cliente', 'Estado', 'Entrada', 'Salida', 'Descuento %',
+         'Costo habitación', 'Costo productos', 'Costo total', 'Tipo de pago', 'Monto recibido',
+         'Fecha de pago', 'Acompañantes'],
+        _reservas,
+    ),
+    'clientes': Exportacion(
+        'Cristal_app.view_cliente', ClienteFiltroForm,
+        {'desde': 'fecha_creacion__gte', 'hasta': 'fecha_creacion__lt', 'activo': 'activo'},
+        ['ID', 'DNI', 'Nombre completo', 'Teléfono', 'Email', 'Activo', 'Fecha de creación'],
+        _clientes,
+    ),
+}
+
+
+def filtros(exportacion, datos):
+    """Lookups de la exportación para los datos ya validados de su formulario."""
+    return {
+        lookup: datos[campo]
+        for campo, lookup in exportacion.lookups.items()
+        if datos.get(campo) not in (None, '')
+    }
+
+
+def respuesta(nombre, exportacion, datos, formato='csv', asincrono=False):
+    """
+    ``StreamingHttpResponse`` con la exportación filtrada por ``datos``.
+
+    ``asincrono`` debe ser verdadero cuando la petición llega por ASGI.
+    """
+    filas = exportacion.filas(filtros(exportacion, datos))
+    generador = _xlsx if formato == 'xlsx' else _csv
+    partes = generador(exportacion.encabezado, filas)
+    if asincrono:
+        partes = _asincrono(partes)
+    response = StreamingHttpResponse(partes, content_type=FORMATOS[formato])
+    sello = timezone.localtime().strftime('%Y%m%d-%H%M')
+    response['Content-Disposition'] = f'attachment; filename="{nombre}-{sello}.{formato}"'
+    return response
@@ -1,4 +1,6 @@
 
+from datetime import datetime, time, timedelta
+
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from django.contrib.auth.models import Group, Permission
 from django.contrib.auth import get_user_model
@@ -6,7 +8,11 @@ from django.contrib.auth import get_user_model
 from .models import Compra, DetalleCompra, Venta, DetalleVenta, Producto, Cliente, Proveedor, Categoria
 from django import forms
 from django.forms import inlineformset_factory
-from .models import Reserva, Pago, Acompanante
+from django.urls import reverse_lazy
+from django.utils import timezone
+from .models import Reserva, Pago, Acompanante, TipoHabitacion, Piso, Habitacion, TipoPago
+
+from . import opciones
 
 # Obtiene el modelo de usuario activo
 User = get_user_model()
@@ -62,6 +68,11 @@ class CustomUserChangeForm(UserChangeForm):
         model = User
         fields = ('username', 'email', 'is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Las casillas salen de la lista compartida; la tabla solo se consulta al validar
+        self.fields['user_permissions'].choices = opciones.permisos()
+
 
 class GroupForm(forms.ModelForm):
     """
@@ -101,8 +112,96 @@ class ProductoForm(forms.ModelForm):
         fields = ['nombre', 'categoria', 'precio_venta', 'stock', 'descripcion', 'imagen', 'activo']
 
 
+class ProductoEdicionForm(ProductoForm):
+    """
+    ``ProductoForm`` para editar: ``stock_original`` guarda el stock que se
+    mostró al abrir el formulario. El ajuste es la diferencia contra ese
+    valor, así cambiar solo el precio no repone lo consumido mientras tanto.
+    """
+    stock_original = forms.IntegerField(widget=forms.HiddenInput)
+
+
 # --- FORMULARIOS DE COMPRA Y VENTA ---
 
+_SELECT2_CSS = ("adminlte/plugins/select2/css/select2.min.css",
+                "adminlte/plugins/select2-bootstrap4-theme/select2-bootstrap4.min.css")
+_SELECT2_JS = ("adminlte/plugins/select2/js/select2.full.min.js",
+               "adminlte/plugins/select2/js/i18n/es.js")
+
+
+class ProductoSelect(forms.Select):
+    """
+    Renderiza solo el producto elegido. El catálogo va una sola vez por página
+    (``formset.opciones_productos`` con ``json_script``) y Select2 busca en él
+    desde todas las filas.
+    """
+
+    class Media:
+        css = {"all": _SELECT2_CSS}
+        js = (*_SELECT2_JS, "js/producto_select.js")
+
+    def __init__(self, attrs=None):
+        super().__init__({"class": "form-control producto-select", **(attrs or {})})
+
+    def optgroups(self, name, value, attrs=None):
+        elegidos = {str(v) for v in value if v}
+        opciones_elegidas = [self.create_option(name, "", "", not elegidos, 0)]
+        if elegidos:
+            for i, (pk, nombre) in enumerate((c for c in self.choices if str(c[0]) in elegidos), start=1):
+                opciones_elegidas.append(self.create_option(name, pk, nombre, True, i))
+        return [(None, opciones_elegidas, 0)]
+
+
+class ProductoChoiceField(forms.ModelChoiceField):
+    widget = ProductoSelect
+    # {pk: Producto} que carga el formset para validar todas las filas juntas
+    instancias = None
+
+    def to_python(self, value):
+        if self.instancias is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.instancias[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages["invalid_choice"], code="invalid_choice")
+
+
+class DetalleProductoForm(forms.ModelForm):
+
+    def _get_validation_exclusions(self):
+        exclusiones = super()._get_validation_exclusions()
+        # El formset ya cargó el producto elegido; no volver a consultar la FK
+        if self.fields["producto"].instancias is not None:
+            exclusiones.add("producto")
+        return exclusiones
+
+
+class DetalleProductoFormSet(forms.BaseInlineFormSet):
+    """
+    Las filas comparten las opciones de producto (``opciones.productos()``) y,
+    al validar, los productos elegidos se cargan con una sola consulta.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opciones_productos = opciones.productos()
+        self._productos = self._cargar_productos() if self.is_bound else None
+
+    def _cargar_productos(self):
+        prefijo = f"{self.prefix}-"
+        ids = {
+            int(valor) for clave, valor in self.data.items()
+            if clave.startswith(prefijo) and clave.endswith("-producto") and str(valor).isdigit()
+        }
+        return Producto.objects.in_bulk(ids) if ids else {}
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        campo = form.fields["producto"]
+        campo.choices = self.opciones_productos
+        campo.instancias = self._productos
+
+
 class CompraForm(forms.ModelForm):
     """
     Formulario principal para el modelo Compra.
@@ -115,7 +214,10 @@ class CompraForm(forms.ModelForm):
 DetalleCompraFormSet = inlineformset_factory(
     Compra,
     DetalleCompra,
+    form=DetalleProductoForm,
+    formset=DetalleProductoFormSet,
     fields=('producto', 'cantidad', 'costo_unitario'),
+    field_classes={'producto': ProductoChoiceField},
     extra=1,
     can_delete=True
 )
@@ -135,7 +237,10 @@ class VentaForm(forms.ModelForm):
 DetalleVentaFormSet = inlineformset_factory(
     Venta,
     DetalleVenta,
+    form=DetalleProductoForm,
+    formset=DetalleProductoFormSet,
     fields=('producto', 'cantidad', 'precio_unitario'),
+    field_classes={'producto': ProductoChoiceField},
     extra=1,
     can_delete=True
 )
@@ -152,6 +257,53 @@ class ClienteForm(forms.ModelForm):
         fields = ['dni', 'nombrecompleto', 'telefono', 'email', 'activo']
 _DATETIME_LOCAL_FMT = "%Y-%m-%dT%H:%M"
 
+
+class ClienteAutocompleteSelect(forms.Select):
+    """
+    Select que renderiza solo el cliente elegido; las demás opciones las trae
+    Select2 desde ``cliente_buscar`` mientras se escribe.
+    """
+
+    class Media:
+        css = {"all": ("adminlte/plugins/select2/css/select2.min.css",
+                       "adminlte/plugins/select2-bootstrap4-theme/select2-bootstrap4.min.css")}
+        js = ("adminlte/plugins/select2/js/select2.full.min.js",
+              "adminlte/plugins/select2/js/i18n/es.js",
+              "js/cliente_autocomplete.js")
+
+    def __init__(self, attrs=None):
+        super().__init__({
+            "class": "form-control cliente-autocomplete",
+            "data-url": reverse_lazy("cliente_buscar"),
+            "data-placeholder": "DNI o nombre del cliente",
+            **(attrs or {}),
+        })
+
+    def optgroups(self, name, value, attrs=None):
+        elegidos = [v for v in value if v]
+        opciones = [self.create_option(name, "", "", not elegidos, 0)]
+        if elegidos:
+            field = self.choices.field
+            try:
+                clientes = list(field.queryset.filter(pk__in=elegidos))
+            except (ValueError, TypeError):
+                clientes = []
+            for i, cliente in enumerate(clientes, start=1):
+                opciones.append(self.create_option(name, cliente.pk, field.label_from_instance(cliente), True, i))
+        return [(None, opciones, 0)]
+
+
+class ClienteChoiceField(forms.ModelChoiceField):
+    widget = ClienteAutocompleteSelect
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("queryset", Cliente.objects.filter(activo=True))
+        super().__init__(**kwargs)
+
+    def label_from_instance(self, obj):
+        return f"{obj.dni} - {obj.nombrecompleto}"
+
+
 class ReservaForm(forms.ModelForm):
     # forzamos el widget datetime-local para poder MODIFICAR la salida
     fecha_salida = forms.DateTimeField(
@@ -165,8 +317,8 @@ class ReservaForm(forms.ModelForm):
         model = Reserva
         # incluimos cliente y los campos que quieres editar al ocupar
         fields = ["cliente", "fecha_salida", "descuento_porcentaje", "observaciones"]
+        field_classes = {"cliente": ClienteChoiceField}
         widgets = {
-            "cliente": forms.Select(attrs={"class": "form-control"}),
             "descuento_porcentaje": forms.NumberInput(attrs={"class": "form-control", "step": "0.01", "min": "0"}),
             "observaciones": forms.Textarea(attrs={"class": "form-control", "rows": 2}),
         }
@@ -177,6 +329,80 @@ class ReservaForm(forms.ModelForm):
         self.fields["cliente"].queryset = Cliente.objects.filter(activo=True)
 
 
+class CheckinGrupalForm(forms.Form):
+    """
+    Check-in de un grupo: un cliente titular ocupa varias habitaciones a la vez.
+    Los acompañantes se cargan por habitación, uno por línea como ``DNI, Nombre``.
+    """
+    cliente = ClienteChoiceField()
+    fecha_salida = forms.DateTimeField(
+        widget=forms.DateTimeInput(attrs={"type": "datetime-local", "class": "form-control"}),
+        input_formats=[_DATETIME_LOCAL_FMT],
+        label="Fecha y hora de salida",
+    )
+    descuento_porcentaje = forms.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False,
+        label="Descuento (%)",
+        widget=forms.NumberInput(attrs={"class": "form-control", "step": "0.01", "min": "0"}),
+    )
+    observaciones = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={"class": "form-control", "rows": 2}),
+    )
+    tipo_pago = forms.ModelChoiceField(
+        queryset=TipoPago.objects.all(), required=False, label="Método de pago",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    monto_recibido = forms.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, initial=0,
+        label="Monto recibido por habitación",
+        widget=forms.NumberInput(attrs={"class": "form-control", "step": "0.01", "min": "0"}),
+    )
+    habitaciones = forms.ModelMultipleChoiceField(
+        queryset=Habitacion.objects.none(),
+        widget=forms.CheckboxSelectMultiple,
+    )
+
+    def __init__(self, *args, piso=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        libres = (Habitacion.objects
+                  .filter(activo=True, estado='DISPONIBLE')
+                  .select_related('tipo', 'piso')
+                  .order_by('piso__numero', 'numero'))
+        if piso is not None:
+            libres = libres.filter(piso=piso)
+        self.fields["habitaciones"].queryset = libres
+
+    def filas_habitaciones(self):
+        """``(habitacion, seleccionada, texto_acompanantes)`` para la tabla del template."""
+        seleccionadas = {str(v) for v in (self["habitaciones"].value() or [])}
+        for hab in self.fields["habitaciones"].queryset:
+            yield hab, str(hab.pk) in seleccionadas, self.data.get(f"acompanantes_{hab.pk}", "")
+
+    def acompanantes_de(self, habitacion):
+        """Lista ``[(dni, nombre), ...]`` enviada para la habitación."""
+        texto = self.data.get(f"acompanantes_{habitacion.pk}", "")
+        filas = []
+        for n, linea in enumerate(texto.splitlines(), start=1):
+            if not linea.strip():
+                continue
+            dni, _, nombre = (parte.strip() for parte in linea.partition(","))
+            if not dni or not nombre or len(dni) > 8:
+                raise forms.ValidationError(
+                    f"Habitación {habitacion.numero}, línea {n}: use el formato 'DNI, Nombre' (DNI de hasta 8 caracteres)."
+                )
+            filas.append((dni, nombre[:255]))
+        return filas
+
+    def clean(self):
+        cleaned = super().clean()
+        acompanantes = {}
+        for hab in cleaned.get("habitaciones") or []:
+            acompanantes[hab.pk] = self.acompanantes_de(hab)
+        cleaned["acompanantes"] = acompanantes
+        return cleaned
+
+
 class PagoForm(forms.ModelForm):
     class Meta:
         model = Pago
@@ -203,4 +429,175 @@ AcompananteFormSet = inlineformset_factory(
     form=AcompananteForm,
     extra=1,
     can_delete=True
-)
\ No newline at end of file
+)
+
+
+class DisponibilidadForm(forms.Form):
+    """
+    Filtros de la búsqueda de habitaciones libres por rango de fechas.
+    """
+    entrada = forms.DateField(
+        label="Entrada",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    salida = forms.DateField(
+        label="Salida",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    tipo = forms.ModelChoiceField(
+        queryset=TipoHabitacion.objects.filter(activo=True),
+        required=False,
+        empty_label="Todos",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    piso = forms.ModelChoiceField(
+        queryset=Piso.objects.filter(activo=True).order_by('numero'),
+        required=False,
+        empty_label="Todos",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
+    # Cada noche del rango es un bucket de caché y una fila del cálculo
+    MAX_NOCHES = 90
+
+    def clean(self):
+        cleaned = super().clean()
+        entrada, salida = cleaned.get("entrada"), cleaned.get("salida")
+        if entrada and salida:
+            if salida <= entrada:
+                raise forms.ValidationError("La salida debe ser posterior a la entrada.")
+            if (salida - entrada).days > self.MAX_NOCHES:
+                raise forms.ValidationError(f"El rango no puede superar las {self.MAX_NOCHES} noches.")
+        return cleaned
+
+
+# --- FILTROS DE LISTADOS ---
+
+def _select(**attrs):
+    return forms.Select(attrs={"class": "form-control form-control-sm", **attrs})
+
+
+class FiltroActivoSelect(forms.NullBooleanSelect):
+    def __init__(self, attrs=None):
+        super().__init__({"class": "form-control form-control-sm", **(attrs or {})})
+        self.choices = [("unknown", "Todos"), ("true", "Sí"), ("false", "No")]
+
+
+class FiltroActivoField(forms.NullBooleanField):
+    """Sí / No / Todos; "Todos" no filtra."""
+    widget = FiltroActivoSelect
+
+
+class RangoFechasFiltroForm(forms.Form):
+    """
+    Rango de fechas inclusivo. ``clean`` lo convierte a instantes con zona
+    horaria (``desde`` al inicio del día, ``hasta`` al inicio del siguiente)
+    para filtrar con ``__gte`` / ``__lt`` sobre el índice de la fecha.
+    """
+    desde = forms.DateField(
+        label="Desde", required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control form-control-sm"}),
+    )
+    hasta = forms.DateField(
+        label="Hasta", required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control form-control-sm"}),
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get("desde"):
+            cleaned["desde"] = timezone.make_aware(datetime.combine(cleaned["desde"], time.min))
+        if cleaned.get("hasta"):
+            cleaned["hasta"] = timezone.make_aware(datetime.combine(cleaned["hasta"] + timedelta(days=1), time.min))
+        return cleaned
+
+
+class VentaFiltroForm(RangoFechasFiltroForm):
+    usuario = forms.ModelChoiceField(
+        queryset=User.objects.order_by('username'), required=False,
+        empty_label="Todos los usuarios", widget=_select(),
+    )
+
+
+class CompraFiltroForm(RangoFechasFiltroForm):
+    proveedor = forms.ModelChoiceField(
+        queryset=Proveedor.objects.order_by('nombre'), required=False,
+        empty_label="Todos los proveedores", widget=_select(),
+    )
+    usuario = forms.ModelChoiceField(
+        queryset=User.objects.order_by('username'), required=False,
+        empty_label="Todos los usuarios", widget=_select(),
+    )
+
+
+class ClienteFiltroForm(RangoFechasFiltroForm):
+    activo = FiltroActivoField(label="Activo", required=False)
+
+
+class ProductoFiltroForm(forms.Form):
+    categoria = forms.ModelChoiceField(
+        queryset=Categoria.objects.order_by('nombre'), required=False,
+        empty_label="Todas las categorías", widget=_select(),
+    )
+    activo = FiltroActivoField(label="Activo", required=False)
+
+
+class UserFiltroForm(forms.Form):
+    grupo = forms.ModelChoiceField(
+        queryset=Group.objects.order_by('name'), required=False,
+        empty_label="Todos los roles", widget=_select(),
+    )
+    activo = FiltroActivoField(label="Activo", required=False)
+
+
+# --- REPORTES ---
+
+class ReporteForm(forms.Form):
+    """Rango y periodo de los reportes; sin datos muestra los últimos 30 días por día."""
+    desde = forms.DateField(
+        label="Desde",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control form-control-sm"}),
+    )
+    hasta = forms.DateField(
+        label="Hasta",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control form-control-sm"}),
+    )
+    periodo = forms.ChoiceField(
+        label="Periodo", choices=[("dia", "Día"), ("semana", "Semana"), ("mes", "Mes")],
+        initial="dia", widget=_select(),
+    )
+    agrupar = forms.ChoiceField(
+        label="Agrupar por", required=False,
+        choices=[("", "Sin agrupar"), ("tipo", "Tipo de habitación"), ("piso", "Piso")],
+        widget=_select(),
+    )
+
+    # Límite del rango para que un reporte diario no genere miles de filas
+    MAX_DIAS = 731
+
+    def __init__(self, data=None, *args, **kwargs):
+        if not data:
+            hoy = timezone.localdate()
+            data = {"desde": hoy - timedelta(days=29), "hasta": hoy, "periodo": "dia"}
+        super().__init__(data, *args, **kwargs)
+
+    def clean(self):
+        cleaned = super().clean()
+        desde, hasta = cleaned.get("desde"), cleaned.get("hasta")
+        if desde and hasta:
+            if hasta < desde:
+                raise forms.ValidationError("La fecha final debe ser posterior a la inicial.")
+            if (hasta - desde).days >= self.MAX_DIAS:
+                raise forms.ValidationError(f"El rango no puede superar los {self.MAX_DIAS} días.")
+        return cleaned
+
+
+# --- IMPORTACIÓN ---
+
+class ImportarForm(forms.Form):
+    archivo = forms.FileField(
+        label="Archivo CSV",
+        help_text="UTF-8 con encabezado; las columnas se llaman como los campos.",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control-file", "accept": ".csv,text/csv"}),
+    )
+
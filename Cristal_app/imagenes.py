@@ -0,0 +1,124 @@
+# Cristal_app/imagenes.py
+"""
+Miniaturas y variantes WebP de ``Producto.imagen``.
+
+El original queda como se subió; las plantillas muestran derivadas de ancho
+fijo (``ANCHOS``) en WebP y, para navegadores sin WebP, en JPEG. Se nombran
+por el contenido del original (``Producto.imagen_huella``, un sha256), así
+que una URL nunca cambia de contenido y se puede cachear para siempre; cambiar
+la foto cambia la huella y con ella todas las URLs.
+
+Las derivadas se generan al subir la imagen (``signals.py``), con
+``manage.py regenerar_imagenes`` para las existentes o, si faltan al
+renderizar, la primera vez que se piden (``views.producto_imagen``).
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+# Anchos en píxeles de las miniaturas
+ANCHOS = (64, 128, 320)
+# formato: (extensión, opciones de Pillow)
+FORMATOS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 6}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# Subirla cambia el nombre de todas las derivadas (p. ej. al cambiar calidades)
+VERSION = 1
+DIRECTORIO = 'productos/derivadas'
+
+logger = logging.getLogger('Cristal_app.imagenes')
+
+
+def huella(archivo):
+    """sha256 del contenido de ``archivo`` (cualquier ``File`` de Django)."""
+    digest = hashlib.sha256()
+    for bloque in archivo.chunks():
+        digest.update(bloque)
+    return digest.hexdigest()
+
+
+def nombre_derivada(huella_original, ancho, formato):
+    extension = FORMATOS[formato][0]
+    return f'{DIRECTORIO}/v{VERSION}/{huella_original[:2]}/{huella_original}-{ancho}.{extension}'
+
+
+def _miniatura(original, ancho, formato):
+    imagen = original.copy()
+    imagen.thumbnail((ancho, ancho * 4), Image.Resampling.LANCZOS)
+    if formato == 'jpeg' and imagen.mode != 'RGB':
+        # JPEG no tiene transparencia: se aplana sobre blanco
+        fondo = Image.new('RGB', imagen.size, 'white')
+        fondo.paste(imagen, mask=imagen.getchannel('A') if 'A' in imagen.getbands() else None)
+        imagen = fondo
+    salida = io.BytesIO()
+    imagen.save(salida, **FORMATOS[formato][1])
+    return salida.getvalue()
+
+
+def _marca(huella_original):
+    # La última derivada que se escribe: si existe, existen todas
+    return nombre_derivada(huella_original, ANCHOS[-1], list(FORMATOS)[-1])
+
+
+def generadas(huella_original):
+    return default_storage.exists(_marca(huella_original))
+
+
+def generar(producto, forzar=False, derivadas=None):
+    """
+    Escribe las derivadas que falten de la imagen de ``producto``. Devuelve
+    cuántas. ``derivadas`` limita a esos pares ``(ancho, formato)``; por
+    defecto son todas y, si la marca existe, no se revisa cada archivo.
+    """
+    if not producto.imagen or not producto.imagen_huella:
+        return 0
+    if derivadas is None:
+        if not forzar and generadas(producto.imagen_huella):
+            return 0
+        derivadas = [(ancho, formato) for ancho in ANCHOS for formato in FORMATOS]
+    nombres = [(ancho, formato, nombre_derivada(producto.imagen_huella, ancho, formato))
+               for ancho, formato in derivadas]
+    if not forzar:
+        nombres = [(a, f, nombre) for a, f, nombre in nombres if not default_storage.exists(nombre)]
+        if not nombres:
+            return 0
+    with producto.imagen.open('rb') as archivo:
+        original = Image.open(archivo)
+        original.load()
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info or 'A' in original.getbands() else 'RGB')
+
+    for ancho, formato, nombre in nombres:
+        if forzar and default_storage.exists(nombre):
+            default_storage.delete(nombre)
+        default_storage.save(nombre, ContentFile(_miniatura(original, ancho, formato)))
+    return len(nombres)
+
+
+def generar_o_registrar(producto, derivadas=None):
+    """``generar`` para después de guardar: un archivo ilegible no rompe el guardado."""
+    try:
+        return generar(producto, derivadas=derivadas)
+    except OSError:
+        # Quedan para la vista perezosa o para regenerar_imagenes
+        logger.exception('No se pudieron generar las miniaturas del producto %s', producto.pk)
+        return 0
+
+
+def url(huella_original, ancho, formato, existen):
+    """URL de una miniatura: el archivo si ya existe, si no la vista que la genera."""
+    if existen:
+        return default_storage.url(nombre_derivada(huella_original, ancho, formato))
+    return reverse('producto_imagen', kwargs={'huella': huella_original, 'ancho': ancho, 'formato': formato})
+
+
+def srcset(producto, formato, existen):
+    """``srcset`` de las miniaturas de ``producto`` en ``formato``."""
+    return ', '.join(f'{url(producto.imagen_huella, a, formato, existen)} {a}w' for a in ANCHOS)
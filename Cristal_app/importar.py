@@ -0,0 +1,231 @@
+# Cristal_app/importar.py
+"""
+Importación masiva de clientes, proveedores y productos desde CSV.
+
+Cada fila se valida con el formulario del modelo (las mismas reglas que la
+pantalla de alta), pero la unicidad se resuelve por lote: una consulta
+``clave__in`` trae los registros existentes del lote, los nuevos se insertan
+con ``bulk_create`` y los existentes se actualizan con ``bulk_update``. Así
+el costo es de unas pocas consultas cada ``LOTE`` filas en lugar de varias
+por fila. Si en la BD ya hay varios registros con la misma clave (el nombre
+no es único en proveedores ni productos) la fila se rechaza.
+
+Las filas inválidas no detienen la importación: se acumulan con su número de
+línea y el motivo en ``Resultado.errores`` para el reporte.
+"""
+import csv
+from collections import defaultdict, namedtuple
+
+from django import forms
+from django.db import transaction
+
+from . import inventario, opciones, recepcion
+from .forms import ClienteForm, ProveedorForm
+from .models import Categoria, Cliente, Producto, Proveedor
+
+# Filas validadas y guardadas por transacción
+LOTE = 1000
+
+_FALSO = {'0', 'false', 'falso', 'no', 'n'}
+
+
+class _UnicidadPorLote:
+    """Omite ``validate_unique``: la clave se resuelve contra la BD por lote."""
+
+    def validate_unique(self):
+        pass
+
+
+class ClienteImportForm(_UnicidadPorLote, ClienteForm):
+    pass
+
+
+class ProveedorImportForm(_UnicidadPorLote, ProveedorForm):
+    pass
+
+
+class ProductoImportForm(_UnicidadPorLote, forms.ModelForm):
+    # Por nombre en el archivo; las que no existen se crean
+    categoria = forms.CharField(max_length=100)
+    # Stock real deseado; la diferencia entra como ajuste en el libro
+    stock = forms.IntegerField(required=False, min_value=0)
+
+    class Meta:
+        model = Producto
+        fields = ['nombre', 'precio_venta', 'descripcion', 'activo']
+
+
+def _categorias_por_nombre(validas):
+    """Fija ``categoria_id`` de cada fila, creando las categorías que falten."""
+    nombres = {datos['categoria'] for _, datos in validas}
+    ids = dict(Categoria.objects.filter(nombre__in=nombres).values_list('nombre', 'pk'))
+    nuevas = [Categoria(nombre=n) for n in sorted(nombres - ids.keys())]
+    Categoria.objects.bulk_create(nuevas)
+    ids.update((c.nombre, c.pk) for c in nuevas)
+    for _, datos in validas:
+        datos['categoria_id'] = ids[datos['categoria']]
+
+
+def _clientes_guardados(guardados, usuario):
+    # bulk_update no dispara post_save: un cliente editado puede estar en el tablero
+    recepcion.invalidar_todo()
+
+
+def _productos_guardados(guardados, usuario):
+    # bulk_create/bulk_update no disparan las señales que invalidan las cachés
+    recepcion.invalidar_catalogo()
+    opciones.invalidar()
+    _ajustar_stock(guardados, usuario)
+
+
+def _ajustar_stock(guardados, usuario):
+    """Lleva el stock real al valor del archivo con movimientos de ajuste."""
+    con_stock = [(obj.pk, datos['stock']) for obj, datos in guardados if datos.get('stock') is not None]
+    if not con_stock:
+        return
+    actual = dict(Producto.objects.con_stock_actual()
+                  .filter(pk__in=[pk for pk, _ in con_stock])
+                  .values_list('pk', 'stock_actual'))
+    inventario.registrar([(pk, stock - actual[pk]) for pk, stock in con_stock], 'AJUSTE', usuario=usuario)
+
+
+Importacion = namedtuple(
+    'Importacion', 'modelo form_class clave permiso campos_extra preparar despues',
+    defaults=((), None, None),
+)
+
+IMPORTACIONES = {
+    'clientes': Importacion(
+        Cliente, ClienteImportForm, 'dni', 'Cristal_app.add_cliente', despues=_clientes_guardados,
+    ),
+    'proveedores': Importacion(Proveedor, ProveedorImportForm, 'nombre', 'Cristal_app.add_proveedor'),
+    'productos': Importacion(
+        Producto, ProductoImportForm, 'nombre', 'Cristal_app.add_producto',
+        campos_extra=('categoria_id',), preparar=_categorias_por_nombre, despues=_productos_guardados,
+    ),
+}
+
+
+class Resultado:
+
+    def __init__(self, columnas=()):
+        self.columnas = list(columnas)
+        self.creados = 0
+        self.actualizados = 0
+        # (número de línea, valores de la fila, motivo)
+        self.errores = []
+
+    def escribir_reporte(self, destino):
+        """Escribe en ``destino`` un CSV con cada fila rechazada y su motivo."""
+        writer = csv.writer(destino)
+        writer.writerow(['linea', 'error', *self.columnas])
+        for linea, datos, motivo in self.errores:
+            writer.writerow([linea, motivo, *(datos.get(c, '') for c in self.columnas)])
+
+
+def _normalizar(datos):
+    # Un BooleanField de formulario toma cualquier texto no vacío como True
+    datos = dict(datos)
+    activo = datos.get('activo', '').lower()
+    datos['activo'] = 'on' if not activo or activo not in _FALSO else ''
+    return datos
+
+
+def _motivo(errores):
+    return '; '.join(
+        f"{'fila' if campo == '__all__' else campo}: {mensaje}"
+        for campo, mensajes in errores.items() for mensaje in mensajes
+    )
+
+
+def _guardar_lote(imp, campos, pendientes, vistas, resultado, usuario):
+    validas, originales = [], {}
+    for linea, datos in pendientes:
+        form = imp.form_class(_normalizar(datos))
+        if not form.is_valid():
+            resultado.errores.append((linea, datos, _motivo(form.errors)))
+            continue
+        clave = form.cleaned_data[imp.clave]
+        if clave in vistas:
+            resultado.errores.append((linea, datos, f'{imp.clave}: repetido en el archivo'))
+            continue
+        vistas.add(clave)
+        validas.append((linea, form.cleaned_data))
+        originales[linea] = datos
+    if not validas:
+        return
+
+    with transaction.atomic():
+        existentes = defaultdict(list)
+        for obj in imp.modelo.objects.filter(**{f'{imp.clave}__in': [d[imp.clave] for _, d in validas]}):
+            existentes[getattr(obj, imp.clave)].append(obj)
+        # El nombre no es único en proveedores ni productos: si ya hay varios
+        # registros con esa clave no se sabe cuál actualizar y la fila se rechaza.
+        ambiguas = {clave for clave, objs in existentes.items() if len(objs) > 1}
+        for linea, datos in validas:
+            if datos[imp.clave] in ambiguas:
+                resultado.errores.append((linea, originales[linea],
+                                          f'{imp.clave}: hay varios registros con este valor'))
+        validas = [(linea, datos) for linea, datos in validas if datos[imp.clave] not in ambiguas]
+        if not validas:
+            return
+        if imp.preparar:
+            imp.preparar(validas)
+        nuevos, cambiados = [], []
+        for _, datos in validas:
+            obj = (existentes.get(datos[imp.clave]) or [None])[0]
+            valores = {c: datos[c] for c in campos}
+            if obj is None:
+                nuevos.append((imp.modelo(**valores), datos))
+            else:
+                for campo, valor in valores.items():
+                    setattr(obj, campo, valor)
+                cambiados.append((obj, datos))
+        imp.modelo.objects.bulk_create([obj for obj, _ in nuevos])
+        actualizables = [c for c in campos if c != imp.clave]
+        if cambiados and actualizables:
+            imp.modelo.objects.bulk_update([obj for obj, _ in cambiados], actualizables)
+        if imp.despues:
+            imp.despues(nuevos + cambiados, usuario)
+    resultado.creados += len(nuevos)
+    resultado.actualizados += len(cambiados)
+
+
+def importar(recurso, archivo, usuario=None, lote=LOTE):
+    """
+    Importa el CSV de texto ``archivo`` (con encabezado) en ``recurso``.
+
+    Las columnas se llaman como los campos del formulario; las que faltan no
+    se tocan en los registros existentes. Devuelve un ``Resultado``.
+    """
+    imp = IMPORTACIONES[recurso]
+    muestra = archivo.read(4096)
+    archivo.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.DictReader(archivo, dialect=dialecto)
+    columnas = [(c or '').strip().lower() for c in lector.fieldnames or []]
+    lector.fieldnames = columnas
+    resultado = Resultado(columnas)
+
+    obligatorias = [n for n, f in imp.form_class.base_fields.items() if f.required]
+    faltan = [c for c in obligatorias if c not in columnas]
+    if faltan:
+        resultado.errores.append((1, {}, f"faltan columnas: {', '.join(faltan)}"))
+        return resultado
+    campos = [c for c in imp.form_class._meta.fields if c in columnas] + list(imp.campos_extra)
+
+    vistas, pendientes = set(), []
+    for linea, fila in enumerate(lector, start=2):
+        datos = {c: (fila.get(c) or '').strip() for c in columnas if c}
+        if not any(datos.values()):
+            continue
+        pendientes.append((linea, datos))
+        if len(pendientes) >= lote:
+            _guardar_lote(imp, campos, pendientes, vistas, resultado, usuario)
+            pendientes = []
+    if pendientes:
+        _guardar_lote(imp, campos, pendientes, vistas, resultado, usuario)
+    return resultado
@@ -0,0 +1,145 @@
+# Cristal_app/indices.py
+"""
+Índices de las consultas calientes y su comprobación con EXPLAIN.
+
+Cada entrada de ``CONSULTAS`` es una consulta con la misma forma que la que
+hace la app (mismos filtros y orden) y los índices que la resuelven bien: el
+de ``models.py`` pensado para ella y, si los hay, otros igual de buenos (por
+nombre o por columnas iniciales, p. ej. el de una clave foránea).
+``verificar()`` pide el plan a la base de datos y mira si nombra alguno;
+``manage.py verificar_indices`` lo hace sobre la base real. En
+PostgreSQL el EXPLAIN corre con ``enable_seqscan`` apagado: con tablas
+chicas o recién migradas recorrerlas enteras es lo más barato, y lo que se
+comprueba es que el índice sirve para la consulta, no el tamaño de la tabla.
+
+Sin índice propio a propósito:
+
+- ``Habitacion (piso, activo)``: el tablero de recepción filtra por piso con
+  el índice de la clave foránea; un parcial sobre ``activo`` lo duplicaba.
+- ``Habitacion.estado``: el tablero agrupa toda la tabla y el formulario de
+  reserva ya filtra por piso.
+- ``Producto (activo, stock > 0)``: ``stock`` es solo el snapshot; el stock
+  real suma los movimientos pendientes (``con_stock_actual``) y un índice
+  parcial sobre el snapshot dejaría fuera productos repuestos. El catálogo
+  usa ``producto_activo_nombre_idx`` y filtra el stock sobre esas filas.
+- ``Reserva (habitacion, estado='ACTIVA')``: lo cubre la restricción única
+  parcial ``reserva_activa_unica``.
+- ``DetalleVenta.venta`` y ``DetalleCompra.compra``: las claves foráneas ya
+  tienen índice.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import estadisticas
+from .models import Habitacion, Piso, Producto, Reserva
+
+# indices: los que sirven, cada uno por nombre o como tupla de columnas iniciales;
+# consulta: recibe un ``Piso`` y devuelve el queryset; motores: ``connection.vendor``
+# donde se puede comprobar (None: todos)
+Consulta = namedtuple('Consulta', 'descripcion indices consulta motores', defaults=(None,))
+
+# SQLite recibe la zona horaria de TruncDate como parámetro y no reconoce la
+# expresión del índice; PostgreSQL la recibe literal (psycopg interpola en
+# el cliente) y sí.
+_SOLO_POSTGRESQL = ('postgresql',)
+
+
+def _rango():
+    hasta = timezone.now()
+    return hasta - timedelta(days=30), hasta
+
+
+def _dias_entrada(piso):
+    desde, hasta = _rango()
+    return (Reserva.objects.filter(estado__in=estadisticas.CON_CHECKIN)
+            .annotate(dia=TruncDate('fecha_entrada', tzinfo=timezone.get_current_timezone()))
+            .filter(dia__gte=desde.date(), dia__lte=hasta.date())
+            .values('dia'))
+
+
+def _dias_salida(piso):
+    desde, hasta = _rango()
+    return (Reserva.objects.filter(estado='FINALIZADA')
+            .annotate(dia=TruncDate('fecha_salida', tzinfo=timezone.get_current_timezone()))
+            .filter(dia__gte=desde.date(), dia__lte=hasta.date())
+            .values('dia'))
+
+
+CONSULTAS = {
+    'recepcion_cambios': Consulta(
+        # Las tablets piden desde una versión reciente: cambiaron pocas filas.
+        # Con pocas habitaciones por piso (o sin estadísticas) el planificador
+        # prefiere el índice de la clave foránea; también acota al piso.
+        "Habitaciones del piso cambiadas desde una versión", ('habitacion_piso_version_idx', ('piso_id',)),
+        lambda piso: Habitacion.objects.filter(piso_id=piso.pk, version__gt=max(piso.version - 1, 0)),
+    ),
+    'exportar_reservas': Consulta(
+        "Reservas por rango de entrada (exportar, reportes)", ('reserva_entrada_id_idx',),
+        lambda piso: Reserva.objects.filter(fecha_entrada__gte=_rango()[0], fecha_entrada__lt=_rango()[1])
+        .order_by('fecha_entrada', 'pk'),
+    ),
+    'estadisticas_entradas': Consulta(
+        "Entradas por día (estadisticas.recalcular)", ('reserva_dia_entrada_idx',), _dias_entrada,
+        _SOLO_POSTGRESQL,
+    ),
+    'estadisticas_salidas': Consulta(
+        "Salidas por día (estadisticas.recalcular)", ('reserva_dia_salida_idx',), _dias_salida,
+        _SOLO_POSTGRESQL,
+    ),
+    'catalogo': Consulta(
+        "Catálogo de consumos (recepción)", ('producto_activo_nombre_idx',),
+        lambda piso: Producto.objects.filter(activo=True).order_by('nombre').values('id', 'nombre'),
+    ),
+}
+
+
+def aplicables():
+    """Las entradas de ``CONSULTAS`` que se pueden comprobar en esta base de datos."""
+    return {nombre: c for nombre, c in CONSULTAS.items()
+            if c.motores is None or connection.vendor in c.motores}
+
+
+def _nombres(consulta, tabla):
+    """Nombres de los índices de ``consulta.indices``, resolviendo las columnas con introspección."""
+    nombres = {i for i in consulta.indices if isinstance(i, str)}
+    columnas = [list(i) for i in consulta.indices if not isinstance(i, str)]
+    if columnas:
+        with connection.cursor() as cursor:
+            restricciones = connection.introspection.get_constraints(cursor, tabla)
+        nombres.update(nombre for nombre, r in restricciones.items()
+                       if r['index'] and any(r['columns'][:len(c)] == c for c in columnas))
+    return nombres
+
+
+def verificar(piso=None):
+    """
+    ``{nombre: (consulta, indice_usado, plan)}`` de cada consulta aplicable;
+    ``indice_usado`` es None si el plan no usa ninguno de los aceptables.
+    ``piso`` es el id del piso para las consultas de recepción (por defecto
+    el primero; en una base vacía, uno inexistente).
+    """
+    pisos = Piso.objects.only('id', 'version').order_by('pk')
+    piso = (pisos.filter(pk=piso) if piso is not None else pisos).first() or Piso(pk=0, version=0)
+    resultados = {}
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for nombre, consulta in aplicables().items():
+            queryset = consulta.consulta(piso)
+            texto = queryset.explain()
+            usado = next((n for n in sorted(_nombres(consulta, queryset.model._meta.db_table)) if n in texto), None)
+            resultados[nombre] = (consulta, usado, texto)
+    return resultados
+
+
+def analizar():
+    """Actualiza las estadísticas del planificador de las tablas indexadas."""
+    tablas = [m._meta.db_table for m in (Habitacion, Producto, Reserva)]
+    with connection.cursor() as cursor:
+        for tabla in tablas:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(tabla)}')
@@ -0,0 +1,95 @@
+# Cristal_app/inventario.py
+"""
+Libro de movimientos de stock.
+
+Compras, ventas, consumos y ajustes no modifican ``Producto.stock``: insertan
+filas en ``MovimientoStock``. Así varias ventas del mismo producto no compiten
+por su fila y cada cambio de stock queda auditado.
+
+``Producto.stock`` pasa a ser un snapshot: la compactación periódica
+(``manage.py compactar_stock``) suma en él los movimientos pendientes y los
+marca como compactados. El stock real siempre es snapshot + pendientes
+(``Producto.objects.con_stock_actual()``).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, When
+
+from . import recepcion
+from .models import MovimientoStock, Producto
+
+# Movimientos que se compactan por transacción
+COMPACTAR_LOTE = 5000
+
+
+def registrar(movimientos, origen, documento_id=None, usuario=None):
+    """
+    Inserta los movimientos ``(producto_id, cantidad)`` con un solo INSERT,
+    uno por producto con su cantidad neta. Los netos nulos se omiten.
+    Devuelve cuántos se registraron.
+    """
+    neto = defaultdict(int)
+    for producto_id, cantidad in movimientos:
+        neto[producto_id] += cantidad
+    filas = [
+        MovimientoStock(producto_id=producto_id, cantidad=cantidad, origen=origen,
+                        documento_id=documento_id, usuario=usuario)
+        for producto_id, cantidad in neto.items() if cantidad
+    ]
+    if filas:
+        MovimientoStock.objects.bulk_create(filas)
+        recepcion.invalidar_catalogo()
+    return len(filas)
+
+
+def diferencia(antes, despues):
+    """Movimientos netos que llevan de ``antes`` a ``despues`` (``{producto_id: cantidad}``)."""
+    return [(pid, despues.get(pid, 0) - antes.get(pid, 0)) for pid in antes.keys() | despues.keys()]
+
+
+def stock_actual(producto_id):
+    """Stock real de un producto (snapshot + movimientos pendientes)."""
+    return (Producto.objects.con_stock_actual()
+            .filter(pk=producto_id)
+            .values_list('stock_actual', flat=True)
+            .get())
+
+
+def _compactar_lote(lote):
+    with transaction.atomic():
+        # Solo se pliegan filas ya confirmadas y bloqueadas por nosotros: un
+        # movimiento insertado mientras tanto queda pendiente para la próxima.
+        pendientes = list(
+            MovimientoStock.objects
+            .select_for_update()
+            .filter(compactado=False)
+            .order_by('pk')
+            .values_list('pk', 'producto_id', 'cantidad')[:lote]
+        )
+        if not pendientes:
+            return 0
+        neto = defaultdict(int)
+        for _, producto_id, cantidad in pendientes:
+            neto[producto_id] += cantidad
+        neto = {pid: c for pid, c in neto.items() if c}
+        if neto:
+            Producto.objects.filter(pk__in=neto).update(stock=Case(
+                *[When(pk=pid, then=F('stock') + c) for pid, c in neto.items()],
+                default=F('stock'),
+            ))
+        MovimientoStock.objects.filter(pk__in=[pk for pk, _, _ in pendientes]).update(compactado=True)
+    return len(pendientes)
+
+
+def compactar(lote=COMPACTAR_LOTE):
+    """
+    Suma los movimientos pendientes en ``Producto.stock``, de a ``lote`` por
+    transacción. El stock real no cambia. Devuelve cuántos se compactaron.
+    """
+    total = 0
+    while True:
+        n = _compactar_lote(lote)
+        total += n
+        if n < lote:
+            return total
@@ -0,0 +1,64 @@
+# Cristal_app/layout.py
+"""
+Caché de fragmentos del layout AdminLTE (``base_adminlte.html``).
+
+La barra superior y el menú lateral solo dependen de qué puede ver el
+usuario, así que se guardan con ``{% cache %}`` una vez por rol: la clave
+lleva una huella del conjunto de permisos (que sale de la caché de
+``permisos.py``) y la versión del layout. Los usuarios con los mismos
+permisos comparten el fragmento; cambiar los permisos de alguien le cambia
+la huella y no hay que invalidar nada.
+
+``invalidar()`` descarta todos los fragmentos cuando cambia el contenido del
+layout en sí; ``signals.py`` la llama después de cada ``migrate`` (deploy).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+_VERSION_KEY = 'layout:ver'
+
+
+def _version():
+    ver = cache.get(_VERSION_KEY)
+    if ver is None:
+        cache.add(_VERSION_KEY, time.time_ns(), None)
+        ver = cache.get(_VERSION_KEY)
+    return ver
+
+
+def rol(user):
+    """Huella de lo que ``user`` puede ver en el layout."""
+    if not user.is_authenticated or not user.is_active:
+        return 'anonimo'
+    if user.is_superuser:
+        return 'superusuario'
+    permisos = ','.join(sorted(user.get_all_permissions()))
+    return hashlib.md5(permisos.encode(), usedforsecurity=False).hexdigest()
+
+
+def contexto(request):
+    """Context processor: ``layout.rol``, ``layout.version`` y ``layout.timeout``."""
+    def _datos():
+        return {
+            'rol': rol(request.user),
+            'version': _version(),
+            'timeout': getattr(settings, 'LAYOUT_CACHE_TIMEOUT', 60 * 60 * 24),
+        }
+    # Solo se calcula si la plantilla usa el layout
+    return {'layout': SimpleLazyObject(_datos)}
+
+
+def invalidar():
+    """Pasa a una versión nueva al confirmar la transacción."""
+    def _incrementar():
+        try:
+            cache.incr(_VERSION_KEY)
+        except ValueError:
+            cache.set(_VERSION_KEY, time.time_ns(), None)
+
+    transaction.on_commit(_incrementar)
@@ -0,0 +1,158 @@
+# Cristal_app/listados.py
+"""
+Listados paginados por clave (keyset) con orden y filtros en el servidor.
+
+En lugar de ``OFFSET`` cada página continúa desde la última fila de la
+anterior: ``?despues=<cursor>`` guarda el valor de la columna de orden y el pk
+de esa fila, y la consulta pide ``(columna, pk) > cursor`` con ``LIMIT``. Con
+un índice sobre ``(columna, id)`` una página cuesta lo mismo al principio que
+al fondo del historial.
+
+``?formato=json`` devuelve la misma página como ``{'filas', 'siguiente'}``
+para cargar la tabla de a poco desde JavaScript.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import JsonResponse
+
+
+def _a_json(valor):
+    # isoformat() conserva los microsegundos; el cursor debe ser exacto
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _valor(obj, ruta):
+    """Valor de ``ruta`` (``'usuario__username'``) en ``obj``; None si algún tramo falta."""
+    for parte in ruta.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, parte)
+    return obj
+
+
+class ListadoKeysetMixin:
+    """
+    Mixin para ``ListView``. Cada vista declara:
+
+    - ``orden_campos``: ``{alias: campo}`` de columnas ordenables. Deben ser no
+      nulas y tener índice ``(campo, id)``; ``'pk'`` ordena solo por id.
+    - ``orden_defecto``: alias, con ``-`` para descendente.
+    - ``filtro_form_class`` y ``filtro_lookups`` (``{campo_del_form: lookup}``).
+    - ``json_campos``: rutas que se devuelven en modo JSON.
+    """
+    por_pagina = 50
+    orden_campos = {'id': 'pk'}
+    orden_defecto = '-id'
+    filtro_form_class = None
+    filtro_lookups = {}
+    json_campos = ('id',)
+
+    def get_orden(self):
+        """``(alias, campo, descendente)`` pedido en ``?orden=`` o el por defecto."""
+        pedido = self.request.GET.get('orden') or self.orden_defecto
+        alias = pedido.lstrip('-')
+        if alias not in self.orden_campos:
+            pedido = self.orden_defecto
+            alias = pedido.lstrip('-')
+        return alias, self.orden_campos[alias], pedido.startswith('-')
+
+    def get_filtro_form(self):
+        if self.filtro_form_class is None:
+            return None
+        return self.filtro_form_class(self.request.GET or None)
+
+    def filtrar(self, queryset, datos):
+        for nombre, lookup in self.filtro_lookups.items():
+            valor = datos.get(nombre)
+            if valor not in (None, ''):
+                queryset = queryset.filter(**{lookup: valor})
+        return queryset
+
+    # --- cursor ---
+    def _campo_modelo(self, campo):
+        meta = self.model._meta
+        return meta.pk if campo == 'pk' else meta.get_field(campo)
+
+    def codificar_cursor(self, obj):
+        alias, campo, _ = self.get_orden()
+        datos = [alias, _a_json(getattr(obj, campo)), _a_json(obj.pk)]
+        return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip('=')
+
+    def decodificar_cursor(self, cursor):
+        """``(valor, pk)`` del cursor, o None si no es válido para el orden actual."""
+        alias, campo, _ = self.get_orden()
+        try:
+            crudo = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            alias_cursor, valor, pk = json.loads(crudo)
+            if alias_cursor != alias:
+                return None
+            return self._campo_modelo(campo).to_python(valor), self.model._meta.pk.to_python(pk)
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+
+    def aplicar_cursor(self, queryset, cursor):
+        _, campo, desc = self.get_orden()
+        op = 'lt' if desc else 'gt'
+        valor, pk = cursor
+        if campo == 'pk':
+            return queryset.filter(**{f'pk__{op}': pk})
+        # La primera condición es redundante pero acota el rango del índice
+        return queryset.filter(
+            Q(**{f'{campo}__{op}e': valor}),
+            Q(**{f'{campo}__{op}': valor}) | Q(**{campo: valor, f'pk__{op}': pk}),
+        )
+
+    # --- ListView ---
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        self.filtro_form = self.get_filtro_form()
+        if self.filtro_form is not None and self.filtro_form.is_valid():
+            queryset = self.filtrar(queryset, self.filtro_form.cleaned_data)
+
+        _, campo, desc = self.get_orden()
+        signo = '-' if desc else ''
+        orden = [f'{signo}pk'] if campo == 'pk' else [f'{signo}{campo}', f'{signo}pk']
+        queryset = queryset.order_by(*orden)
+
+        cursor = self.request.GET.get('despues')
+        if cursor:
+            cursor = self.decodificar_cursor(cursor)
+            if cursor is not None:
+                queryset = self.aplicar_cursor(queryset, cursor)
+        return queryset
+
+    def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        filas = list(self.object_list[:self.por_pagina + 1])
+        siguiente = self.codificar_cursor(filas[self.por_pagina - 1]) if len(filas) > self.por_pagina else None
+        filas = filas[:self.por_pagina]
+
+        if request.GET.get('formato') == 'json':
+            return JsonResponse({
+                'filas': [{c: _a_json(_valor(o, c)) for c in self.json_campos} for o in filas],
+                'siguiente': siguiente,
+            })
+
+        alias, _, desc = self.get_orden()
+        context = self.get_context_data(object_list=filas)
+        context.update({
+            'filtro_form': self.filtro_form,
+            'siguiente': siguiente,
+            'orden': f"{'-' if desc else ''}{alias}",
+            # Enlace de cada cabecera: invierte el sentido si ya es la columna activa
+            'orden_enlaces': {
+                a: (f'{a}' if desc else f'-{a}') if a == alias else a
+                for a in self.orden_campos
+            },
+        })
+        return self.render_to_response(context)
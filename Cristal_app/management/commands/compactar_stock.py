@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from Cristal_app import inventario
+
+
+class Command(BaseCommand):
+    help = "Suma los movimientos de stock pendientes en el snapshot de cada producto."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=inventario.COMPACTAR_LOTE,
+                            help="Movimientos por transacción.")
+
+    def handle(self, *args, **options):
+        n = inventario.compactar(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"{n} movimientos compactados."))
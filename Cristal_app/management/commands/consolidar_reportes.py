@@ -0,0 +1,26 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Cristal_app import reportes
+from Cristal_app.disponibilidad import noche_de
+
+
+class Command(BaseCommand):
+    help = ("Carga las tablas de hechos de los reportes. Sin fechas reconstruye los "
+            "últimos días, pensado para ejecutarse cada noche.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, help="Primer día (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=date.fromisoformat, help="Último día (AAAA-MM-DD).")
+        parser.add_argument('--dias', type=int, default=3,
+                            help="Días hacia atrás cuando no se indica --desde (por defecto 3).")
+
+    def handle(self, *args, **options):
+        # Las correcciones tardías (checkouts, consumos) caen en los últimos días
+        hasta = options['hasta'] or noche_de(timezone.now())
+        desde = options['desde'] or hasta - timedelta(days=options['dias'] - 1)
+        noches, ventas = reportes.consolidar(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(
+            f"{desde} a {hasta}: {noches} noches y {ventas} ventas por producto y día."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Cristal_app import importar
+
+
+class Command(BaseCommand):
+    help = "Importa clientes, proveedores o productos desde un CSV, actualizando los existentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('recurso', choices=sorted(importar.IMPORTACIONES))
+        parser.add_argument('archivo', help="CSV en UTF-8 con encabezado.")
+        parser.add_argument('--lote', type=int, default=importar.LOTE, help="Filas por transacción.")
+        parser.add_argument('--errores', help="Ruta del reporte de filas rechazadas "
+                                              "(por defecto <archivo>.errores.csv).")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                resultado = importar.importar(options['recurso'], archivo, lote=options['lote'])
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"No se pudo leer el archivo: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.creados} creados, {resultado.actualizados} actualizados."))
+        if resultado.errores:
+            ruta = options['errores'] or f"{options['archivo']}.errores.csv"
+            with open(ruta, 'w', encoding='utf-8', newline='') as destino:
+                resultado.escribir_reporte(destino)
+            self.stdout.write(self.style.WARNING(
+                f"{len(resultado.errores)} filas rechazadas; detalle en {ruta}."))
@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from Cristal_app import estadisticas
+
+
+class Command(BaseCommand):
+    help = "Reconstruye los acumulados diarios del tablero a partir de las reservas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, help="Primer día (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=date.fromisoformat, help="Último día (AAAA-MM-DD).")
+
+    def handle(self, *args, **options):
+        n = estadisticas.recalcular(options['desde'], options['hasta'])
+        self.stdout.write(self.style.SUCCESS(f"{n} días recalculados."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from Cristal_app import imagenes
+from Cristal_app.models import Producto
+
+
+class Command(BaseCommand):
+    help = ("Genera las miniaturas que falten de las imágenes de producto, calculando "
+            "antes la huella de las que no la tengan. Se puede dejar corriendo en segundo plano.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true',
+                            help="Vuelve a generar también las miniaturas existentes.")
+
+    def handle(self, *args, **options):
+        productos = Producto.objects.exclude(imagen='').exclude(imagen=None).only('imagen', 'imagen_huella')
+        revisados = escritas = errores = 0
+        for producto in productos.iterator(chunk_size=200):
+            revisados += 1
+            try:
+                if not producto.imagen_huella:
+                    with producto.imagen.open('rb') as archivo:
+                        producto.imagen_huella = imagenes.huella(archivo)
+                    # update() en lugar de save(): no es un cambio del producto
+                    Producto.objects.filter(pk=producto.pk).update(imagen_huella=producto.imagen_huella)
+                escritas += imagenes.generar(producto, forzar=options['forzar'])
+            except OSError as e:
+                errores += 1
+                self.stderr.write(f"Producto {producto.pk} ({producto.imagen.name}): {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{revisados} imágenes revisadas, {escritas} miniaturas generadas, {errores} con error."))
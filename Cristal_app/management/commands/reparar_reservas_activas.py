@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from Cristal_app import recepcion
+
+
+class Command(BaseCommand):
+    help = "Recalcula Habitacion.reserva_activa a partir de las reservas ACTIVA."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revisar', action='store_true',
+                            help="Solo listar las diferencias, sin corregirlas.")
+
+    def handle(self, *args, **options):
+        diferencias = recepcion.reparar_reservas_activas(corregir=not options['revisar'])
+        for habitacion_id, apuntada, activa in diferencias:
+            self.stdout.write(f"Habitación {habitacion_id}: apuntaba a {apuntada}, la activa es {activa}.")
+        verbo = "encontradas" if options['revisar'] else "corregidas"
+        self.stdout.write(self.style.SUCCESS(f"{len(diferencias)} habitaciones {verbo}."))
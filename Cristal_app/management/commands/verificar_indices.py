@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Cristal_app import indices
+
+
+class Command(BaseCommand):
+    help = "Comprueba con EXPLAIN que cada consulta caliente usa uno de sus índices."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--piso', type=int, help="Piso para las consultas de recepción.")
+        parser.add_argument('--analizar', action='store_true',
+                            help="Actualizar antes las estadísticas del planificador (ANALYZE).")
+        parser.add_argument('--plan', action='store_true', help="Mostrar el plan de cada consulta.")
+
+    def handle(self, *args, **options):
+        if options['analizar']:
+            indices.analizar()
+        faltan = []
+        for nombre, (consulta, usado, plan) in indices.verificar(options['piso']).items():
+            if usado:
+                self.stdout.write(f"OK     {nombre}: {usado}")
+            else:
+                faltan.append(nombre)
+                esperados = ', '.join(i if isinstance(i, str) else f"({', '.join(i)})" for i in consulta.indices)
+                self.stdout.write(self.style.WARNING(f"FALTA  {nombre}: no usa {esperados}"))
+            if options['plan'] or not usado:
+                self.stdout.write(plan)
+        if faltan:
+            raise CommandError(f"{len(faltan)} consultas no usan su índice: {', '.join(faltan)}.")
+        self.stdout.write(self.style.SUCCESS("Todas las consultas usan su índice."))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0006_piso_version_habitacion_version_reserva_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('estado__in', ['PENDIENTE', 'ACTIVA'])), fields=['fecha_salida', 'fecha_entrada'], name='reserva_ocupa_rango_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+def finalizar_activas_duplicadas(apps, schema_editor):
+    """Deja solo la reserva ACTIVA más reciente por habitación antes de la restricción."""
+    Reserva = apps.get_model('Cristal_app', 'Reserva')
+    vistas = set()
+    duplicadas = []
+    for pk, habitacion_id in (Reserva.objects
+                              .filter(estado='ACTIVA')
+                              .order_by('habitacion_id', '-fecha_entrada', '-pk')
+                              .values_list('pk', 'habitacion_id')):
+        if habitacion_id in vistas:
+            duplicadas.append(pk)
+        vistas.add(habitacion_id)
+    Reserva.objects.filter(pk__in=duplicadas).update(estado='FINALIZADA')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0007_reserva_ocupa_rango_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(finalizar_activas_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'ACTIVA')), fields=('habitacion',), name='reserva_activa_unica'),
+        ),
+    ]
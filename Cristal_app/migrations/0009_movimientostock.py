@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0008_reserva_activa_unica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField()),
+                ('origen', models.CharField(choices=[('COMPRA', 'Compra'), ('VENTA', 'Venta'), ('CONSUMO', 'Consumo'), ('AJUSTE', 'Ajuste')], max_length=10)),
+                ('documento_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('compactado', models.BooleanField(default=False)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='Cristal_app.producto')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'indexes': [models.Index(condition=models.Q(('compactado', False)), fields=['producto'], name='movstock_pendiente_idx'), models.Index(fields=['origen', 'documento_id'], name='movstock_documento_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:27
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def cargar_acumulados(apps, schema_editor):
+    """Llena los acumulados diarios con las reservas ya existentes."""
+    Reserva = apps.get_model('Cristal_app', 'Reserva')
+    EstadisticaDiaria = apps.get_model('Cristal_app', 'EstadisticaDiaria')
+    filas = {}
+    for r in Reserva.objects.exclude(estado='CANCELADA').iterator():
+        fila = filas.setdefault(timezone.localdate(r.fecha_entrada),
+                                EstadisticaDiaria(fecha=timezone.localdate(r.fecha_entrada)))
+        fila.checkins += 1
+        fila.ingresos_habitaciones += (r.costo_total or 0) - (r.costo_productos or 0)
+        fila.ingresos_productos += r.costo_productos or 0
+        if r.estado == 'FINALIZADA':
+            salida = filas.setdefault(timezone.localdate(r.fecha_salida),
+                                      EstadisticaDiaria(fecha=timezone.localdate(r.fecha_salida)))
+            salida.checkouts += 1
+    EstadisticaDiaria.objects.bulk_create(filas.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0010_indices_listados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('checkins', models.PositiveIntegerField(default=0)),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('ingresos_habitaciones', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('ingresos_productos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'verbose_name': 'Estadística Diaria',
+                'verbose_name_plural': 'Estadísticas Diarias',
+            },
+        ),
+        migrations.RunPython(cargar_acumulados, migrations.RunPython.noop),
+    ]
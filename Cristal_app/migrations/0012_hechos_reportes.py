@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0011_estadisticadiaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NocheHabitacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('ingreso', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('habitacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Cristal_app.habitacion')),
+                ('piso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Cristal_app.piso')),
+                ('reserva', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Cristal_app.reserva')),
+                ('tipo', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Cristal_app.tipohabitacion')),
+            ],
+            options={
+                'verbose_name': 'Noche de Habitación',
+                'verbose_name_plural': 'Noches de Habitación',
+                'indexes': [models.Index(fields=['fecha', 'tipo'], name='noche_fecha_tipo_idx'), models.Index(fields=['fecha', 'piso'], name='noche_fecha_piso_idx')],
+                'constraints': [models.UniqueConstraint(fields=('habitacion', 'fecha'), name='noche_habitacion_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaProductoDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('cantidad', models.IntegerField()),
+                ('ingreso', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('categoria', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Cristal_app.categoria')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Cristal_app.producto')),
+            ],
+            options={
+                'verbose_name': 'Venta de Producto por Día',
+                'verbose_name_plural': 'Ventas de Productos por Día',
+                'indexes': [models.Index(fields=['fecha', 'categoria'], name='venta_dia_categoria_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'producto'), name='venta_producto_dia_unica')],
+            },
+        ),
+    ]
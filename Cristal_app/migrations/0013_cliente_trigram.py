@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# Solo PostgreSQL: el índice trigram atiende ``nombrecompleto__icontains``,
+# que Django traduce a ``UPPER("nombrecompleto"::text) LIKE UPPER(%s)``; la
+# expresión del índice debe ser la misma para que el planificador lo use.
+CREAR = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS cliente_nombre_trgm_idx ON "Cristal_app_cliente" '
+    'USING gin (UPPER("nombrecompleto"::text) gin_trgm_ops)',
+]
+BORRAR = ['DROP INDEX IF EXISTS cliente_nombre_trgm_idx']
+
+
+def _ejecutar(sentencias):
+    def ejecutar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in sentencias:
+            schema_editor.execute(sql)
+    return ejecutar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0012_hechos_reportes'),
+    ]
+
+    operations = [
+        migrations.RunPython(_ejecutar(CREAR), _ejecutar(BORRAR)),
+    ]
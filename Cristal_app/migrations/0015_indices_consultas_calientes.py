@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:52
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0014_producto_imagen_huella'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habitacion',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['piso', 'numero'], name='habitacion_piso_activa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitacion',
+            index=models.Index(fields=['piso', 'version'], name='habitacion_piso_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre'], name='producto_activo_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha_entrada', 'id'], name='reserva_entrada_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(django.db.models.functions.datetime.TruncDate('fecha_entrada'), condition=models.Q(('estado', 'CANCELADA'), _negated=True), name='reserva_dia_entrada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(django.db.models.functions.datetime.TruncDate('fecha_salida'), condition=models.Q(('estado', 'FINALIZADA')), name='reserva_dia_salida_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def enlazar_reservas_activas(apps, schema_editor):
+    """Apunta cada habitación a su reserva ACTIVA (única por reserva_activa_unica)."""
+    Habitacion = apps.get_model('Cristal_app', 'Habitacion')
+    Reserva = apps.get_model('Cristal_app', 'Reserva')
+    activa = Reserva.objects.filter(habitacion=OuterRef('pk'), estado='ACTIVA').values('pk')[:1]
+    Habitacion.objects.update(reserva_activa=Subquery(activa))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0015_indices_consultas_calientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habitacion',
+            name='reserva_activa',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Cristal_app.reserva'),
+        ),
+        migrations.RunPython(enlazar_reservas_activas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0016_habitacion_reserva_activa'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='habitacion',
+            name='habitacion_piso_activa_idx',
+        ),
+    ]
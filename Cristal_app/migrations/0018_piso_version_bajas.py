@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0017_quitar_habitacion_piso_activa_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='piso',
+            name='version_bajas',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
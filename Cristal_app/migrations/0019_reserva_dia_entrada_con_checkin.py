@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:08
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Cristal_app', '0018_piso_version_bajas'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reserva',
+            name='reserva_dia_entrada_idx',
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(django.db.models.functions.datetime.TruncDate('fecha_entrada'), condition=models.Q(('estado__in', ['ACTIVA', 'FINALIZADA'])), name='reserva_dia_entrada_idx'),
+        ),
+    ]
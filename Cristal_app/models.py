@@ -1,5 +1,7 @@
 # Cristal_app/models.py
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
@@ -14,6 +16,23 @@ class CustomUser(AbstractUser):
 # -------------------------
 # CLIENTES
 # -------------------------
+class ClienteQuerySet(models.QuerySet):
+    def buscar(self, texto):
+        """
+        Búsqueda del autocompletado: prefijo de DNI si ``texto`` son dígitos,
+        si no, nombres que contienen cada palabra. En PostgreSQL el prefijo usa
+        el índice ``_like`` que Django crea para ``dni`` y el nombre el índice
+        trigram de la migración 0013.
+        """
+        texto = texto.strip()
+        if texto.isdigit():
+            return self.filter(dni__startswith=texto).order_by('dni')
+        qs = self
+        for palabra in texto.split():
+            qs = qs.filter(nombrecompleto__icontains=palabra)
+        return qs.order_by('nombrecompleto', 'id')
+
+
 class Cliente(models.Model):
     dni = models.CharField(max_length=8, unique=True)
     nombrecompleto = models.CharField(max_length=255)
@@ -22,12 +41,18 @@ class Cliente(models.Model):
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(default=timezone.now)
 
+    objects = ClienteQuerySet.as_manager()
+
     def __str__(self):
         return self.nombrecompleto
 
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
+        indexes = [
+            # Paginación por clave del listado (ver listados.py)
+            models.Index(fields=['nombrecompleto', 'id'], name='cliente_nombre_id_idx'),
+        ]
 
 
 # -------------------------
@@ -61,22 +86,55 @@ class Categoria(models.Model):
         verbose_name_plural = "Categorías"
 
 
+class ProductoQuerySet(models.QuerySet):
+    def con_stock_actual(self):
+        """Anota ``stock_actual``: snapshot compactado + movimientos pendientes."""
+        pendientes = (MovimientoStock.objects
+                      .filter(producto=OuterRef('pk'), compactado=False)
+                      .values('producto')
+                      .annotate(total=Sum('cantidad'))
+                      .values('total'))
+        return self.annotate(stock_actual=F('stock') + Coalesce(Subquery(pendientes), 0))
+
+
 class Producto(models.Model):
     nombre = models.CharField(max_length=255)
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True)
     precio_venta = models.DecimalField(max_digits=10, decimal_places=2)
+    # Snapshot compactado del stock (ver inventario.py). El stock real es este
+    # valor más los MovimientoStock pendientes: usar ``con_stock_actual()``.
     stock = models.IntegerField(default=0)
     descripcion = models.TextField(blank=True, null=True)
     imagen = models.ImageField(upload_to='productos/', blank=True, null=True)
+    # sha256 del archivo de ``imagen``; nombra sus miniaturas (ver imagenes.py)
+    imagen_huella = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(default=timezone.now)
 
+    objects = ProductoQuerySet.as_manager()
+
     def __str__(self):
         return self.nombre
 
+    def save(self, *args, **kwargs):
+        # El snapshot de stock solo lo mueve la compactación del libro de
+        # movimientos; un guardado completo no debe pisarlo con un valor viejo.
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'stock'
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
+        indexes = [
+            models.Index(fields=['nombre', 'id'], name='producto_nombre_id_idx'),
+            models.Index(fields=['precio_venta', 'id'], name='producto_precio_id_idx'),
+            # Catálogo de consumos: solo los activos, por nombre
+            models.Index(fields=['nombre'], condition=models.Q(activo=True), name='producto_activo_nombre_idx'),
+        ]
 
 
 class Compra(models.Model):
@@ -91,6 +149,10 @@ class Compra(models.Model):
     class Meta:
         verbose_name = "Compra"
         verbose_name_plural = "Compras"
+        indexes = [
+            models.Index(fields=['fecha_compra', 'id'], name='compra_fecha_id_idx'),
+            models.Index(fields=['total_compra', 'id'], name='compra_total_id_idx'),
+        ]
 
 
 class DetalleCompra(models.Model):
@@ -124,6 +186,10 @@ class Venta(models.Model):
     class Meta:
         verbose_name = "Venta"
         verbose_name_plural = "Ventas"
+        indexes = [
+            models.Index(fields=['fecha_venta', 'id'], name='venta_fecha_id_idx'),
+            models.Index(fields=['total_venta', 'id'], name='venta_total_id_idx'),
+        ]
 
 
 class DetalleVenta(models.Model):
@@ -144,6 +210,40 @@ class DetalleVenta(models.Model):
         verbose_name_plural = "Detalles de Ventas"
 
 
+class MovimientoStock(models.Model):
+    """
+    Libro de movimientos de stock, de solo inserción. Cada entrada o salida de
+    un producto se registra aquí en lugar de modificar ``Producto.stock``.
+    """
+    ORIGEN_CHOICES = [
+        ('COMPRA', 'Compra'),
+        ('VENTA', 'Venta'),
+        ('CONSUMO', 'Consumo'),
+        ('AJUSTE', 'Ajuste'),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='movimientos')
+    cantidad = models.IntegerField()  # positiva entra, negativa sale
+    origen = models.CharField(max_length=10, choices=ORIGEN_CHOICES)
+    documento_id = models.PositiveBigIntegerField(blank=True, null=True)
+    usuario = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(default=timezone.now)
+    # Ya sumado en Producto.stock por la compactación
+    compactado = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.get_origen_display()} {self.cantidad:+d} de {self.producto_id}"
+
+    class Meta:
+        verbose_name = "Movimiento de Stock"
+        verbose_name_plural = "Movimientos de Stock"
+        indexes = [
+            models.Index(fields=['producto'], condition=models.Q(compactado=False),
+                         name='movstock_pendiente_idx'),
+            models.Index(fields=['origen', 'documento_id'], name='movstock_documento_idx'),
+        ]
+
+
 # -------------------------
 # MANTENIMIENTO / HOTEL
 # -------------------------
@@ -152,10 +252,26 @@ class Piso(models.Model):
     descripcion = models.CharField(max_length=255, blank=True, null=True)
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Contador de cambios del piso (solo crece); lo usan los clientes de recepción
+    # para pedir únicamente lo que cambió desde la versión que ya tienen.
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+    # Última versión en la que una habitación o reserva salió del piso (borrada
+    # o movida); un delta desde una versión anterior no la reportaría.
+    version_bajas = models.PositiveBigIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"Piso {self.numero}"
 
+    def save(self, *args, **kwargs):
+        # Los contadores solo se incrementan con UPDATE atómicos (ver recepcion.py);
+        # un guardado completo con un valor viejo no debe hacerlos retroceder.
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('version', 'version_bajas')
+            ]
+        super().save(*args, **kwargs)
+
 
 class TipoHabitacion(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
@@ -181,10 +297,33 @@ class Habitacion(models.Model):
     activo = models.BooleanField(default=True)
     estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default='DISPONIBLE')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Versión del piso en la que cambió por última vez
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+    # Estadía en curso (la Reserva ACTIVA), mantenida por el check-in y el
+    # checkout; ``manage.py reparar_reservas_activas`` la recalcula.
+    reserva_activa = models.OneToOneField('Reserva', on_delete=models.SET_NULL, null=True, blank=True,
+                                          editable=False, related_name='+')
 
     def __str__(self):
         return f"Habitación {self.numero}"
 
+    def save(self, *args, **kwargs):
+        # ``reserva_activa`` y ``version`` solo cambian con UPDATE (ver
+        # recepcion.py); un guardado completo con la instancia cargada antes
+        # del check-in o el checkout no debe devolverles su valor viejo.
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('reserva_activa', 'version')
+            ]
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # recepcion_cambios: lo que cambió en el piso desde una versión
+            models.Index(fields=['piso', 'version'], name='habitacion_piso_version_idx'),
+        ]
+
 
 # -------------------------
 # RECEPCIÓN / RESERVAS
@@ -217,6 +356,8 @@ class Reserva(models.Model):
 
     observaciones = models.TextField(blank=True, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Versión del piso en la que cambió por última vez
+    version = models.PositiveBigIntegerField(default=0, editable=False, db_index=True)
 
     def __str__(self):
         return f"Reserva de {self.cliente.nombrecompleto} para la Hab. {self.habitacion.numero}"
@@ -224,6 +365,30 @@ class Reserva(models.Model):
     class Meta:
         verbose_name = "Reserva"
         verbose_name_plural = "Reservas"
+        constraints = [
+            # Una habitación no puede tener dos estadías en curso a la vez
+            models.UniqueConstraint(
+                fields=['habitacion'],
+                condition=models.Q(estado='ACTIVA'),
+                name='reserva_activa_unica',
+            ),
+        ]
+        indexes = [
+            # Búsqueda de disponibilidad: solo las estadías que aún ocupan habitación
+            models.Index(
+                fields=['fecha_salida', 'fecha_entrada'],
+                name='reserva_ocupa_rango_idx',
+                condition=models.Q(estado__in=['PENDIENTE', 'ACTIVA']),
+            ),
+            # Exportación y consolidación de reportes por rango de entrada
+            models.Index(fields=['fecha_entrada', 'id'], name='reserva_entrada_id_idx'),
+            # Acumulados diarios (estadisticas.recalcular): agrupan por día local.
+            # La expresión se compila con TIME_ZONE; si cambia, recrear estos índices.
+            models.Index(TruncDate('fecha_entrada'), condition=models.Q(estado__in=['ACTIVA', 'FINALIZADA']),
+                         name='reserva_dia_entrada_idx'),
+            models.Index(TruncDate('fecha_salida'), condition=models.Q(estado='FINALIZADA'),
+                         name='reserva_dia_salida_idx'),
+        ]
 
 
 class Acompanante(models.Model):
@@ -265,3 +430,75 @@ class Pago(models.Model):
     class Meta:
         verbose_name = "Pago de Reserva"
         verbose_name_plural = "Pagos de Reservas"
+
+
+# -------------------------
+# ESTADÍSTICAS
+# -------------------------
+class EstadisticaDiaria(models.Model):
+    """
+    Acumulado por día que actualizan check-in, checkout y consumos (ver
+    estadisticas.py). Los ingresos se imputan al día de entrada de la reserva.
+    """
+    fecha = models.DateField(unique=True)
+    checkins = models.PositiveIntegerField(default=0)
+    checkouts = models.PositiveIntegerField(default=0)
+    ingresos_habitaciones = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    ingresos_productos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Estadística {self.fecha}"
+
+    class Meta:
+        verbose_name = "Estadística Diaria"
+        verbose_name_plural = "Estadísticas Diarias"
+
+
+# -------------------------
+# REPORTES (tablas de hechos, ver reportes.py)
+# -------------------------
+class NocheHabitacion(models.Model):
+    """Una noche ocupada de una habitación, con su parte del ingreso de la estadía."""
+    fecha = models.DateField()
+    habitacion = models.ForeignKey(Habitacion, on_delete=models.CASCADE, related_name='+')
+    # Copias de la habitación al consolidar, para agrupar sin JOIN
+    tipo = models.ForeignKey(TipoHabitacion, on_delete=models.SET_NULL, null=True, related_name='+')
+    piso = models.ForeignKey(Piso, on_delete=models.CASCADE, related_name='+')
+    reserva = models.ForeignKey(Reserva, on_delete=models.CASCADE, related_name='+')
+    ingreso = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"Noche {self.fecha} - {self.habitacion_id}"
+
+    class Meta:
+        verbose_name = "Noche de Habitación"
+        verbose_name_plural = "Noches de Habitación"
+        constraints = [
+            models.UniqueConstraint(fields=['habitacion', 'fecha'], name='noche_habitacion_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha', 'tipo'], name='noche_fecha_tipo_idx'),
+            models.Index(fields=['fecha', 'piso'], name='noche_fecha_piso_idx'),
+        ]
+
+
+class VentaProductoDia(models.Model):
+    """Unidades e ingreso de un producto en un día."""
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='+')
+    categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, related_name='+')
+    cantidad = models.IntegerField()
+    ingreso = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def __str__(self):
+        return f"Ventas {self.fecha} - {self.producto_id}"
+
+    class Meta:
+        verbose_name = "Venta de Producto por Día"
+        verbose_name_plural = "Ventas de Productos por Día"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto'], name='venta_producto_dia_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha', 'categoria'], name='venta_dia_categoria_idx'),
+        ]
@@ -0,0 +1,76 @@
+# Cristal_app/opciones.py
+"""
+Opciones compartidas de formularios: productos de los formsets de detalle de
+compra y venta, y permisos del formulario de usuario.
+
+Cada lista se guarda en memoria del proceso junto con la versión con la que
+se cargó; la versión vive en la caché compartida, así que guardar o borrar un
+producto o un permiso (``signals.py``) la invalida en todos los procesos.
+Cada request solo lee la versión: la tabla se consulta una vez por proceso y
+por cambio, no una vez por fila del formset o por pantalla.
+"""
+import time
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Producto
+
+_VERSION_KEY = 'opciones:productos:ver'
+_VERSION_PERMISOS_KEY = 'opciones:permisos:ver'
+VACIA = ('', '---------')
+
+# {clave de versión: (versión, opciones)}; cada entrada se reemplaza entera
+# para que los hilos no vean mezclas
+_en_memoria = {}
+
+
+def _version(clave):
+    ver = cache.get(clave)
+    if ver is None:
+        cache.add(clave, time.time_ns(), None)
+        ver = cache.get(clave)
+    return ver
+
+
+def _cargar(clave, consulta):
+    ver = _version(clave)
+    cargada, opciones = _en_memoria.get(clave, (None, None))
+    if cargada != ver or opciones is None:
+        opciones = consulta()
+        _en_memoria[clave] = (ver, opciones)
+    return opciones
+
+
+def productos():
+    """``[('', '---------'), (id, nombre), ...]`` de todos los productos, por nombre."""
+    return _cargar(_VERSION_KEY, lambda: [
+        VACIA, *Producto.objects.order_by('nombre', 'pk').values_list('pk', 'nombre'),
+    ])
+
+
+def permisos():
+    """``[(id, 'app | modelo | nombre'), ...]`` de todos los permisos."""
+    return _cargar(_VERSION_PERMISOS_KEY, lambda: [
+        (p.pk, str(p)) for p in Permission.objects.select_related('content_type')
+    ])
+
+
+def _invalidar(clave):
+    """Pasa a una versión nueva al confirmar la transacción."""
+    def _incrementar():
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, time.time_ns(), None)
+
+    transaction.on_commit(_incrementar)
+
+
+def invalidar():
+    _invalidar(_VERSION_KEY)
+
+
+def invalidar_permisos():
+    _invalidar(_VERSION_PERMISOS_KEY)
@@ -0,0 +1,78 @@
+# Cristal_app/permisos.py
+"""
+Caché de permisos por usuario, compartida entre requests y procesos.
+
+``ModelBackend`` arma el conjunto de permisos de un usuario con dos consultas
+(permisos propios y de sus roles) en cada request que pregunta por alguno:
+``PermissionRequiredMixin`` y el menú lateral lo hacen siempre.
+``PermisosCacheBackend`` guarda ese conjunto en la caché compartida bajo una
+clave con dos versiones:
+
+- la de los roles (``permisos:grupos:ver``), que cambia cuando un rol gana o
+  pierde permisos o miembros desde el lado del rol, o se borra;
+- la del usuario (``permisos:usuario:<id>:ver``), que cambia cuando se le
+  asignan roles o permisos o se edita (``is_active``, ``is_superuser``).
+
+``signals.py`` sube las versiones al confirmar la transacción; la entrada
+vieja deja de leerse y expira sola.
+"""
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+_VERSION_GRUPOS_KEY = 'permisos:grupos:ver'
+_VERSION_USUARIO_KEY = 'permisos:usuario:{}:ver'
+_PERMISOS_KEY = 'permisos:{}:{}:{}'
+# Las claves cambian con cada versión; el timeout solo limpia las viejas
+PERMISOS_TIMEOUT = 60 * 60 * 24
+
+
+def _versiones(user_id):
+    claves = [_VERSION_GRUPOS_KEY, _VERSION_USUARIO_KEY.format(user_id)]
+    versiones = cache.get_many(claves)
+    if len(versiones) < len(claves):
+        for clave in claves:
+            cache.add(clave, time.time_ns(), None)
+        versiones = cache.get_many(claves)
+    return [versiones.get(c) for c in claves]
+
+
+def clave_permisos(user_id):
+    """Clave de caché con el conjunto de permisos vigente del usuario."""
+    return _PERMISOS_KEY.format(user_id, *_versiones(user_id))
+
+
+class PermisosCacheBackend(ModelBackend):
+    """``ModelBackend`` que lee los permisos del usuario de la caché compartida."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        # Dentro del request se reutiliza el conjunto, como hace ModelBackend
+        if not hasattr(user_obj, '_perm_cache'):
+            clave = clave_permisos(user_obj.pk)
+            permisos = cache.get(clave)
+            if permisos is None:
+                permisos = super().get_all_permissions(user_obj)
+                cache.set(clave, permisos, PERMISOS_TIMEOUT)
+            user_obj._perm_cache = permisos
+        return user_obj._perm_cache
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, time.time_ns(), None)
+
+
+def invalidar_grupos():
+    """Invalida los permisos de todos los usuarios al confirmar la transacción."""
+    transaction.on_commit(lambda: _incrementar(_VERSION_GRUPOS_KEY))
+
+
+def invalidar_usuario(user_id):
+    """Invalida los permisos de un usuario al confirmar la transacción."""
+    transaction.on_commit(lambda: _incrementar(_VERSION_USUARIO_KEY.format(user_id)))
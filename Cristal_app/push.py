@@ -0,0 +1,96 @@
+# Cristal_app/push.py
+"""
+Canal de notificaciones en vivo para el tablero de recepción.
+
+Las escrituras (ver ``signals.py``) publican en el grupo ``piso-<id>`` los
+cambios de estado de cada habitación (DISPONIBLE/OCUPADA/LIMPIEZA) y los
+totales de consumo de su reserva. La vista ``recepcion_eventos`` los reenvía
+como Server-Sent Events a cada pestaña abierta de recepción. Eso solo ocurre
+con la app servida por ASGI; bajo WSGI la vista responde 204 y el tablero
+consulta ``recepcion_cambios`` periódicamente.
+
+El canal por defecto vive en memoria del proceso (sirve para un solo worker
+ASGI y para los tests). Para varios workers se puede indicar otra
+implementación con la misma interfaz en ``settings.RECEPCION_CANAL``.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class CanalEnMemoria:
+    """Pub/sub por grupos dentro del proceso, seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._grupos = {}
+
+    def suscribir(self, grupo):
+        """Registra una cola en ``grupo``; debe llamarse desde el event loop."""
+        cola = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._grupos.setdefault(grupo, set()).add((loop, cola))
+        return cola
+
+    def desuscribir(self, grupo, cola):
+        with self._lock:
+            miembros = self._grupos.get(grupo, set())
+            miembros.difference_update({m for m in miembros if m[1] is cola})
+            if not miembros:
+                self._grupos.pop(grupo, None)
+
+    def publicar(self, grupo, mensaje):
+        """Entrega ``mensaje`` a todos los suscriptores de ``grupo`` (desde cualquier hilo)."""
+        with self._lock:
+            miembros = list(self._grupos.get(grupo, ()))
+        for loop, cola in miembros:
+            if loop.is_closed():
+                self.desuscribir(grupo, cola)
+                continue
+            loop.call_soon_threadsafe(cola.put_nowait, mensaje)
+
+
+_canal = None
+
+
+def get_canal():
+    global _canal
+    if _canal is None:
+        ruta = getattr(settings, 'RECEPCION_CANAL', 'Cristal_app.push.CanalEnMemoria')
+        _canal = import_string(ruta)()
+    return _canal
+
+
+def grupo_piso(piso_id):
+    return f'piso-{piso_id}'
+
+
+def publicar(piso_id, mensaje):
+    """Publica ``mensaje`` para el piso al confirmar la transacción en curso."""
+    if piso_id is None:
+        return
+    transaction.on_commit(lambda: get_canal().publicar(grupo_piso(piso_id), mensaje))
+
+
+def publicar_habitacion(habitacion):
+    publicar(habitacion.piso_id, {
+        'tipo': 'habitacion',
+        'habitacion': habitacion.pk,
+        'numero': habitacion.numero,
+        'estado': habitacion.estado,
+    })
+
+
+def publicar_reserva(reserva, piso_id):
+    publicar(piso_id, {
+        'tipo': 'reserva',
+        'habitacion': reserva.habitacion_id,
+        'reserva': reserva.pk,
+        'estado': reserva.estado,
+        'costo_productos': str(reserva.costo_productos or 0),
+        'costo_total': str(reserva.costo_total or 0),
+    })
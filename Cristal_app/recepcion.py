@@ -0,0 +1,274 @@
+# Cristal_app/recepcion.py
+"""
+Snapshot en caché del tablero de recepción.
+
+Cada piso se guarda como una lista de habitaciones (con su reserva activa ya
+enlazada) bajo una clave con la versión del piso. Las escrituras sobre
+habitaciones y reservas pasan a una versión nueva solo el piso afectado (ver
+``signals.py``), así varios recepcionistas refrescando el tablero leen de
+memoria y la BD solo se consulta cuando cambia una habitación de ese piso.
+
+Como en ``disponibilidad``, invalidar es cambiar la versión y no borrar: un
+lector que cargó el piso antes del commit lo guarda bajo la versión vieja,
+que nadie vuelve a leer.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from . import disponibilidad, push
+from .models import Piso, Habitacion, Reserva, Producto
+
+# Tiempo máximo que vive un snapshot aunque nadie lo invalide (red de seguridad)
+RECEPCION_CACHE_TIMEOUT = getattr(settings, 'RECEPCION_CACHE_TIMEOUT', 60 * 5)
+
+_GEN_KEY = 'recepcion:gen'
+_PISOS_KEY = 'recepcion:pisos:{gen}'
+_VER_PISO_KEY = 'recepcion:ver:piso:{piso_id}'
+_PISO_KEY = 'recepcion:piso:{gen}:{piso_id}:{ver}'
+
+
+def _generacion():
+    """Generación global; al incrementarla se descartan todos los snapshots."""
+    gen = cache.get(_GEN_KEY)
+    if gen is None:
+        # Si la clave se perdió (reinicio, desalojo) arrancamos desde un valor
+        # nuevo para no reutilizar snapshots de una generación anterior.
+        cache.add(_GEN_KEY, time.time_ns(), None)
+        gen = cache.get(_GEN_KEY)
+    return gen
+
+
+def _version_piso(piso_id):
+    clave = _VER_PISO_KEY.format(piso_id=piso_id)
+    ver = cache.get(clave)
+    if ver is None:
+        cache.add(clave, time.time_ns(), None)
+        ver = cache.get(clave)
+    return ver
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, time.time_ns(), None)
+
+
+def _cargar_habitaciones(piso_id):
+    # La reserva activa viene por Habitacion.reserva_activa: un JOIN por clave
+    # primaria en la misma consulta en lugar de buscarla en Reserva por estado.
+    return list(
+        Habitacion.objects
+        .filter(activo=True, piso_id=piso_id)
+        .select_related('tipo', 'piso', 'reserva_activa__cliente', 'reserva_activa__venta')
+        .prefetch_related('reserva_activa__acompanantes', 'reserva_activa__venta__detalleventa_set__producto')
+        .order_by('numero')
+    )
+
+
+def pisos_activos():
+    """Lista de pisos activos ordenados por número (en caché)."""
+    key = _PISOS_KEY.format(gen=_generacion())
+    pisos = cache.get(key)
+    if pisos is None:
+        pisos = list(Piso.objects.filter(activo=True).order_by('numero'))
+        cache.set(key, pisos, RECEPCION_CACHE_TIMEOUT)
+    return pisos
+
+
+def habitaciones_piso(piso_id):
+    """Habitaciones activas del piso con ``reserva_activa`` enlazada (en caché)."""
+    # Las versiones se leen antes que la BD: si un commit las cambia mientras
+    # tanto, lo cargado queda bajo la clave vieja
+    key = _PISO_KEY.format(gen=_generacion(), piso_id=piso_id, ver=_version_piso(piso_id))
+    habitaciones = cache.get(key)
+    if habitaciones is None:
+        habitaciones = _cargar_habitaciones(piso_id)
+        cache.set(key, habitaciones, RECEPCION_CACHE_TIMEOUT)
+    return habitaciones
+
+
+def invalidar_piso(piso_id):
+    """
+    Pasa el snapshot de un piso a una versión nueva al confirmar la
+    transacción, para que ningún lector vuelva a cachear datos aún no
+    confirmados.
+    """
+    if piso_id is None:
+        return
+    transaction.on_commit(lambda: _incrementar(_VER_PISO_KEY.format(piso_id=piso_id)))
+
+
+def registrar_cambio(piso_id, habitaciones=(), reservas=(), baja=False):
+    """
+    Al confirmar la transacción, incrementa el contador de cambios del piso y
+    estampa la nueva versión en las ``habitaciones`` y ``reservas`` (ids)
+    modificadas. ``baja`` indica que una fila salió del piso (borrada o movida
+    a otro): los deltas anteriores a esa versión ya no alcanzan y
+    ``recepcion_cambios`` responde con el piso completo.
+
+    El ``UPDATE`` del piso corre en su propia transacción corta después del
+    commit; dentro de la del check-in o el checkout bloquearía la fila del
+    piso y serializaría todas las escrituras del piso hasta confirmar. A
+    cambio, entre el commit y el estampado el piso conserva la versión
+    anterior: los clientes ven el cambio en la consulta siguiente.
+    """
+    if piso_id is None:
+        return
+    habitaciones, reservas = list(habitaciones), list(reservas)
+    transaction.on_commit(lambda: _estampar(piso_id, habitaciones, reservas, baja), robust=True)
+
+
+def _estampar(piso_id, habitaciones, reservas, baja):
+    with transaction.atomic():
+        pisos = Piso.objects.filter(pk=piso_id)
+        cambios = {'version': F('version') + 1}
+        if baja:
+            cambios['version_bajas'] = F('version') + 1
+        if not pisos.update(**cambios):
+            return
+        version = pisos.values_list('version', flat=True).get()
+        if habitaciones:
+            Habitacion.objects.filter(pk__in=habitaciones).update(version=version)
+        if reservas:
+            Reserva.objects.filter(pk__in=reservas).update(version=version)
+
+
+def registrar_cambios_masivos(habitaciones, reservas=()):
+    """
+    Lo que hacen las señales por cada ``save()``, para escrituras masivas
+    (``bulk_create``/``update()``) que no las disparan: una versión nueva por
+    piso estampada en todas sus filas, snapshot invalidado y aviso en vivo.
+
+    ``habitaciones`` deben traer ya su estado nuevo en memoria y ``reservas``
+    pertenecer a esas habitaciones.
+    """
+    piso_de = {h.pk: h.piso_id for h in habitaciones}
+    por_piso = defaultdict(lambda: ([], []))
+    for h in habitaciones:
+        por_piso[h.piso_id][0].append(h.pk)
+    for r in reservas:
+        por_piso[piso_de[r.habitacion_id]][1].append(r.pk)
+
+    for piso_id, (hab_ids, reserva_ids) in por_piso.items():
+        registrar_cambio(piso_id, hab_ids, reserva_ids)
+        invalidar_piso(piso_id)
+
+    for h in habitaciones:
+        push.publicar_habitacion(h)
+    for r in reservas:
+        push.publicar_reserva(r, piso_de[r.habitacion_id])
+    disponibilidad.invalidar_rangos((r.fecha_entrada, r.fecha_salida) for r in reservas)
+
+
+# =======================
+# RESERVA ACTIVA
+# =======================
+def sincronizar_reserva_activa(reserva, creada):
+    """
+    Ajusta ``Habitacion.reserva_activa`` tras guardar ``reserva`` (lo llama
+    ``signals.py``): la apunta desde su habitación si quedó ACTIVA y la quita
+    de cualquier otra que la apunte (fin de la estadía o cambio de habitación).
+    """
+    if not creada:
+        anteriores = Habitacion.objects.filter(reserva_activa=reserva)
+        if reserva.estado == 'ACTIVA':
+            anteriores = anteriores.exclude(pk=reserva.habitacion_id)
+        anteriores.update(reserva_activa=None)
+    if reserva.estado == 'ACTIVA':
+        Habitacion.objects.filter(pk=reserva.habitacion_id).update(reserva_activa=reserva)
+    if Reserva.habitacion.is_cached(reserva):
+        reserva.habitacion.reserva_activa = reserva if reserva.estado == 'ACTIVA' else None
+
+
+def enlazar_reservas(reservas):
+    """
+    ``sincronizar_reserva_activa`` para reservas creadas con ``bulk_create``:
+    apunta la habitación de cada una a ella con un solo UPDATE. Va en la misma
+    transacción que las crea; ``reserva.habitacion`` ya debe estar cargada.
+    """
+    habitaciones = []
+    for r in reservas:
+        r.habitacion.reserva_activa = r
+        habitaciones.append(r.habitacion)
+    Habitacion.objects.bulk_update(habitaciones, ['reserva_activa'])
+
+
+def reparar_reservas_activas(corregir=True):
+    """
+    Compara ``Habitacion.reserva_activa`` con las reservas ACTIVA y, si
+    ``corregir``, arregla las que no coinciden. Devuelve
+    ``[(habitacion_id, reserva_apuntada_id, reserva_activa_id), ...]``.
+    """
+    with transaction.atomic():
+        # Con las habitaciones bloqueadas ningún check-in o checkout cambia
+        # las reservas activas mientras se comparan
+        habitaciones = list(Habitacion.objects.select_for_update().only('id', 'piso_id', 'reserva_activa_id'))
+        esperadas = dict(Reserva.objects.filter(estado='ACTIVA').values_list('habitacion_id', 'pk'))
+        distintas = [h for h in habitaciones if h.reserva_activa_id != esperadas.get(h.pk)]
+        diferencias = [(h.pk, h.reserva_activa_id, esperadas.get(h.pk)) for h in distintas]
+        if corregir and distintas:
+            for h in distintas:
+                h.reserva_activa_id = esperadas.get(h.pk)
+            Habitacion.objects.bulk_update(distintas, ['reserva_activa'], batch_size=500)
+            for piso_id in {h.piso_id for h in distintas}:
+                invalidar_piso(piso_id)
+    return diferencias
+
+
+def invalidar_todo():
+    """Descarta la lista de pisos y los snapshots de todos los pisos."""
+    transaction.on_commit(lambda: _incrementar(_GEN_KEY))
+
+
+# =======================
+# CATÁLOGO DE CONSUMOS
+# =======================
+_CATALOGO_VER_KEY = 'recepcion:catalogo:ver'
+_CATALOGO_KEY = 'recepcion:catalogo:{ver}'
+
+
+def _version_catalogo():
+    ver = cache.get(_CATALOGO_VER_KEY)
+    if ver is None:
+        cache.add(_CATALOGO_VER_KEY, time.time_ns(), None)
+        ver = cache.get(_CATALOGO_VER_KEY)
+    return ver
+
+
+def catalogo_consumos():
+    """
+    Productos vendibles desde recepción como ``(version, filas)``.
+
+    Se envía una sola vez por página (``json_script``) y todos los modales de
+    consumo lo reutilizan; la versión cambia cuando cambia stock o precio.
+    """
+    ver = _version_catalogo()
+    key = _CATALOGO_KEY.format(ver=ver)
+    filas = cache.get(key)
+    if filas is None:
+        filas = [
+            {
+                'id': p['id'],
+                'nombre': p['nombre'],
+                'precio': str(p['precio_venta']),
+                'stock': p['stock_actual'],
+            }
+            for p in (Producto.objects
+                      .con_stock_actual()
+                      .filter(activo=True, stock_actual__gt=0)
+                      .order_by('nombre')
+                      .values('id', 'nombre', 'precio_venta', 'stock_actual'))
+        ]
+        cache.set(key, filas, RECEPCION_CACHE_TIMEOUT)
+    return ver, filas
+
+
+def invalidar_catalogo():
+    """Pasa el catálogo a una nueva versión al confirmar la transacción."""
+    transaction.on_commit(lambda: _incrementar(_CATALOGO_VER_KEY))
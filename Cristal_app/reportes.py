@@ -0,0 +1,240 @@
+# Cristal_app/reportes.py
+"""
+Reportes de ocupación e ingresos sobre tablas de hechos pre-agregadas.
+
+``consolidar()`` vuelca las estadías en ``NocheHabitacion`` (una fila por
+habitación y noche ocupada, con su parte del ingreso de la habitación) y las
+ventas en ``VentaProductoDia`` (una fila por producto y día). Lo ejecuta cada
+noche ``manage.py consolidar_reportes`` sobre los últimos días (y las
+estadías completas que los tocan, para que el reparto del ingreso no quede
+a medias cuando una reserva cambia de largo); los reportes
+solo leen esas tablas, así un rango de varios años agrupa unos miles de filas
+en lugar de recorrer reservas y detalles de venta.
+
+Las noches siguen la convención de ``disponibilidad``: la noche ``d`` empieza
+``d`` a la hora de checkout. Las noches disponibles se calculan con el
+inventario actual de habitaciones activas.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .disponibilidad import inicio_noche, noche_de
+from .models import DetalleVenta, Habitacion, NocheHabitacion, Reserva, VentaProductoDia
+
+PERIODOS = {
+    'dia': 'Día',
+    'semana': 'Semana',
+    'mes': 'Mes',
+}
+AGRUPACIONES = {
+    'tipo': ('tipo', 'tipo__nombre'),
+    'piso': ('piso', 'piso__numero'),
+}
+
+_CENTAVO = Decimal('0.01')
+
+
+# =======================
+# CONSOLIDACIÓN
+# =======================
+def _reservas_en(desde, hasta):
+    return Reserva.objects.filter(estado__in=('ACTIVA', 'FINALIZADA'),
+                                  fecha_entrada__lt=inicio_noche(hasta + timedelta(days=1)),
+                                  fecha_salida__gt=inicio_noche(desde))
+
+
+def _rango_completo(desde, hasta):
+    """
+    Amplía ``desde``..``hasta`` a todas las noches de las estadías que lo tocan.
+
+    El ingreso de cada noche depende de cuántas tiene la estadía: si una
+    reserva cambió de largo (o se canceló), sus noches fuera del rango pedido
+    también cambian. Se cubren tanto las fechas actuales de las reservas como
+    las noches que ya tenían consolidadas.
+    """
+    actuales = _reservas_en(desde, hasta).aggregate(entrada=Min('fecha_entrada'), salida=Max('fecha_salida'))
+    consolidadas = (NocheHabitacion.objects
+                    .filter(Q(reserva__in=_reservas_en(desde, hasta).values('pk'))
+                            | Q(reserva__in=NocheHabitacion.objects.filter(fecha__range=(desde, hasta))
+                                .values('reserva_id')))
+                    .aggregate(primera=Min('fecha'), ultima=Max('fecha')))
+    if actuales['entrada']:
+        desde = min(desde, noche_de(actuales['entrada']))
+        hasta = max(hasta, noche_de(actuales['salida'] - timedelta(microseconds=1)))
+    if consolidadas['primera']:
+        desde = min(desde, consolidadas['primera'])
+        hasta = max(hasta, consolidadas['ultima'])
+    return desde, hasta
+
+
+def consolidar_noches(desde, hasta):
+    """
+    Reconstruye las noches ocupadas de ``desde`` a ``hasta`` (inclusive).
+
+    El rango se amplía a las estadías completas que lo tocan (ver
+    ``_rango_completo``), así el reparto del ingreso de cada una queda
+    recalculado entero. Devuelve cuántas noches cargó.
+    """
+    desde, hasta = _rango_completo(desde, hasta)
+    reservas = (_reservas_en(desde, hasta)
+                .select_related('habitacion')
+                .order_by('fecha_entrada', 'pk'))
+
+    noches = {}
+    for r in reservas.iterator(chunk_size=2000):
+        primera = noche_de(r.fecha_entrada)
+        ultima = max(noche_de(r.fecha_salida - timedelta(microseconds=1)), primera)
+        total_noches = (ultima - primera).days + 1
+        ingreso = (r.costo_total or 0) - (r.costo_productos or 0)
+        por_noche = (Decimal(ingreso) / total_noches).quantize(_CENTAVO)
+
+        dia = max(primera, desde)
+        while dia <= min(ultima, hasta):
+            # La última noche se lleva el redondeo para que la suma sea exacta
+            parte = ingreso - por_noche * (total_noches - 1) if dia == ultima else por_noche
+            clave = (r.habitacion_id, dia)
+            if clave in noches:
+                # Salida y nueva entrada dentro de la misma noche
+                noches[clave].ingreso += parte
+                noches[clave].reserva_id = r.pk
+            else:
+                noches[clave] = NocheHabitacion(
+                    fecha=dia, habitacion_id=r.habitacion_id, tipo_id=r.habitacion.tipo_id,
+                    piso_id=r.habitacion.piso_id, reserva_id=r.pk, ingreso=parte,
+                )
+            dia += timedelta(days=1)
+
+    with transaction.atomic():
+        NocheHabitacion.objects.filter(fecha__range=(desde, hasta)).delete()
+        NocheHabitacion.objects.bulk_create(noches.values(), batch_size=1000)
+    return len(noches)
+
+
+def _inicio_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def consolidar_ventas(desde, hasta):
+    """Reconstruye las ventas por producto y día de ``desde`` a ``hasta``."""
+    tz = timezone.get_current_timezone()
+    filas = (DetalleVenta.objects
+             .filter(venta__fecha_venta__gte=_inicio_dia(desde),
+                     venta__fecha_venta__lt=_inicio_dia(hasta + timedelta(days=1)))
+             .annotate(dia=TruncDate('venta__fecha_venta', tzinfo=tz))
+             .values('dia', 'producto', 'producto__categoria')
+             .annotate(unidades=Sum('cantidad'),
+                       importe=Sum(F('cantidad') * F('precio_unitario'),
+                                   output_field=DecimalField(max_digits=12, decimal_places=2)))
+             .order_by())
+    hechos = [
+        VentaProductoDia(fecha=f['dia'], producto_id=f['producto'], categoria_id=f['producto__categoria'],
+                         cantidad=f['unidades'], ingreso=f['importe'])
+        for f in filas
+    ]
+    with transaction.atomic():
+        VentaProductoDia.objects.filter(fecha__range=(desde, hasta)).delete()
+        VentaProductoDia.objects.bulk_create(hechos, batch_size=1000)
+    return len(hechos)
+
+
+def consolidar(desde, hasta):
+    """Reconstruye ambas tablas de hechos; devuelve cuántas filas cargó en cada una."""
+    return consolidar_noches(desde, hasta), consolidar_ventas(desde, hasta)
+
+
+# =======================
+# REPORTES
+# =======================
+def _periodo_de(dia, periodo):
+    if periodo == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    if periodo == 'mes':
+        return dia.replace(day=1)
+    return dia
+
+
+def _trunc(periodo):
+    if periodo == 'semana':
+        return TruncWeek('fecha')
+    if periodo == 'mes':
+        return TruncMonth('fecha')
+    return F('fecha')
+
+
+def _dias_por_periodo(desde, hasta, periodo):
+    """``{inicio_del_periodo: días del rango que caen en él}``, en orden."""
+    dias = {}
+    dia = desde
+    while dia <= hasta:
+        p = _periodo_de(dia, periodo)
+        dias[p] = dias.get(p, 0) + 1
+        dia += timedelta(days=1)
+    return dias
+
+
+def _cociente(a, b):
+    return (Decimal(a) / b).quantize(_CENTAVO) if b else None
+
+
+def ocupacion(desde, hasta, periodo='dia', por=None):
+    """
+    Ocupación, ADR y RevPAR por periodo (y por tipo o piso si ``por`` lo pide).
+
+    Devuelve filas ``{'periodo', 'grupo', 'vendidas', 'disponibles',
+    'ocupacion', 'ingreso', 'adr', 'revpar'}``; ``ocupacion`` es un porcentaje.
+    """
+    campo, etiqueta = AGRUPACIONES.get(por, (None, None))
+
+    inventario = Habitacion.objects.filter(activo=True)
+    if campo:
+        inventario = inventario.values(campo, etiqueta).annotate(n=Count('pk')).order_by(etiqueta)
+        habitaciones = {i[campo]: i['n'] for i in inventario}
+        nombres = {i[campo]: i[etiqueta] for i in inventario}
+    else:
+        habitaciones, nombres = {None: inventario.count()}, {None: 'Total'}
+
+    hechos = (NocheHabitacion.objects
+              .filter(fecha__range=(desde, hasta))
+              .annotate(periodo=_trunc(periodo))
+              .values('periodo', *([campo, etiqueta] if campo else []))
+              .annotate(vendidas=Count('pk'), ingreso=Sum('ingreso'))
+              .order_by())
+    vendidas = defaultdict(lambda: (0, Decimal('0.00')))
+    for h in hechos:
+        grupo = h[campo] if campo else None
+        nombres.setdefault(grupo, h[etiqueta] if campo else 'Total')
+        vendidas[(h['periodo'], grupo)] = (h['vendidas'], h['ingreso'])
+
+    filas = []
+    for p, dias in _dias_por_periodo(desde, hasta, periodo).items():
+        for grupo, nombre in nombres.items():
+            n, ingreso = vendidas[(p, grupo)]
+            disponibles = habitaciones.get(grupo, 0) * dias
+            ocup = _cociente(n * 100, disponibles)
+            filas.append({
+                'periodo': p, 'grupo': nombre, 'vendidas': n, 'disponibles': disponibles,
+                'ocupacion': ocup, 'ingreso': ingreso,
+                'adr': _cociente(ingreso, n), 'revpar': _cociente(ingreso, disponibles),
+            })
+    return filas
+
+
+def ventas_por_categoria(desde, hasta, periodo='dia'):
+    """Unidades e ingreso por periodo y categoría de producto."""
+    filas = (VentaProductoDia.objects
+             .filter(fecha__range=(desde, hasta))
+             .annotate(periodo=_trunc(periodo))
+             .values('periodo', 'categoria__nombre')
+             .annotate(cantidad=Sum('cantidad'), ingreso=Sum('ingreso'))
+             .order_by('periodo', 'categoria__nombre'))
+    return [
+        {'periodo': f['periodo'], 'categoria': f['categoria__nombre'] or 'Sin categoría',
+         'cantidad': f['cantidad'], 'ingreso': f['ingreso']}
+        for f in filas
+    ]
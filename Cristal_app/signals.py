@@ -0,0 +1,234 @@
+# Cristal_app/signals.py
+"""
+Receptores que mantienen coherentes las cachés de la app.
+
+Se conectan en ``CristalAppConfig.ready``.
+"""
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import disponibilidad, imagenes, layout, opciones, permisos, push, recepcion
+from .models import Piso, Habitacion, Reserva, TipoHabitacion, Cliente, Producto, CustomUser
+
+
+# =======================
+# TABLERO DE RECEPCIÓN
+# =======================
+@receiver(post_init, sender=Habitacion)
+def _recordar_piso_habitacion(sender, instance, **kwargs):
+    # Guardamos el piso con el que se cargó para invalidar también el piso
+    # de origen cuando una habitación se mueve de piso.
+    instance._piso_id_inicial = instance.__dict__.get('piso_id')
+
+
+@receiver(post_save, sender=Habitacion)
+@receiver(post_delete, sender=Habitacion)
+def _habitacion_cambiada(sender, instance, signal, **kwargs):
+    recepcion.invalidar_piso(instance.piso_id)
+    anterior = getattr(instance, '_piso_id_inicial', None)
+    if anterior != instance.piso_id:
+        recepcion.invalidar_piso(anterior)
+        recepcion.registrar_cambio(anterior, baja=True)
+    instance._piso_id_inicial = instance.piso_id
+    if signal is post_save:
+        recepcion.registrar_cambio(instance.piso_id, habitaciones=[instance.pk])
+    else:
+        recepcion.registrar_cambio(instance.piso_id, baja=True)
+    push.publicar_habitacion(instance)
+
+
+def piso_de_reserva(reserva):
+    """Piso de la habitación de una reserva, sin consultar si ya está cargada."""
+    if Reserva.habitacion.is_cached(reserva):
+        return reserva.habitacion.piso_id
+    return piso_de_habitacion(reserva.habitacion_id)
+
+
+def piso_de_habitacion(habitacion_id):
+    return (Habitacion.objects
+            .filter(pk=habitacion_id)
+            .values_list('piso_id', flat=True)
+            .first())
+
+
+@receiver(post_init, sender=Reserva)
+def _recordar_habitacion_reserva(sender, instance, **kwargs):
+    # Como en Habitacion: al cambiar de habitación hay que avisar también al
+    # piso de origen, que deja de tener la reserva.
+    instance._habitacion_id_inicial = instance.__dict__.get('habitacion_id')
+
+
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+def _reserva_cambiada(sender, instance, signal, **kwargs):
+    piso_id = piso_de_reserva(instance)
+    recepcion.invalidar_piso(piso_id)
+    anterior = getattr(instance, '_habitacion_id_inicial', None)
+    if anterior is not None and anterior != instance.habitacion_id:
+        piso_anterior = piso_de_habitacion(anterior)
+        if piso_anterior != piso_id:
+            recepcion.invalidar_piso(piso_anterior)
+            recepcion.registrar_cambio(piso_anterior, baja=True)
+    instance._habitacion_id_inicial = instance.habitacion_id
+    if signal is post_save:
+        recepcion.registrar_cambio(piso_id, reservas=[instance.pk])
+    else:
+        recepcion.registrar_cambio(piso_id, baja=True)
+    push.publicar_reserva(instance, piso_id)
+
+
+@receiver(post_save, sender=Reserva)
+def _reserva_activa_cambiada(sender, instance, created, update_fields=None, **kwargs):
+    # Los consumos solo tocan costos; el borrado lo cubre on_delete=SET_NULL
+    if update_fields is None or {'habitacion', 'estado'} & set(update_fields):
+        recepcion.sincronizar_reserva_activa(instance, created)
+
+
+@receiver(post_save, sender=Piso)
+@receiver(post_delete, sender=Piso)
+@receiver(post_save, sender=TipoHabitacion)
+@receiver(post_delete, sender=TipoHabitacion)
+def _estructura_cambiada(sender, instance, **kwargs):
+    recepcion.invalidar_todo()
+
+
+@receiver(post_save, sender=Cliente)
+def _cliente_cambiado(sender, instance, created, **kwargs):
+    # Un cliente nuevo aún no aparece en el tablero; uno editado sí puede.
+    if not created:
+        recepcion.invalidar_todo()
+
+
+# =======================
+# CATÁLOGO DE CONSUMOS
+# =======================
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def _producto_cambiado(sender, instance, created=False, **kwargs):
+    # Cualquier cambio de stock, precio o estado del producto cambia el catálogo
+    recepcion.invalidar_catalogo()
+    opciones.invalidar()
+    # Los snapshots del tablero llevan los nombres de los productos consumidos;
+    # uno nuevo aún no aparece en ninguno
+    if not created:
+        recepcion.invalidar_todo()
+
+
+# =======================
+# IMÁGENES DE PRODUCTO
+# =======================
+@receiver(pre_save, sender=Producto)
+def _huella_imagen(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'imagen' not in update_fields:
+        return
+    if not instance.imagen:
+        instance.imagen_huella = ''
+    elif not instance.imagen._committed:
+        # Archivo recién subido; los anteriores los cubre regenerar_imagenes
+        instance.imagen_huella = imagenes.huella(instance.imagen)
+
+
+@receiver(post_save, sender=Producto)
+def _generar_miniaturas(sender, instance, update_fields=None, **kwargs):
+    if instance.imagen_huella and (update_fields is None or 'imagen' in update_fields):
+        transaction.on_commit(lambda: imagenes.generar_o_registrar(instance))
+
+
+# =======================
+# DISPONIBILIDAD
+# =======================
+_CAMPOS_OCUPACION = {'habitacion', 'fecha_entrada', 'fecha_salida', 'estado'}
+
+
+def _rango_reserva(reserva):
+    """``(fecha_entrada, fecha_salida)`` en memoria, o None si alguna no se cargó (only/defer)."""
+    try:
+        return reserva.__dict__['fecha_entrada'], reserva.__dict__['fecha_salida']
+    except KeyError:
+        return None
+
+
+@receiver(post_init, sender=Reserva)
+def _recordar_rango_reserva(sender, instance, **kwargs):
+    # Rango con el que se cargó: al cambiar las fechas hay que invalidar
+    # también las noches que la reserva deja libres.
+    instance._rango_inicial = _rango_reserva(instance)
+
+
+def _invalidar_noches(reserva):
+    rangos = [getattr(reserva, '_rango_inicial', None), _rango_reserva(reserva)]
+    if None in rangos:
+        # Sin las fechas no se sabe qué noches ocupaba: se descartan todas
+        disponibilidad.invalidar()
+    else:
+        # Una reserva recién construida aún no tenía rango (fecha_salida None)
+        disponibilidad.invalidar_rangos({r for r in rangos if None not in r})
+    reserva._rango_inicial = _rango_reserva(reserva)
+
+
+@receiver(post_save, sender=Reserva)
+def _reserva_guardada_disponibilidad(sender, instance, update_fields=None, **kwargs):
+    # Los consumos solo tocan costos; no cambian qué habitación está ocupada
+    if update_fields is None or _CAMPOS_OCUPACION & set(update_fields):
+        _invalidar_noches(instance)
+
+
+@receiver(post_delete, sender=Reserva)
+def _reserva_borrada_disponibilidad(sender, instance, **kwargs):
+    _invalidar_noches(instance)
+
+
+# =======================
+# PERMISOS
+# =======================
+_M2M_CAMBIO = {'post_add', 'post_remove', 'post_clear'}
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def _accesos_usuario_cambiados(sender, instance, action, reverse, **kwargs):
+    if action not in _M2M_CAMBIO:
+        return
+    if reverse:
+        # Desde el rol o el permiso (group.user_set...): afecta a varios usuarios
+        permisos.invalidar_grupos()
+    else:
+        permisos.invalidar_usuario(instance.pk)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def _permisos_rol_cambiados(sender, action, **kwargs):
+    if action in _M2M_CAMBIO:
+        permisos.invalidar_grupos()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def _rol_borrado(sender, instance, **kwargs):
+    permisos.invalidar_grupos()
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_migrate)
+def _permisos_cambiados(sender, **kwargs):
+    # migrate crea los permisos con bulk_create, sin post_save
+    opciones.invalidar_permisos()
+
+
+@receiver(post_save, sender=CustomUser)
+def _usuario_guardado(sender, instance, created, update_fields=None, **kwargs):
+    # Cada login guarda last_login; eso no cambia los permisos
+    if not created and update_fields != frozenset({'last_login'}):
+        permisos.invalidar_usuario(instance.pk)
+
+
+# =======================
+# LAYOUT
+# =======================
+@receiver(post_migrate)
+def _layout_desplegado(sender, **kwargs):
+    # Un deploy puede traer otro menú; los fragmentos por rol se descartan
+    layout.invalidar()
@@ -0,0 +1,408 @@
+# Cristal_app/sintetico.py
+"""
+Datos sintéticos de un hotel para medir rendimiento.
+
+``generar()`` llena una base vacía con pisos, tipos y habitaciones, clientes,
+años de reservas (con pagos, acompañantes y consumos) y productos con su
+historial de compras y ventas, a la escala elegida en ``ESCALAS``. Todo sale
+de un ``random.Random(semilla)``: con la misma escala, semilla y fecha final
+se obtiene el mismo conjunto de datos, así cada cambio de rendimiento se mide
+sobre la misma forma de datos (``manage.py generar_datos``).
+
+La historia se recorre día por día: cada habitación libre recibe un check-in
+con una probabilidad que apunta a ``Escala.ocupacion`` (más alta el fin de
+semana), las estadías pasadas quedan FINALIZADA (algunas CANCELADA), las que
+cruzan la fecha final ACTIVA y las posteriores PENDIENTE. El stock se lleva en
+memoria: las compras semanales reponen lo vendido y ninguna venta deja stock
+negativo. Las filas se insertan por lotes con ``COPY`` en PostgreSQL
+(``bulk_create`` en otros motores) y al final se reconstruyen los datos
+derivados (stock, reserva activa, acumulados y tablas de hechos) como si se
+hubieran cargado desde la app.
+"""
+import io
+import random
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import disponibilidad, estadisticas, opciones, recepcion, reportes
+from .models import (
+    Acompanante, Categoria, Cliente, Compra, CustomUser, DetalleCompra, DetalleVenta, Habitacion,
+    MovimientoStock, Pago, Piso, Producto, Proveedor, Reserva, TipoHabitacion, TipoPago, Venta,
+)
+
+# pisos, habitaciones por piso, clientes, productos, días de historia y ocupación media
+Escala = namedtuple('Escala', 'pisos habitaciones_por_piso clientes productos dias ocupacion')
+
+ESCALAS = {
+    'chica': Escala(3, 10, 500, 40, 180, 0.6),
+    'mediana': Escala(6, 20, 5000, 120, 730, 0.65),
+    # unos 230 mil reservas y más de un millón de filas en total
+    'grande': Escala(10, 50, 50000, 300, 1825, 0.65),
+}
+
+# Filas por INSERT o COPY (y por transacción)
+LOTE = 5000
+
+TIPOS_HABITACION = [
+    # nombre, proporción de habitaciones, precio base por noche
+    ('Simple', 0.3, 120),
+    ('Doble', 0.35, 180),
+    ('Matrimonial', 0.25, 220),
+    ('Suite', 0.1, 400),
+]
+TIPOS_PAGO = ['Efectivo', 'Tarjeta', 'Transferencia', 'QR']
+# noches: peso
+NOCHES = {1: 35, 2: 25, 3: 15, 4: 10, 5: 6, 6: 4, 7: 5}
+CATALOGO = {
+    'Bebidas': [('Agua mineral', 6), ('Gaseosa', 8), ('Jugo', 10), ('Cerveza', 18), ('Café', 7), ('Té', 5)],
+    'Snacks': [('Papas fritas', 9), ('Maní', 6), ('Galletas', 5), ('Chocolate', 12), ('Barra de cereal', 7)],
+    'Higiene': [('Cepillo dental', 10), ('Pasta dental', 12), ('Shampoo', 15), ('Jabón', 6), ('Afeitadora', 14)],
+    'Minibar': [('Vino', 85), ('Whisky', 45), ('Singani', 35), ('Frutos secos', 22)],
+}
+MARCAS = ['Andina', 'Illimani', 'Sajama', 'Titicaca', 'Altiplano', 'Del Valle']
+NOMBRES = [
+    'Ana', 'Carlos', 'María', 'José', 'Lucía', 'Juan', 'Elena', 'Luis', 'Rosa', 'Jorge',
+    'Carmen', 'Pedro', 'Sofía', 'Miguel', 'Patricia', 'Diego', 'Valeria', 'Marco', 'Gabriela', 'Raúl',
+]
+APELLIDOS = [
+    'Quispe', 'Mamani', 'Flores', 'Rojas', 'Vargas', 'Gutiérrez', 'Choque', 'Condori', 'López', 'Torrez',
+    'Fernández', 'Pérez', 'Romero', 'Limachi', 'Aguilar', 'Cruz', 'Morales', 'Ticona', 'Salazar', 'Apaza',
+]
+
+_CENTAVO = Decimal('0.01')
+
+
+@contextmanager
+def _fechas_historicas():
+    """Deja escribir fechas pasadas en los campos ``auto_now_add`` mientras se carga."""
+    campos = [Reserva._meta.get_field('fecha_creacion'), Pago._meta.get_field('fecha_pago'),
+              Venta._meta.get_field('fecha_venta'), Compra._meta.get_field('fecha_compra')]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+_ESCAPES_COPY = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _fila_copy(obj):
+    """Línea de ``obj`` en el formato de texto de ``COPY`` (todas las columnas)."""
+    valores = []
+    for campo in obj._meta.concrete_fields:
+        # Como bulk_create: la FK toma la pk del objeto relacionado insertado antes
+        if campo.is_relation and getattr(obj, campo.attname) is None and campo.is_cached(obj):
+            relacionado = campo.get_cached_value(obj)
+            if relacionado is not None:
+                setattr(obj, campo.attname, relacionado.pk)
+        valor = campo.get_db_prep_save(campo.pre_save(obj, True), connection)
+        valores.append(r'\N' if valor is None else str(valor).translate(_ESCAPES_COPY))
+    return '\t'.join(valores) + '\n'
+
+
+def _copiar(modelo, objs):
+    """
+    ``bulk_create`` con ``COPY ... FROM STDIN`` (PostgreSQL). COPY no devuelve
+    las pk: se toman antes de la secuencia de la tabla para que las filas que
+    dependen de estas (pagos de una reserva, movimientos de una venta) las
+    conozcan.
+    """
+    meta = modelo._meta
+    tabla = connection.ops.quote_name(meta.db_table)
+    with connection.cursor() as cursor:
+        # El nombre de la tabla va entre comillas: sin ellas PostgreSQL lo pasa a minúsculas
+        cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                       [tabla, meta.pk.column, len(objs)])
+        for obj, (pk,) in zip(objs, cursor.fetchall()):
+            obj.pk = pk
+        filas = io.StringIO(''.join(_fila_copy(obj) for obj in objs))
+        columnas = ', '.join(connection.ops.quote_name(c.column) for c in meta.concrete_fields)
+        sql = f'COPY {tabla} ({columnas}) FROM STDIN'
+        crudo = cursor.cursor
+        if hasattr(crudo, 'copy_expert'):
+            crudo.copy_expert(sql, filas)  # psycopg2
+        else:
+            with crudo.copy(sql) as copia:  # psycopg 3
+                copia.write(filas.getvalue())
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+
+
+class _Carga:
+    """Buffers de filas pendientes, insertados en orden de dependencias."""
+
+    ORDEN = [Venta, DetalleVenta, Reserva, Pago, Acompanante, Compra, DetalleCompra]
+
+    def __init__(self, lote):
+        self.lote = lote
+        self.filas = {modelo: [] for modelo in self.ORDEN}
+        # (documento, producto_id, cantidad, origen, fecha): el documento aún no tiene pk
+        self.movimientos = []
+        self.totales = {modelo: 0 for modelo in [*self.ORDEN, MovimientoStock]}
+
+    def agregar(self, obj):
+        self.filas[type(obj)].append(obj)
+
+    def mover(self, documento, producto_id, cantidad, origen, fecha):
+        self.movimientos.append((documento, producto_id, cantidad, origen, fecha))
+
+    def llena(self):
+        return sum(map(len, self.filas.values())) + len(self.movimientos) >= self.lote
+
+    def insertar(self, modelo, objs):
+        if connection.vendor == 'postgresql':
+            _copiar(modelo, objs)
+        else:
+            modelo.objects.bulk_create(objs, batch_size=self.lote)
+
+    def volcar(self):
+        with transaction.atomic():
+            for modelo in self.ORDEN:
+                if self.filas[modelo]:
+                    self.insertar(modelo, self.filas[modelo])
+                    self.totales[modelo] += len(self.filas[modelo])
+                    self.filas[modelo] = []
+            if self.movimientos:
+                self.insertar(MovimientoStock, [
+                    MovimientoStock(producto_id=pid, cantidad=cantidad, origen=origen,
+                                    documento_id=documento.pk, fecha=fecha, compactado=True)
+                    for documento, pid, cantidad, origen, fecha in self.movimientos
+                ])
+                self.totales[MovimientoStock] += len(self.movimientos)
+                self.movimientos = []
+
+
+class _Generador:
+
+    def __init__(self, escala, semilla, hasta, usuario, lote):
+        self.escala = escala
+        self.rng = random.Random(semilla)
+        self.usuario = usuario
+        self.carga = _Carga(lote)
+        self.tz = timezone.get_current_timezone()
+        self.hasta = hasta
+        self.desde = hasta - timedelta(days=escala.dias - 1)
+        # Las estadías que cruzan este instante quedan ACTIVA
+        self.corte = min(timezone.now(), self.instante(hasta + timedelta(days=1), 0))
+        noches_medias = sum(n * p for n, p in NOCHES.items()) / sum(NOCHES.values())
+        # Una habitación se puede volver a ocupar el día del checkout: con
+        # probabilidad p por día quedan en promedio (1 - p) / p días libres
+        self.prob_checkin = escala.ocupacion / (escala.ocupacion + noches_medias * (1 - escala.ocupacion))
+
+    def instante(self, dia, hora, minuto=0):
+        return timezone.make_aware(datetime.combine(dia, time(hora, minuto)), self.tz)
+
+    def precio(self, base, variacion=0.1):
+        factor = Decimal(str(round(self.rng.uniform(1 - variacion, 1 + variacion), 2)))
+        return (Decimal(base) * factor).quantize(_CENTAVO)
+
+    # ----- catálogos -----
+    def crear_estructura(self):
+        e, rng = self.escala, self.rng
+        tipos = {nombre: TipoHabitacion.objects.get_or_create(nombre=nombre)[0] for nombre, _, _ in TIPOS_HABITACION}
+        self.tipos_pago = [TipoPago.objects.get_or_create(nombre=nombre)[0] for nombre in TIPOS_PAGO]
+        pisos = Piso.objects.bulk_create(Piso(numero=n) for n in range(1, e.pisos + 1))
+        ancho = max(2, len(str(e.habitaciones_por_piso)))
+        nombres, pesos = zip(*((n, p) for n, p, _ in TIPOS_HABITACION))
+        base = {n: precio for n, _, precio in TIPOS_HABITACION}
+        habitaciones = []
+        for piso in pisos:
+            for i in range(1, e.habitaciones_por_piso + 1):
+                tipo = rng.choices(nombres, pesos)[0]
+                habitaciones.append(Habitacion(numero=f'{piso.numero}{i:0{ancho}d}', piso=piso, tipo=tipos[tipo],
+                                               precio_noche=self.precio(base[tipo]).quantize(Decimal('1'))))
+        self.habitaciones = Habitacion.objects.bulk_create(habitaciones)
+
+        inicio = self.instante(self.desde, 9)
+        self.clientes = Cliente.objects.bulk_create((
+            Cliente(dni=f'{1000000 + i:08d}', nombrecompleto=self.nombre(),
+                    telefono=f'7{rng.randrange(10 ** 7):07d}',
+                    fecha_creacion=inicio - timedelta(days=rng.randrange(365)))
+            for i in range(e.clientes)
+        ), batch_size=self.carga.lote)
+
+        categorias = {nombre: Categoria.objects.get_or_create(nombre=nombre)[0] for nombre in CATALOGO}
+        surtido = [(cat, f'{base} {marca}', precio) for marca in MARCAS
+                   for cat, items in CATALOGO.items() for base, precio in items]
+        productos = []
+        for i in range(e.productos):
+            cat, nombre, precio = surtido[i % len(surtido)]
+            vuelta = i // len(surtido)
+            productos.append(Producto(nombre=f'{nombre} {vuelta + 1}' if vuelta else nombre,
+                                      categoria=categorias[cat], precio_venta=self.precio(precio)))
+        self.productos = Producto.objects.bulk_create(productos)
+        self.proveedores = Proveedor.objects.bulk_create(
+            Proveedor(nombre=f'Distribuidora {marca}') for marca in MARCAS)
+        # Stock objetivo tras cada reposición, proporcional a la demanda esperada
+        objetivo = max(10, len(self.habitaciones) // 2)
+        self.objetivo = {p.pk: objetivo for p in self.productos}
+        self.stock = {p.pk: 0 for p in self.productos}
+
+    def nombre(self):
+        rng = self.rng
+        return f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}'
+
+    # ----- movimientos -----
+    def vender(self, cuando, cliente, maximo_lineas, origen):
+        """Una venta de 1 a ``maximo_lineas`` productos con stock; None si no hay."""
+        rng = self.rng
+        lineas = {}
+        for producto in rng.sample(self.productos, min(rng.randint(1, maximo_lineas), len(self.productos))):
+            cantidad = min(rng.randint(1, 3), self.stock[producto.pk])
+            if cantidad:
+                lineas[producto] = cantidad
+        if not lineas:
+            return None
+        venta = Venta(cliente=cliente, usuario=self.usuario, fecha_venta=cuando, total_venta=Decimal('0.00'))
+        self.carga.agregar(venta)
+        for producto, cantidad in lineas.items():
+            self.stock[producto.pk] -= cantidad
+            venta.total_venta += producto.precio_venta * cantidad
+            self.carga.agregar(DetalleVenta(venta=venta, producto=producto, cantidad=cantidad,
+                                            precio_unitario=producto.precio_venta))
+            self.carga.mover(venta, producto.pk, -cantidad, origen, cuando)
+        return venta
+
+    def comprar(self, dia):
+        """Repone hasta el objetivo todo lo que bajó de la mitad, una compra por proveedor."""
+        faltantes = [p for p in self.productos if self.stock[p.pk] < self.objetivo[p.pk] // 2]
+        cuando = self.instante(dia, 9, self.rng.randrange(60))
+        for i, proveedor in enumerate(self.proveedores):
+            propios = faltantes[i::len(self.proveedores)]
+            if not propios:
+                continue
+            compra = Compra(proveedor=proveedor, usuario=self.usuario, fecha_compra=cuando,
+                            total_compra=Decimal('0.00'))
+            self.carga.agregar(compra)
+            for producto in propios:
+                cantidad = self.objetivo[producto.pk] - self.stock[producto.pk]
+                costo = (producto.precio_venta * Decimal('0.6')).quantize(_CENTAVO)
+                self.stock[producto.pk] += cantidad
+                compra.total_compra += costo * cantidad
+                self.carga.agregar(DetalleCompra(compra=compra, producto=producto, cantidad=cantidad,
+                                                 costo_unitario=costo))
+                self.carga.mover(compra, producto.pk, cantidad, 'COMPRA', cuando)
+
+    # ----- estadías -----
+    def checkin(self, habitacion, dia):
+        rng = self.rng
+        entrada = self.instante(dia, rng.randint(13, 21), rng.randrange(60))
+        noches = rng.choices(list(NOCHES), list(NOCHES.values()))[0]
+        salida = self.instante(dia + timedelta(days=noches), disponibilidad.HORA_CHECKOUT - rng.randint(0, 2),
+                               rng.randrange(60))
+        if entrada > self.corte:
+            estado = 'PENDIENTE'
+        elif salida > self.corte:
+            estado = 'ACTIVA'
+        else:
+            estado = 'CANCELADA' if rng.random() < 0.04 else 'FINALIZADA'
+
+        descuento = Decimal(rng.choice((5, 10, 15))) if rng.random() < 0.1 else Decimal('0')
+        costo_habitacion = habitacion.precio_noche * noches
+        reserva = Reserva(
+            habitacion=habitacion, cliente=rng.choice(self.clientes), estado=estado,
+            fecha_entrada=entrada, fecha_salida=salida, fecha_creacion=min(entrada, self.corte),
+            descuento_porcentaje=descuento, costo_habitacion=costo_habitacion, costo_productos=Decimal('0.00'),
+            costo_total=(costo_habitacion * (100 - descuento) / 100).quantize(_CENTAVO),
+        )
+        if estado in ('ACTIVA', 'FINALIZADA') and rng.random() < 0.35:
+            fin = min(salida, self.corte)
+            cuando = entrada + (fin - entrada) * rng.random()
+            venta = self.vender(cuando, reserva.cliente, 3, 'CONSUMO')
+            if venta is not None:
+                reserva.venta = venta
+                reserva.costo_productos = venta.total_venta
+                reserva.costo_total += venta.total_venta
+        self.carga.agregar(reserva)
+
+        pagado = {'FINALIZADA': reserva.costo_total, 'ACTIVA': reserva.costo_total / 2}.get(estado, Decimal('0'))
+        self.carga.agregar(Pago(reserva=reserva, tipo_pago=rng.choice(self.tipos_pago),
+                                monto_recibido=pagado.quantize(_CENTAVO), fecha_pago=min(entrada, self.corte)))
+        for _ in range(rng.choices((0, 1, 2, 3), (45, 35, 15, 5))[0]):
+            self.carga.agregar(Acompanante(reserva=reserva, nombre_completo=self.nombre(),
+                                           dni=f'{rng.randrange(10 ** 7, 10 ** 8)}'))
+        return salida
+
+    def recorrer(self):
+        rng = self.rng
+        libre_desde = {h.pk: self.desde for h in self.habitaciones}
+        ventas_por_dia = max(1, len(self.habitaciones) // 10)
+        # Reservas futuras: hasta 60 días, cada vez menos probables
+        dia, fin = self.desde, self.hasta + timedelta(days=60)
+        while dia <= fin:
+            if dia == self.desde or (dia <= self.hasta and dia.weekday() == 0):
+                self.comprar(dia)
+            futuro = max((dia - self.hasta).days, 0)
+            prob = self.prob_checkin * (1.25 if dia.weekday() >= 4 else 0.9) * (1 - futuro / 61)
+            for habitacion in self.habitaciones:
+                if libre_desde[habitacion.pk] <= dia and rng.random() < prob:
+                    libre_desde[habitacion.pk] = timezone.localdate(self.checkin(habitacion, dia), self.tz)
+            if dia <= self.hasta:
+                for _ in range(rng.randint(0, ventas_por_dia)):
+                    cuando = self.instante(dia, rng.randint(8, 22), rng.randrange(60))
+                    if cuando <= self.corte:
+                        cliente = rng.choice(self.clientes) if rng.random() < 0.5 else None
+                        self.vender(cuando, cliente, 4, 'VENTA')
+            if self.carga.llena():
+                self.carga.volcar()
+            dia += timedelta(days=1)
+        self.carga.volcar()
+
+    def derivar(self):
+        """Stock, reserva activa, acumulados y tablas de hechos de lo cargado."""
+        for producto in self.productos:
+            producto.stock = self.stock[producto.pk]
+        Producto.objects.bulk_update(self.productos, ['stock'], batch_size=self.carga.lote)
+        recepcion.reparar_reservas_activas()
+        Habitacion.objects.filter(reserva_activa__isnull=False).update(estado='OCUPADA')
+        estadisticas.recalcular()
+        reportes.consolidar(self.desde, self.hasta)
+        # bulk_create no dispara las señales que invalidan las cachés
+        recepcion.invalidar_todo()
+        recepcion.invalidar_catalogo()
+        disponibilidad.invalidar()
+        opciones.invalidar()
+
+
+def usuario_sintetico():
+    """Usuario (inactivo, sin contraseña) al que se atribuyen compras y ventas generadas."""
+    usuario, creado = CustomUser.objects.get_or_create(username='sintetico', defaults={'is_active': False})
+    if creado:
+        usuario.set_unusable_password()
+        usuario.save(update_fields=['password'])
+    return usuario
+
+
+def ocupadas():
+    """Tablas con claves únicas que ya tienen datos; ``generar`` necesita que estén vacías."""
+    return [m.__name__ for m in (Piso, Habitacion, Cliente, Producto, Reserva)
+            if m.objects.exists()]
+
+
+def generar(escala, semilla=1, hasta=None, usuario=None, lote=LOTE):
+    """
+    Carga el conjunto de datos de ``escala`` (una ``Escala``) que termina en
+    ``hasta`` (por defecto hoy). Devuelve ``{modelo: filas insertadas}``.
+    """
+    generador = _Generador(escala, semilla, hasta or timezone.localdate(), usuario or usuario_sintetico(), lote)
+    with _fechas_historicas():
+        generador.crear_estructura()
+        generador.recorrer()
+    generador.derivar()
+    return {
+        Piso: escala.pisos,
+        Habitacion: len(generador.habitaciones),
+        Cliente: len(generador.clientes),
+        Producto: len(generador.productos),
+        Proveedor: len(generador.proveedores),
+        **generador.carga.totales,
+    }
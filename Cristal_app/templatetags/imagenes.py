@@ -0,0 +1,25 @@
+from django import template
+from django.utils.html import format_html
+
+from Cristal_app import imagenes
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagen_producto(producto, ancho):
+    """``<picture>`` con las miniaturas WebP/JPEG de ``producto`` para ``ancho`` px de CSS."""
+    if not producto.imagen:
+        return ''
+    if not producto.imagen_huella:
+        # Aún sin miniaturas (pendiente de regenerar_imagenes): el original
+        return format_html('<img src="{}" alt="{}" width="{}" loading="lazy">',
+                           producto.imagen.url, producto.nombre, ancho)
+    existen = imagenes.generadas(producto.imagen_huella)
+    webp, jpeg = (imagenes.srcset(producto, formato, existen) for formato in ('webp', 'jpeg'))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}px">'
+        '<img src="{}" srcset="{}" sizes="{}px" alt="{}" width="{}" loading="lazy" decoding="async"></picture>',
+        webp, ancho, imagenes.url(producto.imagen_huella, imagenes.ANCHOS[0], 'jpeg', existen),
+        jpeg, ancho, producto.nombre, ancho,
+    )
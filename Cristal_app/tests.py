@@ -1,3 +1,1914 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import os
+import tempfile
+import zipfile
+import threading
+from unittest import mock
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import CacheHandler, cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.templatetags.static import static
+from django.contrib.messages import get_messages
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.http import JsonResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from Cristal.caches import configurar_caches
+
+from . import (
+    consultas, disponibilidad, estadisticas, estaticos, imagenes, importar, indices, inventario, layout, opciones, permisos, push, recepcion, reportes, sintetico,
+)
+from . import urls as app_urls
+from .forms import CustomUserChangeForm, DetalleVentaFormSet, ReservaForm
+from .views import IMPORTAR_REPORTE_KEY, VentaListView
+from .models import (
+    Piso, Habitacion, Reserva, Cliente, TipoHabitacion, TipoPago, Producto, Venta,
+    Categoria, MovimientoStock, Proveedor, Compra, DetalleCompra, DetalleVenta, EstadisticaDiaria,
+    NocheHabitacion, VentaProductoDia, Pago, Acompanante,
+)
+
+User = get_user_model()
+
+
+class CanalSuscriptor:
+    """Suscribe una cola al canal en memoria desde un event loop propio."""
+
+    def __init__(self, grupo):
+        self.loop = asyncio.new_event_loop()
+        self.grupo = grupo
+        self.cola = self.loop.run_until_complete(self._suscribir())
+
+    async def _suscribir(self):
+        return push.get_canal().suscribir(self.grupo)
+
+    def recibidos(self):
+        async def _vaciar():
+            await asyncio.sleep(0)
+            mensajes = []
+            while not self.cola.empty():
+                mensajes.append(self.cola.get_nowait())
+            return mensajes
+        return self.loop.run_until_complete(_vaciar())
+
+    def cerrar(self):
+        push.get_canal().desuscribir(self.grupo, self.cola)
+        self.loop.close()
+
+
+class RecepcionPushTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        cls.piso = Piso.objects.create(numero=1)
+        cls.hab = Habitacion.objects.create(numero='101', piso=cls.piso, precio_noche=100, estado='OCUPADA')
+        cls.cliente = Cliente.objects.create(dni='1234567', nombrecompleto='Ana Pérez')
+        cls.reserva = Reserva.objects.create(
+            habitacion=cls.hab, cliente=cls.cliente, estado='ACTIVA',
+            fecha_salida=timezone.now() + timedelta(days=1),
+        )
+
+    def setUp(self):
+        self.sub = CanalSuscriptor(push.grupo_piso(self.piso.pk))
+        self.addCleanup(self.sub.cerrar)
+
+    def test_publicar_desde_otro_hilo(self):
+        hilo = threading.Thread(
+            target=push.get_canal().publicar,
+            args=(push.grupo_piso(self.piso.pk), {'tipo': 'habitacion'}),
+        )
+        hilo.start()
+        hilo.join()
+        self.assertEqual(self.sub.recibidos(), [{'tipo': 'habitacion'}])
+
+    def test_checkout_publica_transicion(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('checkout_habitacion', args=[self.hab.pk]))
+
+        mensajes = self.sub.recibidos()
+        self.assertIn(
+            {'tipo': 'habitacion', 'habitacion': self.hab.pk, 'numero': '101', 'estado': 'LIMPIEZA'},
+            mensajes,
+        )
+        self.assertIn('FINALIZADA', [m['estado'] for m in mensajes if m['tipo'] == 'reserva'])
+
+    def test_nada_se_publica_sin_commit(self):
+        self.hab.estado = 'LIMPIEZA'
+        self.hab.save()
+        self.assertEqual(self.sub.recibidos(), [])
+
+
+class RecepcionEventosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        cls.piso = Piso.objects.create(numero=2)
+
+    async def test_stream_sse(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('recepcion_eventos', args=[self.piso.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        contenido = aiter(response.streaming_content)
+        self.assertEqual(await anext(contenido), b'retry: 3000\n\n')
+
+        push.get_canal().publicar(push.grupo_piso(self.piso.pk), {'tipo': 'habitacion', 'estado': 'DISPONIBLE'})
+        evento = await asyncio.wait_for(anext(contenido), timeout=1)
+        self.assertEqual(evento, b'event: habitacion\ndata: {"tipo": "habitacion", "estado": "DISPONIBLE"}\n\n')
+
+
+    def test_bajo_wsgi_rechaza_el_stream(self):
+        # un EventSource abierto ocuparía un hilo para siempre; con 204 deja de reconectar
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('recepcion_eventos', args=[self.piso.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+        response = self.client.get(reverse('recepcion'), {'piso': self.piso.pk})
+        self.assertFalse(response.context['canal_en_vivo'])
+        self.assertContains(response, reverse('recepcion_cambios', args=[self.piso.pk]))
+
+    async def test_bajo_asgi_el_tablero_usa_el_canal(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('recepcion'), {'piso': self.piso.pk})
+        self.assertTrue(response.context['canal_en_vivo'])
+
+
+class RecepcionCambiosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        cls.piso = Piso.objects.create(numero=3)
+        cls.h1 = Habitacion.objects.create(numero='301', piso=cls.piso, precio_noche=100)
+        cls.h2 = Habitacion.objects.create(numero='302', piso=cls.piso, precio_noche=100, estado='LIMPIEZA')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def cambios(self, desde=None):
+        params = {} if desde is None else {'desde': desde}
+        return self.client.get(reverse('recepcion_cambios', args=[self.piso.pk]), params)
+
+    def test_sin_version_devuelve_piso_completo(self):
+        data = self.cambios().json()
+        self.assertTrue(data['completo'])
+        self.assertEqual([h['numero'] for h in data['habitaciones']], ['301', '302'])
+
+    def test_sin_cambios_devuelve_304(self):
+        version = self.cambios().json()['version']
+        self.assertEqual(self.cambios(version).status_code, 304)
+
+    def test_devuelve_solo_lo_que_cambio(self):
+        version = self.cambios().json()['version']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('marcar_disponible', args=[self.h2.pk]))
+
+        data = self.cambios(version).json()
+        self.assertGreater(data['version'], version)
+        self.assertFalse(data['completo'])
+        self.assertEqual([(h['numero'], h['estado']) for h in data['habitaciones']], [('302', 'DISPONIBLE')])
+
+    def test_la_version_se_incrementa_al_confirmar(self):
+        version = self.cambios().json()['version']
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('marcar_disponible', args=[self.h2.pk]))
+            # Dentro de la transacción la fila del piso no se toca (no se bloquea)
+            self.assertEqual(Piso.objects.get(pk=self.piso.pk).version, version)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Piso.objects.get(pk=self.piso.pk).version, version + 1)
+
+    def test_filas_que_salen_del_piso_fuerzan_estado_completo(self):
+        otro = Piso.objects.create(numero=4)
+        h3 = Habitacion.objects.create(numero='401', piso=otro, precio_noche=100)
+        cliente = Cliente.objects.create(dni='7654321', nombrecompleto='Luis Gómez')
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = Reserva.objects.create(habitacion=self.h1, cliente=cliente, estado='ACTIVA',
+                                             fecha_salida=timezone.now() + timedelta(days=1))
+        version = self.cambios().json()['version']
+
+        # La reserva pasa a una habitación de otro piso
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.habitacion = h3
+            reserva.save()
+        data = self.cambios(version).json()
+        self.assertTrue(data['completo'])
+        self.assertEqual(data['reservas'], [])
+        version = data['version']
+
+        # Una habitación se mueve de piso y otra se borra
+        with self.captureOnCommitCallbacks(execute=True):
+            self.h2.piso = otro
+            self.h2.save()
+        data = self.cambios(version).json()
+        self.assertTrue(data['completo'])
+        self.assertEqual([h['numero'] for h in data['habitaciones']], ['301'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.h1.delete()
+        data = self.cambios(data['version']).json()
+        self.assertTrue(data['completo'])
+        self.assertEqual(data['habitaciones'], [])
+        # Quien ya tiene el estado posterior a la baja vuelve a recibir deltas
+        self.assertEqual(self.cambios(data['version']).status_code, 304)
+
+    def test_el_contador_no_retrocede_al_editar_el_piso(self):
+        version = self.cambios().json()['version']
+        piso = Piso.objects.get(pk=self.piso.pk)
+        piso.version = 0
+        piso.descripcion = 'Suites'
+        piso.save()
+        self.assertEqual(Piso.objects.get(pk=self.piso.pk).version, version)
+
+
+class RecepcionSnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        cls.piso1 = Piso.objects.create(numero=11)
+        cls.piso2 = Piso.objects.create(numero=12)
+        cls.h1 = Habitacion.objects.create(numero='1101', piso=cls.piso1, precio_noche=100, estado='OCUPADA')
+        cls.h2 = Habitacion.objects.create(numero='1201', piso=cls.piso2, precio_noche=100)
+        cls.cliente = Cliente.objects.create(dni='1100001', nombrecompleto='Rosa Díaz')
+        cls.reserva = Reserva.objects.create(habitacion=cls.h1, cliente=cls.cliente, estado='ACTIVA',
+                                             fecha_salida=timezone.now() + timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def calentar(self):
+        recepcion.habitaciones_piso(self.piso1.pk)
+        recepcion.habitaciones_piso(self.piso2.pk)
+
+    def assertEnCache(self, piso):
+        with self.assertNumQueries(0):
+            recepcion.habitaciones_piso(piso.pk)
+
+    def test_segunda_visita_no_consulta_pisos_ni_habitaciones(self):
+        url = reverse('recepcion') + f'?piso={self.piso1.pk}'
+        with CaptureQueriesContext(connection) as primera:
+            self.client.get(url)
+        with self.assertNumQueries(2):  # sesión y usuario
+            respuesta = self.client.get(url)
+        self.assertGreater(len(primera), 2)
+        self.assertEqual([h.pk for h in respuesta.context['habitaciones']], [self.h1.pk])
+        self.assertEqual(respuesta.context['habitaciones'][0].reserva_activa, self.reserva)
+
+    def test_escrituras_invalidan_solo_su_piso(self):
+        escrituras = [
+            ('guardar habitación', lambda: Habitacion.objects.get(pk=self.h1.pk).save()),
+            ('guardar reserva', lambda: Reserva.objects.get(pk=self.reserva.pk).save()),
+            ('borrar reserva', lambda: Reserva.objects.get(pk=self.reserva.pk).delete()),
+            ('borrar habitación', lambda: Habitacion.objects.get(pk=self.h1.pk).delete()),
+        ]
+        for nombre, escribir in escrituras:
+            with self.subTest(nombre):
+                self.calentar()
+                with self.captureOnCommitCallbacks(execute=True):
+                    escribir()
+                self.assertEnCache(self.piso2)
+                with CaptureQueriesContext(connection) as consultas:
+                    recepcion.habitaciones_piso(self.piso1.pk)
+                self.assertTrue(consultas)
+
+    def test_transaccion_revertida_no_invalida(self):
+        self.calentar()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Habitacion.objects.get(pk=self.h1.pk).save()
+                    Reserva.objects.get(pk=self.reserva.pk).delete()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEnCache(self.piso1)
+        self.assertEnCache(self.piso2)
+
+    def test_lector_rezagado_no_repone_el_piso_viejo(self):
+        cargar = recepcion._cargar_habitaciones
+
+        def cargar_mientras_otro_confirma(piso_id):
+            habitaciones = cargar(piso_id)
+            # Otro recepcionista confirma un cambio mientras este lector armaba el piso
+            with self.captureOnCommitCallbacks(execute=True):
+                Habitacion.objects.filter(pk=self.h1.pk).update(estado='LIMPIEZA')
+                recepcion.invalidar_piso(self.piso1.pk)
+            return habitaciones
+
+        with mock.patch.object(recepcion, '_cargar_habitaciones', cargar_mientras_otro_confirma):
+            self.assertEqual(recepcion.habitaciones_piso(self.piso1.pk)[0].estado, 'OCUPADA')
+        self.assertEqual(recepcion.habitaciones_piso(self.piso1.pk)[0].estado, 'LIMPIEZA')
+
+    def test_editar_un_producto_invalida_los_snapshots(self):
+        # Los consumos del snapshot muestran el nombre del producto
+        self.calentar()
+        with self.captureOnCommitCallbacks(execute=True):
+            producto = Producto.objects.create(nombre='Agua', precio_venta=Decimal('3.00'))
+        self.assertEnCache(self.piso1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.nombre = 'Agua mineral'
+            producto.save()
+        with CaptureQueriesContext(connection) as consultas:
+            recepcion.habitaciones_piso(self.piso1.pk)
+        self.assertTrue(consultas)
+
+
+class CatalogoConsumosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        cls.pisos = [Piso.objects.create(numero=n) for n in (13, 14)]
+        cliente = Cliente.objects.create(dni='1300001', nombrecompleto='Pablo Ríos')
+        for piso in cls.pisos:
+            for i in range(3):
+                hab = Habitacion.objects.create(numero=f'{piso.numero}0{i}', piso=piso,
+                                                precio_noche=100, estado='OCUPADA')
+                Reserva.objects.create(habitacion=hab, cliente=cliente, estado='ACTIVA',
+                                       fecha_salida=timezone.now() + timedelta(days=1))
+        cls.agua = Producto.objects.create(nombre='Agua mineral', precio_venta=Decimal('3.00'), stock=10)
+        Producto.objects.create(nombre='Galletas', precio_venta=Decimal('2.50'), stock=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def tablero(self, piso):
+        return self.client.get(reverse('recepcion') + f'?piso={piso.pk}')
+
+    def test_el_catalogo_va_una_vez_por_pagina(self):
+        html = self.tablero(self.pisos[0]).content.decode()
+        # Tres modales de consumo y un solo payload con los productos
+        self.assertEqual(html.count('select-catalogo"'), 3)
+        self.assertEqual(html.count('id="catalogo-consumos"'), 1)
+        self.assertEqual(html.count('Agua mineral'), 1)
+        self.assertNotIn(f'<option value="{self.agua.pk}"', html)
+
+    def test_la_version_cambia_con_el_producto_y_el_stock(self):
+        version, _ = recepcion.catalogo_consumos()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agua.precio_venta = Decimal('3.50')
+            self.agua.save()
+        nueva, filas = recepcion.catalogo_consumos()
+        self.assertNotEqual(nueva, version)
+        self.assertIn({'id': self.agua.pk, 'nombre': 'Agua mineral', 'precio': '3.50', 'stock': 10}, filas)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventario.registrar([(self.agua.pk, -10)], 'AJUSTE')
+        ultima, filas = recepcion.catalogo_consumos()
+        self.assertNotEqual(ultima, nueva)
+        # Sin stock ya no se ofrece
+        self.assertEqual([f['nombre'] for f in filas], ['Galletas'])
+
+    def test_el_catalogo_en_cache_se_reutiliza_entre_pisos(self):
+        primera = self.tablero(self.pisos[0])
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.tablero(self.pisos[1])
+        self.assertEqual(primera.context['catalogo_version'], segunda.context['catalogo_version'])
+        self.assertEqual(primera.context['catalogo'], segunda.context['catalogo'])
+        tabla = Producto._meta.db_table
+        self.assertFalse([q['sql'] for q in consultas if tabla in q['sql']])
+
+
+class DisponibilidadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.piso = Piso.objects.create(numero=4)
+        cls.doble = TipoHabitacion.objects.create(nombre='Doble')
+        cls.h1 = Habitacion.objects.create(numero='401', piso=cls.piso, tipo=cls.doble, precio_noche=100)
+        cls.h2 = Habitacion.objects.create(numero='402', piso=cls.piso, tipo=cls.doble, precio_noche=100)
+        cls.h3 = Habitacion.objects.create(numero='403', piso=cls.piso, precio_noche=80)
+        cls.cliente = Cliente.objects.create(dni='7654321', nombrecompleto='Luis Rojas')
+
+    def setUp(self):
+        cache.clear()
+
+    def reservar(self, habitacion, entrada, salida, estado='PENDIENTE'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Reserva.objects.create(
+                habitacion=habitacion, cliente=self.cliente, estado=estado,
+                fecha_entrada=disponibilidad.inicio_noche(entrada) + timedelta(hours=2),
+                fecha_salida=disponibilidad.inicio_noche(salida) - timedelta(hours=1),
+            )
+
+    def libres(self, entrada, salida, **filtros):
+        return [h.numero for h in disponibilidad.habitaciones_libres(entrada, salida, **filtros)]
+
+    def test_excluye_reservas_que_se_solapan(self):
+        self.reservar(self.h1, date(2030, 1, 13), date(2030, 1, 14))
+        self.reservar(self.h2, date(2030, 1, 15), date(2030, 1, 17))
+        self.assertEqual(self.libres(date(2030, 1, 12), date(2030, 1, 15)), ['402', '403'])
+        self.assertEqual(self.libres(date(2030, 1, 12), date(2030, 1, 15), tipo=self.doble), ['402'])
+
+    def test_ignora_reservas_finalizadas_o_canceladas(self):
+        self.reservar(self.h1, date(2030, 2, 1), date(2030, 2, 3), estado='CANCELADA')
+        self.assertIn('401', self.libres(date(2030, 2, 1), date(2030, 2, 3)))
+
+    def test_cache_por_noche_se_invalida_al_reservar(self):
+        self.assertIn('401', self.libres(date(2030, 3, 1), date(2030, 3, 3)))
+        with self.assertNumQueries(1):
+            self.libres(date(2030, 3, 2), date(2030, 3, 3))
+        self.reservar(self.h1, date(2030, 3, 2), date(2030, 3, 3))
+        self.assertNotIn('401', self.libres(date(2030, 3, 1), date(2030, 3, 3)))
+
+    def test_cambiar_fechas_invalida_solo_las_noches_afectadas(self):
+        self.libres(date(2030, 4, 1), date(2030, 4, 11))
+        reserva = self.reservar(self.h1, date(2030, 4, 2), date(2030, 4, 4))
+        with self.assertNumQueries(1):  # solo habitaciones: noches sin tocar
+            self.assertIn('401', self.libres(date(2030, 4, 5), date(2030, 4, 11)))
+        self.assertNotIn('401', self.libres(date(2030, 4, 2), date(2030, 4, 4)))
+
+        reserva = Reserva.objects.get(pk=reserva.pk)
+        reserva.fecha_entrada = disponibilidad.inicio_noche(date(2030, 4, 7))
+        reserva.fecha_salida = disponibilidad.inicio_noche(date(2030, 4, 8))
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.save()
+        # El rango anterior queda libre y el nuevo ocupado
+        self.assertIn('401', self.libres(date(2030, 4, 2), date(2030, 4, 4)))
+        self.assertNotIn('401', self.libres(date(2030, 4, 7), date(2030, 4, 8)))
+        with self.assertNumQueries(1):
+            self.libres(date(2030, 4, 9), date(2030, 4, 11))
+
+    def test_el_formulario_limita_el_rango(self):
+        self.client.force_login(User.objects.create_superuser('recepcion', 'r@hotel.com', 'x'))
+        url = reverse('disponibilidad')
+        with mock.patch.object(disponibilidad, 'habitaciones_libres') as libres:
+            respuesta = self.client.get(url, {'entrada': '2030-01-01', 'salida': '2030-04-02'})
+        libres.assert_not_called()
+        self.assertIn('no puede superar las 90 noches', str(respuesta.context['form'].non_field_errors()))
+
+        respuesta = self.client.get(url, {'entrada': '2030-01-01', 'salida': '2030-04-01'})
+        self.assertEqual(len(respuesta.context['habitaciones']), 3)
+
+
+class CheckinGrupalTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        cls.piso = Piso.objects.create(numero=5)
+        cls.habitaciones = [
+            Habitacion.objects.create(numero=f'5{i:02d}', piso=cls.piso, precio_noche=100)
+            for i in range(30)
+        ]
+        cls.cliente = Cliente.objects.create(dni='5550001', nombrecompleto='Tour Andino')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, habitaciones, **extra):
+        data = {
+            'cliente': self.cliente.pk,
+            'fecha_salida': (timezone.localtime() + timedelta(days=2)).strftime('%Y-%m-%dT%H:%M'),
+            'monto_recibido': '50',
+            'habitaciones': [h.pk for h in habitaciones],
+            **extra,
+        }
+        return self.client.post(reverse('checkin_grupal'), data)
+
+    def test_ocupa_todas_las_habitaciones_en_pocas_consultas(self):
+        primera = self.habitaciones[0]
+        # sesión, usuario, cliente, habitaciones, 2 UPDATE (estado y reserva
+        # activa) + 3 INSERT y savepoints (la versión del piso y el acumulado
+        # del día van después del commit): no crece con el tamaño del grupo
+        with self.assertNumQueries(11):
+            response = self.post(self.habitaciones, **{f'acompanantes_{primera.pk}': '1234567, Rosa Quispe'})
+        self.assertRedirects(response, reverse('recepcion'), fetch_redirect_response=False)
+
+        self.assertEqual(Habitacion.objects.filter(estado='OCUPADA').count(), 30)
+        self.assertEqual(Reserva.objects.filter(estado='ACTIVA', pago__monto_recibido=50).count(), 30)
+        self.assertEqual(Reserva.objects.get(habitacion=primera).acompanantes.get().nombre_completo, 'Rosa Quispe')
+
+    def test_revierte_el_grupo_si_una_habitacion_ya_no_esta_libre(self):
+        form_habs = self.habitaciones[:3]
+        Habitacion.objects.filter(pk=form_habs[2].pk).update(estado='OCUPADA')
+        # la habitación ya no figura entre las elegibles
+        self.post(form_habs)
+        self.assertFalse(Reserva.objects.exists())
+        self.assertEqual(Habitacion.objects.filter(estado='OCUPADA').count(), 1)
+
+
+class ReservaActivaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        piso = Piso.objects.create(numero=6)
+        cls.habitaciones = [
+            Habitacion.objects.create(numero=f'60{i}', piso=piso, precio_noche=100) for i in range(3)
+        ]
+        cls.cliente = Cliente.objects.create(dni='6600001', nombrecompleto='Elena Vargas')
+        cls.tipo_pago = TipoPago.objects.create(nombre='Efectivo')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def apuntada(self, habitacion):
+        return Habitacion.objects.values_list('reserva_activa', flat=True).get(pk=habitacion.pk)
+
+    def test_checkin_y_checkout_mantienen_el_puntero(self):
+        hab = self.habitaciones[0]
+        self.client.post(reverse('ocupar_habitacion', args=[hab.pk]), {
+            'cliente': self.cliente.pk,
+            'fecha_salida': (timezone.localtime() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+            'descuento_porcentaje': '0', 'tipo_pago': self.tipo_pago.pk, 'monto_recibido': '0',
+            'acompanantes-TOTAL_FORMS': '0', 'acompanantes-INITIAL_FORMS': '0',
+        })
+        reserva = Reserva.objects.get(habitacion=hab, estado='ACTIVA')
+        self.assertEqual(self.apuntada(hab), reserva.pk)
+
+        self.client.post(reverse('checkout_habitacion', args=[hab.pk]))
+        self.assertIsNone(self.apuntada(hab))
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).estado, 'FINALIZADA')
+
+    def test_checkin_grupal_enlaza_cada_habitacion(self):
+        self.client.post(reverse('checkin_grupal'), {
+            'cliente': self.cliente.pk,
+            'fecha_salida': (timezone.localtime() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+            'monto_recibido': '0',
+            'habitaciones': [h.pk for h in self.habitaciones],
+        })
+        for hab in self.habitaciones:
+            self.assertEqual(self.apuntada(hab), Reserva.objects.get(habitacion=hab).pk)
+
+    def test_cambio_de_habitacion_mueve_el_puntero(self):
+        origen, destino = self.habitaciones[:2]
+        reserva = Reserva.objects.create(habitacion=origen, cliente=self.cliente, estado='ACTIVA',
+                                         fecha_salida=timezone.now() + timedelta(days=1))
+        reserva.habitacion = destino
+        reserva.save()
+        self.assertIsNone(self.apuntada(origen))
+        self.assertEqual(self.apuntada(destino), reserva.pk)
+
+    def test_guardado_completo_con_datos_viejos_conserva_el_puntero(self):
+        hab = Habitacion.objects.get(pk=self.habitaciones[0].pk)
+        reserva = Reserva.objects.create(habitacion=self.habitaciones[0], cliente=self.cliente, estado='ACTIVA',
+                                         fecha_salida=timezone.now() + timedelta(days=1))
+        # ``hab`` se cargó antes del check-in: su reserva_activa es None
+        hab.estado = 'LIMPIEZA'
+        hab.save()
+        self.assertEqual(self.apuntada(hab), reserva.pk)
+        self.assertEqual(Habitacion.objects.get(pk=hab.pk).estado, 'LIMPIEZA')
+
+    def test_reparar_corrige_punteros_desalineados(self):
+        activa = Reserva.objects.create(habitacion=self.habitaciones[0], cliente=self.cliente, estado='ACTIVA',
+                                        fecha_salida=timezone.now() + timedelta(days=1))
+        finalizada = Reserva.objects.create(habitacion=self.habitaciones[1], cliente=self.cliente,
+                                            estado='FINALIZADA', fecha_salida=timezone.now())
+        # Escrituras que no pasan por save(): el puntero queda desalineado
+        Habitacion.objects.filter(pk=self.habitaciones[0].pk).update(reserva_activa=None)
+        Habitacion.objects.filter(pk=self.habitaciones[1].pk).update(reserva_activa=finalizada)
+
+        salida = io.StringIO()
+        call_command('reparar_reservas_activas', '--revisar', stdout=salida)
+        self.assertIn('2 habitaciones encontradas', salida.getvalue())
+        self.assertIsNone(self.apuntada(self.habitaciones[0]))
+
+        call_command('reparar_reservas_activas', stdout=io.StringIO())
+        self.assertEqual(self.apuntada(self.habitaciones[0]), activa.pk)
+        self.assertIsNone(self.apuntada(self.habitaciones[1]))
+        self.assertEqual(recepcion.reparar_reservas_activas(corregir=False), [])
+
+
+class OcuparHabitacionConcurrenciaTests(TransactionTestCase):
+    """Varios recepcionistas ocupan a la vez: exactamente uno gana por habitación."""
+
+    HILOS = 6
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        piso = Piso.objects.create(numero=6)
+        self.habitaciones = [
+            Habitacion.objects.create(numero=f'60{i}', piso=piso, precio_noche=100) for i in range(2)
+        ]
+        self.clientes = [
+            Cliente.objects.create(dni=f'600000{i}', nombrecompleto=f'Huésped {i}') for i in range(self.HILOS)
+        ]
+        self.efectivo = TipoPago.objects.create(nombre='Efectivo')
+
+    def ocupar(self, habitacion, cliente, barrera, resultados):
+        try:
+            c = Client()
+            c.force_login(self.user)
+            barrera.wait()
+            response = c.post(reverse('ocupar_habitacion', args=[habitacion.pk]), {
+                'cliente': cliente.pk,
+                'fecha_salida': (timezone.localtime() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+                'tipo_pago': self.efectivo.pk,
+                'monto_recibido': '0',
+                'acompanantes-TOTAL_FORMS': '0',
+                'acompanantes-INITIAL_FORMS': '0',
+            })
+            resultados.append([str(m) for m in get_messages(response.wsgi_request)])
+        finally:
+            connection.close()
+
+    # Solo tiene sentido con bloqueos de fila; cada hilo cierra su conexión al terminar
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_un_solo_ganador_por_habitacion(self):
+        # con timeout, un hilo que no llega rompe la barrera en lugar de colgar la suite
+        barrera = threading.Barrier(self.HILOS, timeout=10)
+        resultados = []
+        hilos = [
+            threading.Thread(target=self.ocupar, args=(self.habitaciones[i % 2], cliente, barrera, resultados))
+            for i, cliente in enumerate(self.clientes)
+        ]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join(timeout=30)
+            self.assertFalse(h.is_alive())
+
+        self.assertEqual(len(resultados), self.HILOS)
+        exitos = [m for m in resultados if any('ocupada correctamente' in x for x in m)]
+        self.assertEqual(len(exitos), 2)
+        # los demás reciben el aviso de conflicto, no un error de formulario
+        for mensajes in resultados:
+            self.assertTrue(mensajes)
+            self.assertNotIn('Revisa los datos del formulario.', mensajes)
+        for hab in self.habitaciones:
+            self.assertEqual(Reserva.objects.filter(habitacion=hab, estado='ACTIVA').count(), 1)
+            hab.refresh_from_db()
+            self.assertEqual(hab.estado, 'OCUPADA')
+
+    def test_la_bd_rechaza_una_segunda_reserva_activa(self):
+        hab = self.habitaciones[0]
+        salida = timezone.now() + timedelta(days=1)
+        Reserva.objects.create(habitacion=hab, cliente=self.clientes[0], estado='ACTIVA', fecha_salida=salida)
+        with self.assertRaises(IntegrityError):
+            Reserva.objects.create(habitacion=hab, cliente=self.clientes[1], estado='ACTIVA', fecha_salida=salida)
+
+
+class RegistrarConsumoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        piso = Piso.objects.create(numero=7)
+        cls.hab = Habitacion.objects.create(numero='701', piso=piso, precio_noche=100, estado='OCUPADA')
+        cliente = Cliente.objects.create(dni='7000001', nombrecompleto='Marta Flores')
+        cls.reserva = Reserva.objects.create(
+            habitacion=cls.hab, cliente=cliente, estado='ACTIVA',
+            fecha_salida=timezone.now() + timedelta(days=1),
+            costo_habitacion=Decimal('100.00'), costo_total=Decimal('100.00'),
+        )
+        cls.productos = [
+            Producto.objects.create(nombre=f'Producto {i}', precio_venta=Decimal('0.10'), stock=5)
+            for i in range(10)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def consumir(self, lineas):
+        return self.client.post(reverse('registrar_consumo', args=[self.hab.pk]), {
+            'producto_id[]': [p.pk for p, _ in lineas],
+            'cantidad[]': [c for _, c in lineas],
+        })
+
+    def test_descuenta_stock_y_suma_en_decimal(self):
+        self.consumir([(p, 3) for p in self.productos] + [(self.productos[0], 1)])
+
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.costo_productos, Decimal('3.10'))
+        self.assertEqual(self.reserva.costo_total, Decimal('103.10'))
+        self.assertEqual(self.reserva.venta.total_venta, Decimal('3.10'))
+        self.assertEqual(self.reserva.venta.detalleventa_set.count(), 10)
+        self.assertEqual(inventario.stock_actual(self.productos[0].pk), 1)
+        self.assertEqual(inventario.stock_actual(self.productos[9].pk), 2)
+
+    def test_consultas_no_crecen_con_las_lineas(self):
+        self.consumir([(self.productos[0], 1)])
+        # sesión, usuario, habitación, reserva+venta, productos, 2 INSERT, 2 UPDATE
+        # (uno es el bloqueo de los productos) y savepoints (la versión del piso
+        # y el acumulado del día van después del commit): igual para 1 o 10 líneas
+        with self.assertNumQueries(12):
+            self.consumir([(p, 1) for p in self.productos])
+
+    def test_rechaza_pedidos_sin_stock(self):
+        self.consumir([(self.productos[0], 4), (self.productos[1], 6)])
+
+        self.reserva.refresh_from_db()
+        self.assertIsNone(self.reserva.venta)
+        self.assertEqual(self.reserva.costo_productos, Decimal('0.00'))
+        self.assertEqual(inventario.stock_actual(self.productos[0].pk), 5)
+        self.assertFalse(Venta.objects.exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class RegistrarConsumoConcurrenciaTests(TransactionTestCase):
+    """Dos consumos simultáneos del último stock: uno gana y el stock no queda negativo."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('recepcion', 'r@hotel.com', 'x')
+        piso = Piso.objects.create(numero=7)
+        cliente = Cliente.objects.create(dni='7000001', nombrecompleto='Marta Flores')
+        self.habitaciones = []
+        for numero in ('701', '702'):
+            hab = Habitacion.objects.create(numero=numero, piso=piso, precio_noche=100, estado='OCUPADA')
+            Reserva.objects.create(habitacion=hab, cliente=cliente, estado='ACTIVA',
+                                   fecha_salida=timezone.now() + timedelta(days=1))
+            self.habitaciones.append(hab)
+        self.producto = Producto.objects.create(nombre='Agua', precio_venta=Decimal('2.00'), stock=5)
+
+    def consumir(self, habitacion, barrera, resultados):
+        try:
+            c = Client()
+            c.force_login(self.user)
+            barrera.wait()
+            response = c.post(reverse('registrar_consumo', args=[habitacion.pk]), {
+                'producto_id[]': [self.producto.pk], 'cantidad[]': [5],
+            })
+            resultados.append([str(m) for m in get_messages(response.wsgi_request)])
+        finally:
+            connection.close()
+
+    def test_el_stock_no_queda_negativo(self):
+        barrera = threading.Barrier(len(self.habitaciones), timeout=10)
+        resultados = []
+        hilos = [threading.Thread(target=self.consumir, args=(hab, barrera, resultados))
+                 for hab in self.habitaciones]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual(len(resultados), 2)
+        self.assertEqual(sum(any('Stock insuficiente' in m for m in r) for r in resultados), 1)
+        self.assertEqual(inventario.stock_actual(self.producto.pk), 0)
+
+
+class InventarioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('almacen', 'a@hotel.com', 'x')
+        cls.categoria = Categoria.objects.create(nombre='Bebidas')
+        cls.producto = Producto.objects.create(
+            nombre='Agua', categoria=cls.categoria, precio_venta=Decimal('5.00'), stock=10,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_venta_registra_movimiento_sin_tocar_el_snapshot(self):
+        self.client.post(reverse('venta_create'), {
+            'detalleventa_set-TOTAL_FORMS': '1', 'detalleventa_set-INITIAL_FORMS': '0',
+            'detalleventa_set-0-producto': self.producto.pk,
+            'detalleventa_set-0-cantidad': '3',
+            'detalleventa_set-0-precio_unitario': '5.00',
+        })
+
+        mov = MovimientoStock.objects.get()
+        self.assertEqual((mov.origen, mov.cantidad, mov.usuario), ('VENTA', -3, self.user))
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).stock, 10)
+        self.assertEqual(inventario.stock_actual(self.producto.pk), 7)
+
+    def test_compactar_pliega_pendientes_en_el_snapshot(self):
+        inventario.registrar([(self.producto.pk, 4)], 'COMPRA')
+        inventario.registrar([(self.producto.pk, -6)], 'AJUSTE')
+        inventario.registrar([(self.producto.pk, -1)], 'VENTA')
+
+        self.assertEqual(inventario.compactar(lote=2), 3)
+
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).stock, 7)
+        self.assertEqual(inventario.stock_actual(self.producto.pk), 7)
+        self.assertFalse(MovimientoStock.objects.filter(compactado=False).exists())
+        self.assertEqual(inventario.compactar(), 0)
+
+    def editar_producto(self, stock, stock_original, precio='5.00'):
+        return self.client.post(reverse('producto_update', args=[self.producto.pk]), {
+            'nombre': 'Agua', 'categoria': self.categoria.pk, 'precio_venta': precio,
+            'stock': stock, 'stock_original': stock_original, 'activo': 'on',
+        })
+
+    def test_editar_producto_ajusta_por_diferencia(self):
+        inventario.registrar([(self.producto.pk, -2)], 'VENTA')
+        formulario = self.client.get(reverse('producto_update', args=[self.producto.pk])).context['form']
+        self.assertEqual(formulario.initial['stock_original'], 8)
+        self.editar_producto('15', '8')
+
+        ajuste = MovimientoStock.objects.get(origen='AJUSTE')
+        self.assertEqual(ajuste.cantidad, 7)
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).stock, 10)
+        self.assertEqual(inventario.stock_actual(self.producto.pk), 15)
+
+    def test_editar_el_precio_conserva_los_consumos_del_medio(self):
+        # El formulario se abrió con stock 10 y mientras tanto se consumieron 3
+        inventario.registrar([(self.producto.pk, -3)], 'CONSUMO')
+        self.editar_producto('10', '10', precio='6.00')
+
+        self.assertFalse(MovimientoStock.objects.filter(origen='AJUSTE').exists())
+        self.assertEqual(inventario.stock_actual(self.producto.pk), 7)
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).precio_venta, Decimal('6.00'))
+
+
+class ConciliacionStockTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('almacen', 'a@hotel.com', 'x')
+        cls.proveedor = Proveedor.objects.create(nombre='Distribuidora')
+        cls.productos = [
+            Producto.objects.create(nombre=f'Producto {i}', precio_venta=Decimal('2.00'), stock=100)
+            for i in range(20)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.compra = Compra.objects.create(proveedor=self.proveedor, usuario=self.user)
+        self.detalles = DetalleCompra.objects.bulk_create([
+            DetalleCompra(compra=self.compra, producto=p, cantidad=5, costo_unitario=Decimal('1.10'))
+            for p in self.productos
+        ])
+
+    def editar(self, cantidades):
+        datos = {
+            'proveedor': self.proveedor.pk,
+            'detallecompra_set-TOTAL_FORMS': len(self.detalles),
+            'detallecompra_set-INITIAL_FORMS': len(self.detalles),
+        }
+        for i, (d, cantidad) in enumerate(zip(self.detalles, cantidades)):
+            datos.update({
+                f'detallecompra_set-{i}-id': d.pk,
+                f'detallecompra_set-{i}-producto': d.producto_id,
+                f'detallecompra_set-{i}-cantidad': cantidad,
+                f'detallecompra_set-{i}-costo_unitario': '1.10',
+            })
+        return self.client.post(reverse('compra_update', args=[self.compra.pk]), datos)
+
+    def test_editar_registra_solo_la_diferencia(self):
+        self.editar([8] + [5] * 19)
+
+        mov = MovimientoStock.objects.get()
+        self.assertEqual((mov.producto_id, mov.cantidad), (self.productos[0].pk, 3))
+        self.compra.refresh_from_db()
+        self.assertEqual(self.compra.total_compra, Decimal('113.30'))
+
+    def test_borrar_devuelve_el_stock(self):
+        self.client.post(reverse('compra_delete', args=[self.compra.pk]))
+
+        self.assertFalse(Compra.objects.exists())
+        self.assertEqual(MovimientoStock.objects.count(), 20)
+        self.assertEqual(inventario.stock_actual(self.productos[7].pk), 95)
+
+
+class ListadoKeysetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@hotel.com', 'x')
+        cls.otro = User.objects.create_user('caja', 'caja@hotel.com', 'x')
+        cls.ventas = [
+            Venta.objects.create(usuario=cls.user if i % 2 else cls.otro, total_venta=Decimal(i % 3))
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def recorrer(self, **params):
+        """Ids de todas las páginas en modo JSON siguiendo el cursor."""
+        ids, params = [], {'formato': 'json', **params}
+        with mock.patch.object(VentaListView, 'por_pagina', 3):
+            while True:
+                datos = self.client.get(reverse('venta_list'), params).json()
+                ids += [f['id'] for f in datos['filas']]
+                if not datos['siguiente']:
+                    return ids
+                params['despues'] = datos['siguiente']
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        esperado = [v.pk for v in sorted(self.ventas, key=lambda v: (v.fecha_venta, v.pk), reverse=True)]
+        self.assertEqual(self.recorrer(), esperado)
+
+    def test_orden_con_empates_y_filtro(self):
+        ids = self.recorrer(orden='total', usuario=self.user.pk)
+        propias = [v for v in self.ventas if v.usuario_id == self.user.pk]
+        self.assertEqual(ids, [v.pk for v in sorted(propias, key=lambda v: (v.total_venta, v.pk))])
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        with mock.patch.object(VentaListView, 'por_pagina', 3):
+            primera = self.client.get(reverse('venta_list'), {'formato': 'json'}).json()
+            rota = self.client.get(reverse('venta_list'), {'formato': 'json', 'despues': 'x!'}).json()
+        self.assertEqual(primera, rota)
+
+    def test_listados_html(self):
+        for nombre in ('venta_list', 'compra_list', 'cliente_list', 'producto_list', 'user_list'):
+            with self.subTest(nombre):
+                respuesta = self.client.get(reverse(nombre), {'activo': 'true', 'desde': '2024-01-01'})
+                self.assertEqual(respuesta.status_code, 200)
+
+
+# Rutas que no se pueden medir con un GET: el stream SSE no termina.
+RUTAS_SIN_MEDIR = {'recepcion_eventos'}
+
+
+@override_settings(PRESUPUESTO_CONSULTAS_ESTRICTO=True)
+class PresupuestoConsultasTests(TestCase):
+    """
+    Fija el presupuesto de consultas de cada ruta de la app. Los datos tienen
+    varias filas por tabla para que un N+1 en una plantilla se note.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@hotel.com', 'x')
+        cajeros = [User.objects.create_user(f'caja{i}', f'caja{i}@hotel.com', 'x') for i in range(3)]
+        cls.grupo = Group.objects.create(name='Recepción')
+        for u in cajeros:
+            u.groups.add(cls.grupo)
+
+        proveedores = [Proveedor.objects.create(nombre=f'Proveedor {i}') for i in range(3)]
+        categorias = [Categoria.objects.create(nombre=f'Categoría {i}') for i in range(3)]
+        productos = [
+            Producto.objects.create(nombre=f'Producto {i}', categoria=categorias[i], precio_venta=1, stock=10)
+            for i in range(3)
+        ]
+        for i in range(3):
+            compra = Compra.objects.create(proveedor=proveedores[i], usuario=cajeros[i])
+            venta = Venta.objects.create(usuario=cajeros[i])
+            for p in productos:
+                DetalleCompra.objects.create(compra=compra, producto=p, cantidad=1, costo_unitario=1)
+                DetalleVenta.objects.create(venta=venta, producto=p, cantidad=1, precio_unitario=1)
+        cls.compra, cls.venta = compra, venta
+        clientes = [Cliente.objects.create(dni=f'900000{i}', nombrecompleto=f'Cliente {i}') for i in range(3)]
+
+        tipos = [TipoHabitacion.objects.create(nombre=f'Tipo {i}') for i in range(3)]
+        cls.piso = Piso.objects.create(numero=1)
+        cls.libre, cls.ocupada, cls.limpieza = [
+            Habitacion.objects.create(numero=f'10{i}', piso=cls.piso, tipo=tipos[i], precio_noche=100, estado=estado)
+            for i, estado in enumerate(('DISPONIBLE', 'OCUPADA', 'LIMPIEZA'))
+        ]
+        Reserva.objects.create(
+            habitacion=cls.ocupada, cliente=clientes[0], estado='ACTIVA', venta=venta,
+            fecha_salida=timezone.now() + timedelta(days=1),
+        )
+        cls.producto, cls.categoria, cls.proveedor = productos[0], categorias[0], proveedores[0]
+        cls.cliente, cls.tipo = clientes[0], tipos[0]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.enterClassContext(tempfile.TemporaryDirectory())))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def miniatura(self):
+        huella = 'a' * 64
+        default_storage.save(imagenes.nombre_derivada(huella, 64, 'webp'), ContentFile(b'RIFF'))
+        return {'huella': huella, 'ancho': 64, 'formato': 'webp'}
+
+    def reporte_de_importacion(self):
+        cache.set(IMPORTAR_REPORTE_KEY.format(usuario=self.user.pk, clave='prueba'), 'linea,error\n')
+        return 'prueba'
+
+    def rutas(self):
+        """``{nombre: kwargs}`` de cada ruta de Cristal_app/urls.py."""
+        pk = lambda obj: {'pk': obj.pk}  # noqa: E731
+        return {
+            'home': {}, 'recepcion': {}, 'checkin_grupal': {}, 'disponibilidad': {},
+            'reporte_ocupacion': {}, 'reporte_ventas': {}, 'exportar': {'recurso': 'ventas'},
+            'importar': {'recurso': 'productos'}, 'importar_reporte': {'clave': self.reporte_de_importacion()},
+            'recepcion_cambios': {'piso_id': self.piso.pk},
+            'registrar_consumo': {'habitacion_id': self.ocupada.pk},
+            'ocupar_habitacion': pk(self.libre),
+            'checkout_habitacion': pk(self.ocupada),
+            'marcar_limpieza': pk(self.ocupada),
+            'marcar_disponible': pk(self.limpieza),
+            'user_list': {}, 'user_create': {}, 'user_update': pk(self.user), 'user_delete': pk(self.user),
+            'group_list': {}, 'group_create': {}, 'group_update': pk(self.grupo), 'group_delete': pk(self.grupo),
+            'proveedor_list': {}, 'proveedor_create': {},
+            'proveedor_update': pk(self.proveedor), 'proveedor_delete': pk(self.proveedor),
+            'categoria_list': {}, 'categoria_create': {},
+            'categoria_update': pk(self.categoria), 'categoria_delete': pk(self.categoria),
+            'producto_list': {}, 'producto_create': {},
+            'producto_update': pk(self.producto), 'producto_delete': pk(self.producto),
+            'producto_imagen': self.miniatura(),
+            'compra_list': {}, 'compra_create': {}, 'compra_update': pk(self.compra), 'compra_delete': pk(self.compra),
+            'venta_list': {}, 'venta_create': {}, 'venta_update': pk(self.venta), 'venta_delete': pk(self.venta),
+            'cliente_list': {}, 'cliente_create': {}, 'cliente_buscar': {},
+            'cliente_update': pk(self.cliente), 'cliente_delete': pk(self.cliente),
+            'tipohabitacion_list': {}, 'tipohabitacion_create': {},
+            'tipohabitacion_update': pk(self.tipo), 'tipohabitacion_delete': pk(self.tipo),
+            'piso_list': {}, 'piso_create': {}, 'piso_update': pk(self.piso), 'piso_delete': pk(self.piso),
+            'habitacion_list': {}, 'habitacion_create': {},
+            'habitacion_update': pk(self.libre), 'habitacion_delete': pk(self.libre),
+        }
+
+    def test_todas_las_rutas_tienen_presupuesto(self):
+        nombres = {p.name for p in app_urls.urlpatterns}
+        self.assertEqual(nombres - RUTAS_SIN_MEDIR, set(self.rutas()))
+        self.assertEqual(nombres - set(consultas.PRESUPUESTOS), RUTAS_SIN_MEDIR)
+
+    def test_cada_ruta_respeta_su_presupuesto(self):
+        for nombre, kwargs in self.rutas().items():
+            with self.subTest(nombre):
+                respuesta = self.client.get(reverse(nombre, kwargs=kwargs))
+                self.assertIn(respuesta.status_code, (200, 302, 405))
+                self.assertLessEqual(respuesta.wsgi_request.consultas.total, consultas.presupuesto(nombre))
+
+    def escrituras(self):
+        """``[(nombre, kwargs, datos)]`` de los POST que escriben, en un orden que los encadena."""
+        salida = (timezone.localtime() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M')
+        libres = [
+            Habitacion.objects.create(numero=f'11{i}', piso=self.piso, tipo=self.tipo, precio_noche=100)
+            for i in range(3)
+        ]
+        pago = TipoPago.objects.create(nombre='Efectivo')
+        detalle = lambda prefijo, precio: {  # noqa: E731
+            f'{prefijo}-TOTAL_FORMS': '1', f'{prefijo}-INITIAL_FORMS': '0',
+            f'{prefijo}-0-producto': self.producto.pk, f'{prefijo}-0-cantidad': '2', f'{prefijo}-0-{precio}': '1.00',
+        }
+        return [
+            ('registrar_consumo', {'habitacion_id': self.ocupada.pk},
+             {'producto_id[]': [self.producto.pk], 'cantidad[]': [2]}),
+            ('ocupar_habitacion', {'pk': self.libre.pk}, {
+                'cliente': self.cliente.pk, 'fecha_salida': salida, 'tipo_pago': pago.pk, 'monto_recibido': '0',
+                'acompanantes-TOTAL_FORMS': '0', 'acompanantes-INITIAL_FORMS': '0',
+            }),
+            ('checkin_grupal', {}, {
+                'cliente': self.cliente.pk, 'fecha_salida': salida, 'monto_recibido': '0',
+                'habitaciones': [h.pk for h in libres],
+            }),
+            ('checkout_habitacion', {'pk': self.ocupada.pk}, {}),
+            ('compra_create', {}, {'proveedor': self.proveedor.pk, **detalle('detallecompra_set', 'costo_unitario')}),
+            ('venta_create', {}, detalle('detalleventa_set', 'precio_unitario')),
+        ]
+
+    def test_cada_escritura_respeta_su_presupuesto(self):
+        for nombre, kwargs, datos in self.escrituras():
+            with self.subTest(nombre):
+                # en modo estricto el middleware lanza si se pasa o repite una forma
+                respuesta = self.client.post(reverse(nombre, kwargs=kwargs), datos)
+                self.assertEqual(respuesta.status_code, 302)
+                mensajes = [m.level_tag for m in get_messages(respuesta.wsgi_request)]
+                self.assertNotIn('error', mensajes)
+                self.assertLessEqual(respuesta.wsgi_request.consultas.total, consultas.presupuesto(nombre, 'POST'))
+
+    def test_detecta_consultas_repetidas(self):
+        def listado_con_n_mas_1(request):
+            nombres = [v.usuario.username for v in Venta.objects.all()]
+            return JsonResponse({'usuarios': nombres})
+
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        middleware = consultas.PresupuestoConsultasMiddleware(listado_con_n_mas_1)
+        with override_settings(PRESUPUESTO_CONSULTAS_REPETICIONES=2), \
+                self.assertLogs('Cristal_app.consultas', 'WARNING'), \
+                self.assertRaisesMessage(consultas.PresupuestoConsultasExcedido, 'posible N+1, 3 veces'):
+            middleware(request)
+
+
+class EstadisticasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('gerencia', 'g@hotel.com', 'x')
+        cls.tipo_pago = TipoPago.objects.create(nombre='Efectivo')
+        cls.cliente = Cliente.objects.create(dni='8000001', nombrecompleto='Luis Rojas')
+        piso = Piso.objects.create(numero=8)
+        cls.habitaciones = [
+            Habitacion.objects.create(numero=f'80{i}', piso=piso, precio_noche=100, estado=estado)
+            for i, estado in enumerate(('DISPONIBLE', 'DISPONIBLE', 'LIMPIEZA'))
+        ]
+        cls.producto = Producto.objects.create(nombre='Café', precio_venta=Decimal('7.50'), stock=10)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, url, datos=None):
+        # El acumulado se suma al confirmar la transacción de la vista
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, datos or {})
+
+    def ocupar(self, habitacion):
+        self.post(reverse('ocupar_habitacion', args=[habitacion.pk]), {
+            'cliente': self.cliente.pk,
+            'fecha_salida': (timezone.localtime() + timedelta(days=2)).strftime('%Y-%m-%dT%H:%M'),
+            'descuento_porcentaje': '10',
+            'tipo_pago': self.tipo_pago.pk,
+            'monto_recibido': '0',
+            'acompanantes-TOTAL_FORMS': '0', 'acompanantes-INITIAL_FORMS': '0',
+        })
+
+    def test_checkin_consumo_y_checkout_acumulan_en_el_dia(self):
+        self.ocupar(self.habitaciones[0])
+        self.ocupar(self.habitaciones[1])
+        self.post(reverse('registrar_consumo', args=[self.habitaciones[0].pk]), {
+            'producto_id[]': [self.producto.pk], 'cantidad[]': ['2'],
+        })
+        self.post(reverse('checkout_habitacion', args=[self.habitaciones[1].pk]))
+        # Reservada para hoy pero sin check-in: no suma en ninguno de los dos caminos
+        with self.captureOnCommitCallbacks(execute=True):
+            Reserva.objects.create(habitacion=self.habitaciones[2], cliente=self.cliente, estado='PENDIENTE',
+                                   fecha_entrada=timezone.now(), fecha_salida=timezone.now() + timedelta(days=1),
+                                   costo_total=Decimal('100.00'))
+
+        fila = EstadisticaDiaria.objects.get(fecha=timezone.localdate())
+        self.assertEqual((fila.checkins, fila.checkouts), (2, 1))
+        self.assertEqual(fila.ingresos_habitaciones, Decimal('360.00'))
+        self.assertEqual(fila.ingresos_productos, Decimal('15.00'))
+
+        # Reconstruir desde las reservas da lo mismo que el acumulado incremental
+        estadisticas.recalcular()
+        recalculada = EstadisticaDiaria.objects.get(fecha=timezone.localdate())
+        self.assertEqual(
+            (recalculada.checkins, recalculada.checkouts, recalculada.ingresos_habitaciones,
+             recalculada.ingresos_productos),
+            (2, 1, Decimal('360.00'), Decimal('15.00')),
+        )
+
+    def test_el_acumulado_no_se_toca_dentro_de_la_transaccion(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('ocupar_habitacion', args=[self.habitaciones[0].pk]), {
+                'cliente': self.cliente.pk,
+                'fecha_salida': (timezone.localtime() + timedelta(days=2)).strftime('%Y-%m-%dT%H:%M'),
+                'descuento_porcentaje': '0', 'tipo_pago': self.tipo_pago.pk, 'monto_recibido': '0',
+                'acompanantes-TOTAL_FORMS': '0', 'acompanantes-INITIAL_FORMS': '0',
+            })
+        # Sin bloqueo sobre la fila del día mientras la reserva estaba abierta
+        self.assertFalse(EstadisticaDiaria.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(EstadisticaDiaria.objects.get(fecha=timezone.localdate()).checkins, 1)
+
+    def test_tablero_en_dos_consultas(self):
+        self.ocupar(self.habitaciones[0])
+        with self.assertNumQueries(4):  # sesión, usuario, estados, semana
+            respuesta = self.client.get(reverse('home'))
+        self.assertEqual(respuesta.context['habitaciones_ocupadas'], 1)
+        self.assertEqual(respuesta.context['habitaciones_limpieza'], 1)
+        self.assertEqual(respuesta.context['reservas_semanales'], 1)
+        self.assertEqual(respuesta.context['ingresos_semanales'], Decimal('180.00'))
+
+
+class IndicesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        pisos = Piso.objects.bulk_create(Piso(numero=n, version=3) for n in range(1, 21))
+        # Como en producción, casi ninguna habitación cambió desde la última versión
+        habitaciones = Habitacion.objects.bulk_create(
+            Habitacion(numero=f'{p.numero}-{i}', piso=p, precio_noche=100, activo=i % 10 != 0,
+                       version=3 if i == 0 else i % 2)
+            for p in pisos for i in range(50)
+        )
+        cliente = Cliente.objects.create(dni='9100001', nombrecompleto='Carga Masiva')
+        inicio = timezone.now() - timedelta(days=730)
+        estados = ('FINALIZADA', 'FINALIZADA', 'FINALIZADA', 'CANCELADA')
+        Reserva.objects.bulk_create(
+            Reserva(habitacion=habitaciones[i % len(habitaciones)], cliente=cliente,
+                    fecha_entrada=inicio + timedelta(hours=3 * i), fecha_salida=inicio + timedelta(hours=3 * i + 40),
+                    estado=estados[i % len(estados)], costo_total=100)
+            for i in range(5000)
+        )
+        Producto.objects.bulk_create(
+            Producto(nombre=f'Producto {i:04}', precio_venta=5, stock=10, activo=i % 5 != 0)
+            for i in range(2000)
+        )
+        indices.analizar()
+
+    def test_cada_consulta_caliente_usa_su_indice(self):
+        piso = Piso.objects.get(numero=7).pk
+        for nombre, (consulta, usado, plan) in indices.verificar(piso).items():
+            with self.subTest(nombre):
+                self.assertIsNotNone(usado, f"ninguno de {consulta.indices} aparece en:\n{plan}")
+
+    def test_comando_reporta_cada_consulta(self):
+        salida = io.StringIO()
+        call_command('verificar_indices', stdout=salida)
+        for nombre in indices.aplicables():
+            self.assertIn(f'OK     {nombre}', salida.getvalue())
+
+    def test_acepta_el_indice_de_la_clave_foranea(self):
+        consulta = indices.CONSULTAS['recepcion_cambios']
+        nombres = indices._nombres(consulta, Habitacion._meta.db_table)
+        fk = [n for n in nombres if n != 'habitacion_piso_version_idx']
+        self.assertIn('habitacion_piso_version_idx', nombres)
+        # Django nombra el índice de la FK con un hash: se encuentra por columnas
+        self.assertEqual(len(fk), 1)
+        self.assertIn('piso_id', fk[0])
+
+    def test_base_recien_migrada_no_falla(self):
+        Reserva.objects.all().delete()
+        Habitacion.objects.all().delete()
+        Piso.objects.all().delete()
+        Producto.objects.all().delete()
+        call_command('verificar_indices', stdout=io.StringIO())
+
+
+class ReportesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('reportes', 'r@hotel.com', 'x')
+        cliente = Cliente.objects.create(dni='9000001', nombrecompleto='Eva Salas')
+        cls.simple = TipoHabitacion.objects.create(nombre='Simple')
+        cls.doble = TipoHabitacion.objects.create(nombre='Doble')
+        piso1, piso2 = Piso.objects.create(numero=1), Piso.objects.create(numero=2)
+        cls.h1 = Habitacion.objects.create(numero='101', piso=piso1, tipo=cls.simple, precio_noche=100)
+        cls.h2 = Habitacion.objects.create(numero='201', piso=piso2, tipo=cls.doble, precio_noche=80)
+        local = lambda *a: timezone.make_aware(datetime(*a))  # noqa: E731
+        # Noches 2, 3 y 4 de marzo; 100 repartido con el redondeo en la última
+        Reserva.objects.create(habitacion=cls.h1, cliente=cliente, estado='FINALIZADA',
+                               fecha_entrada=local(2026, 3, 2, 15), fecha_salida=local(2026, 3, 5, 11),
+                               costo_total=Decimal('110.00'), costo_productos=Decimal('10.00'))
+        Reserva.objects.create(habitacion=cls.h2, cliente=cliente, estado='FINALIZADA',
+                               fecha_entrada=local(2026, 3, 4, 15), fecha_salida=local(2026, 3, 5, 10),
+                               costo_total=Decimal('80.00'))
+        Reserva.objects.create(habitacion=cls.h2, cliente=cliente, estado='CANCELADA',
+                               fecha_entrada=local(2026, 3, 2, 15), fecha_salida=local(2026, 3, 3, 10),
+                               costo_total=Decimal('80.00'))
+
+        bebidas = Categoria.objects.create(nombre='Bebidas')
+        cafe = Producto.objects.create(nombre='Café', categoria=bebidas, precio_venta=Decimal('7.50'))
+        te = Producto.objects.create(nombre='Té', categoria=bebidas, precio_venta=Decimal('5.00'))
+        venta = Venta.objects.create(usuario=cls.user)
+        Venta.objects.filter(pk=venta.pk).update(fecha_venta=local(2026, 3, 3, 12))
+        DetalleVenta.objects.create(venta=venta, producto=cafe, cantidad=2, precio_unitario=Decimal('7.50'))
+        DetalleVenta.objects.create(venta=venta, producto=te, cantidad=1, precio_unitario=Decimal('5.00'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.desde, self.hasta = date(2026, 3, 1), date(2026, 3, 7)
+
+    def test_consolidar_reparte_ingreso_por_noche(self):
+        self.assertEqual(reportes.consolidar(self.desde, self.hasta), (4, 2))
+        noches = NocheHabitacion.objects.filter(habitacion=self.h1).order_by('fecha')
+        self.assertEqual([n.fecha.day for n in noches], [2, 3, 4])
+        self.assertEqual([n.ingreso for n in noches], [Decimal('33.33'), Decimal('33.33'), Decimal('33.34')])
+
+        # Reconsolidar el rango reemplaza los hechos en lugar de duplicarlos
+        call_command('consolidar_reportes', desde=self.desde, hasta=self.hasta, stdout=mock.Mock())
+        self.assertEqual(NocheHabitacion.objects.count(), 4)
+        self.assertEqual(VentaProductoDia.objects.count(), 2)
+
+    def test_reconsolidar_los_ultimos_dias_recalcula_la_estadia_entera(self):
+        local = lambda *a: timezone.make_aware(datetime(*a))  # noqa: E731
+        reserva = Reserva.objects.create(habitacion=self.h2, cliente=Cliente.objects.get(dni='9000001'),
+                                         estado='ACTIVA', fecha_entrada=local(2026, 3, 10, 15),
+                                         fecha_salida=local(2026, 3, 14, 11), costo_total=Decimal('400.00'))
+        reportes.consolidar(date(2026, 3, 10), date(2026, 3, 13))
+
+        # Se alarga dos noches con otra tarifa; la corrida nocturna solo mira tres días
+        Reserva.objects.filter(pk=reserva.pk).update(fecha_salida=local(2026, 3, 16, 11),
+                                                     costo_total=Decimal('900.00'))
+        call_command('consolidar_reportes', hasta=date(2026, 3, 15), dias=3, stdout=mock.Mock())
+        noches = NocheHabitacion.objects.filter(reserva=reserva).order_by('fecha')
+        self.assertEqual([n.fecha.day for n in noches], [10, 11, 12, 13, 14, 15])
+        self.assertEqual({n.ingreso for n in noches}, {Decimal('150.00')})
+
+        # Al cancelarla desaparecen también sus noches fuera de la ventana
+        Reserva.objects.filter(pk=reserva.pk).update(estado='CANCELADA')
+        call_command('consolidar_reportes', hasta=date(2026, 3, 15), dias=1, stdout=mock.Mock())
+        self.assertFalse(NocheHabitacion.objects.filter(reserva=reserva).exists())
+
+    def test_ocupacion_adr_y_revpar(self):
+        reportes.consolidar(self.desde, self.hasta)
+        por_dia = {f['periodo']: f for f in reportes.ocupacion(self.desde, self.hasta)}
+        self.assertEqual(len(por_dia), 7)
+        dia4 = por_dia[date(2026, 3, 4)]
+        self.assertEqual((dia4['vendidas'], dia4['disponibles'], dia4['ocupacion']), (2, 2, Decimal('100.00')))
+        self.assertEqual((dia4['ingreso'], dia4['adr'], dia4['revpar']),
+                         (Decimal('113.34'), Decimal('56.67'), Decimal('56.67')))
+        dia1 = por_dia[date(2026, 3, 1)]
+        self.assertEqual((dia1['vendidas'], dia1['ocupacion'], dia1['adr']), (0, Decimal('0.00'), None))
+
+        # Semana del lunes 2 de marzo por tipo: 6 días x 1 habitación cada tipo
+        semana = {f['grupo']: f for f in reportes.ocupacion(self.desde, self.hasta, 'semana', por='tipo')
+                  if f['periodo'] == date(2026, 3, 2)}
+        self.assertEqual((semana['Simple']['vendidas'], semana['Simple']['disponibles']), (3, 6))
+        self.assertEqual(semana['Simple']['ocupacion'], Decimal('50.00'))
+        self.assertEqual(semana['Doble']['revpar'], Decimal('13.33'))
+
+    def test_ventas_por_categoria_y_vista(self):
+        reportes.consolidar(self.desde, self.hasta)
+        self.assertEqual(reportes.ventas_por_categoria(self.desde, self.hasta, 'mes'), [
+            {'periodo': date(2026, 3, 1), 'categoria': 'Bebidas', 'cantidad': 3, 'ingreso': Decimal('20.00')},
+        ])
+
+        respuesta = self.client.get(reverse('reporte_ocupacion'), {
+            'desde': '2026-03-01', 'hasta': '2026-03-07', 'periodo': 'mes', 'agrupar': 'piso',
+        })
+        self.assertEqual([(f['grupo'], f['vendidas']) for f in respuesta.context['filas']], [(1, 3), (2, 1)])
+
+
+class ExportarTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('contabilidad', 'c@hotel.com', 'x')
+        cls.cliente = Cliente.objects.create(dni='9100001', nombrecompleto='Ana "La" Pérez')
+        cafe = Producto.objects.create(nombre='Café', precio_venta=Decimal('7.50'))
+        local = lambda *a: timezone.make_aware(datetime(*a))  # noqa: E731
+        for dia, cantidad in ((3, 2), (20, 5)):
+            venta = Venta.objects.create(usuario=cls.user, cliente=cls.cliente, total_venta=cantidad * Decimal('7.50'))
+            Venta.objects.filter(pk=venta.pk).update(fecha_venta=local(2026, 3, dia, 12))
+            DetalleVenta.objects.create(venta=venta, producto=cafe, cantidad=cantidad, precio_unitario=Decimal('7.50'))
+
+        habitacion = Habitacion.objects.create(numero='901', piso=Piso.objects.create(numero=9), precio_noche=100)
+        reserva = Reserva.objects.create(habitacion=habitacion, cliente=cls.cliente, estado='FINALIZADA',
+                                         fecha_entrada=local(2026, 3, 2, 15), fecha_salida=local(2026, 3, 4, 11),
+                                         costo_total=Decimal('200.00'))
+        Pago.objects.create(reserva=reserva, tipo_pago=TipoPago.objects.create(nombre='Tarjeta'),
+                            monto_recibido=Decimal('200.00'))
+        Acompanante.objects.create(reserva=reserva, nombre_completo='Juan Pérez', dni='9100002')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def exportar(self, recurso, **params):
+        respuesta = self.client.get(reverse('exportar', args=[recurso]), params)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return b''.join(respuesta.streaming_content)
+
+    def test_csv_de_ventas_con_rango_de_fechas(self):
+        contenido = self.exportar('ventas', desde='2026-03-01', hasta='2026-03-10').decode('utf-8-sig')
+        filas = list(csv.reader(io.StringIO(contenido)))
+        self.assertEqual(filas[0][:2], ['Venta', 'Fecha'])
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][1], '2026-03-03 12:00:00')
+        self.assertEqual(filas[1][4], 'Ana "La" Pérez')
+        self.assertEqual([Decimal(v) for v in filas[1][7:10]], [2, Decimal('7.50'), Decimal('15.00')])
+
+    def test_xlsx_es_un_libro_valido(self):
+        contenido = self.exportar('ventas', formato='xlsx')
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            self.assertIsNone(libro.testzip())
+            hoja = libro.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(hoja.count('<row>'), 3)
+        self.assertIn('Ana "La" Pérez', hoja)
+        self.assertIn('<c><v>37.50</v></c>', hoja)
+
+    def test_reservas_incluyen_pago_y_acompanantes(self):
+        filas = list(csv.reader(io.StringIO(self.exportar('reservas').decode('utf-8-sig'))))
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][11:13], ['Tarjeta', '200.00'])
+        self.assertEqual(filas[1][14], 'Juan Pérez (9100002)')
+
+    @mock.patch('Cristal_app.exportar.FILAS_POR_PARTE', 1)
+    async def test_bajo_asgi_envia_por_partes_sin_acumular(self):
+        await self.async_client.aforce_login(self.user)
+        respuesta = await self.async_client.get(reverse('exportar', args=['ventas']))
+        # un iterador síncrono haría que Django lo junte entero con sync_to_async(list)
+        self.assertTrue(respuesta.is_async)
+        partes = [parte async for parte in respuesta.streaming_content]
+        self.assertEqual(len(partes), 3)  # encabezado y primera venta, segunda venta, cierre vacío
+        filas = list(csv.reader(io.StringIO(b''.join(partes).decode('utf-8-sig'))))
+        self.assertEqual([f[7] for f in filas], ['Cantidad', '2', '5'])
+
+    def test_requiere_permiso_y_recurso_conocido(self):
+        self.assertEqual(self.client.get(reverse('exportar', args=['nada'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('exportar', args=['ventas']), {'formato': 'pdf'}).status_code, 400)
+        self.client.force_login(User.objects.create_user('sinpermiso', password='x'))
+        self.assertEqual(self.client.get(reverse('exportar', args=['ventas'])).status_code, 403)
+
+
+class DatosSinteticosTests(TestCase):
+
+    ESCALA = sintetico.ESCALAS['chica']._replace(pisos=2, habitaciones_por_piso=5, clientes=40, dias=30)
+    HASTA = date(2026, 3, 15)
+
+    def firma(self):
+        return list(Reserva.objects.order_by('habitacion__numero', 'fecha_entrada').values_list(
+            'habitacion__numero', 'cliente__dni', 'fecha_entrada', 'estado', 'costo_total'))
+
+    def generar_y_descartar(self, semilla):
+        with transaction.atomic():
+            sintetico.generar(self.ESCALA, semilla, self.HASTA)
+            firma = self.firma()
+            transaction.set_rollback(True)
+        return firma
+
+    def test_misma_semilla_mismos_datos(self):
+        primera = self.generar_y_descartar(3)
+        self.assertTrue(primera)
+        self.assertEqual(self.generar_y_descartar(3), primera)
+        self.assertNotEqual(self.generar_y_descartar(4), primera)
+
+    def test_datos_derivados_coherentes(self):
+        totales = sintetico.generar(self.ESCALA, 1, self.HASTA)
+        self.assertTrue(all(totales[m] for m in (Reserva, Pago, Venta, DetalleVenta, Compra, MovimientoStock)))
+
+        # Fechas históricas, y auto_now_add vuelve a funcionar después
+        self.assertLess(Reserva.objects.earliest('fecha_creacion').fecha_creacion.date(), self.HASTA)
+        self.assertLess(Venta.objects.latest('fecha_venta').fecha_venta.date(), self.HASTA + timedelta(days=1))
+        nueva = Venta.objects.create(usuario=sintetico.usuario_sintetico(), fecha_venta=timezone.make_aware(datetime(2020, 1, 1, 12)))
+        self.assertEqual(nueva.fecha_venta.year, timezone.now().year)
+
+        # Stock compactado igual a sus movimientos y nunca negativo
+        for producto in Producto.objects.annotate(movido=Sum('movimientos__cantidad')):
+            self.assertEqual(producto.stock, producto.movido or 0)
+            self.assertGreaterEqual(producto.stock, 0)
+        activas = dict(Reserva.objects.filter(estado='ACTIVA').values_list('habitacion_id', 'pk'))
+        self.assertEqual(dict(Habitacion.objects.exclude(reserva_activa=None)
+                              .values_list('pk', 'reserva_activa_id')), activas)
+        self.assertEqual(Habitacion.objects.filter(estado='OCUPADA').count(), len(activas))
+        self.assertTrue(EstadisticaDiaria.objects.exists())
+        self.assertTrue(NocheHabitacion.objects.exists())
+
+    def test_fila_copy_resuelve_relaciones_y_escapa(self):
+        # Lo que COPY recibe en PostgreSQL; la venta aún no tenía pk al asignarla
+        venta = Venta(usuario=sintetico.usuario_sintetico(), total_venta=Decimal('12.50'))
+        reserva = Reserva(habitacion_id=7, cliente_id=9, venta=venta, fecha_salida=timezone.now(),
+                          observaciones='tab\tsalto\nbarra\\')
+        venta.pk = 41
+        columnas = dict(zip([c.attname for c in Reserva._meta.concrete_fields],
+                            sintetico._fila_copy(reserva).rstrip('\n').split('\t')))
+        self.assertEqual(columnas['id'], r'\N')
+        self.assertEqual(columnas['venta_id'], '41')
+        self.assertEqual(columnas['observaciones'], r'tab\tsalto\nbarra\\')
+
+    def test_comando_exige_base_vacia(self):
+        Cliente.objects.create(dni='1111111', nombrecompleto='Cliente Real')
+        with self.assertRaisesMessage(CommandError, 'base vacía'):
+            call_command('generar_datos', '--escala', 'chica', stdout=io.StringIO())
+
+
+class ImportarTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('carga', 'carga@hotel.com', 'x')
+        cls.existente = Cliente.objects.create(dni='7000001', nombrecompleto='Rosa Díaz', activo=False)
+        bebidas = Categoria.objects.create(nombre='Bebidas')
+        cls.agua = Producto.objects.create(nombre='Agua', categoria=bebidas, precio_venta=Decimal('2.00'))
+        inventario.registrar([(cls.agua.pk, 5)], 'AJUSTE')
+
+    def test_clientes_crea_actualiza_y_reporta_filas_invalidas(self):
+        archivo = io.StringIO(
+            'DNI;nombrecompleto;telefono\n'
+            '7000001;Rosa Díaz Vega;999111222\n'
+            '7000002;Carlos Ruiz;\n'
+            '123456789;DNI largo;\n'
+            '7000002;Repetido;\n'
+            ';;\n'
+            '7000003;;\n'
+        )
+        resultado = importar.importar('clientes', archivo)
+
+        self.assertEqual((resultado.creados, resultado.actualizados), (1, 1))
+        self.assertEqual([linea for linea, _, _ in resultado.errores], [4, 5, 7])
+        self.assertIn('repetido', resultado.errores[1][2])
+        self.existente.refresh_from_db()
+        self.assertEqual((self.existente.nombrecompleto, self.existente.telefono), ('Rosa Díaz Vega', '999111222'))
+        # Sin columna "activo" el valor existente no se toca
+        self.assertFalse(self.existente.activo)
+        self.assertTrue(Cliente.objects.get(dni='7000002').activo)
+
+        reporte = io.StringIO()
+        resultado.escribir_reporte(reporte)
+        self.assertEqual(reporte.getvalue().splitlines()[0], 'linea,error,dni,nombrecompleto,telefono')
+
+    def test_productos_por_lotes_con_categoria_y_stock(self):
+        archivo = io.StringIO(
+            'nombre,categoria,precio_venta,stock,activo\n'
+            'Agua,Bebidas,2.50,8,si\n'
+            'Gaseosa,Bebidas,4.00,12,\n'
+            'Galletas,Snacks,3.00,,no\n'
+        )
+        with self.assertNumQueries(14):  # unas 7 por lote, no por fila
+            resultado = importar.importar('productos', archivo, usuario=self.user, lote=2)
+
+        self.assertEqual((resultado.creados, resultado.actualizados, resultado.errores), (2, 1, []))
+        self.assertEqual(inventario.stock_actual(self.agua.pk), 8)
+        self.assertEqual(Producto.objects.get(pk=self.agua.pk).precio_venta, Decimal('2.50'))
+        galletas = Producto.objects.get(nombre='Galletas')
+        self.assertEqual((galletas.categoria.nombre, galletas.activo, inventario.stock_actual(galletas.pk)),
+                         ('Snacks', False, 0))
+        self.assertEqual(inventario.stock_actual(Producto.objects.get(nombre='Gaseosa').pk), 12)
+
+    def test_clientes_invalidan_el_tablero(self):
+        recepcion.pisos_activos()
+        with self.captureOnCommitCallbacks(execute=True):
+            importar.importar('clientes', io.StringIO('dni,nombrecompleto\n7000001,Rosa Díaz Vega\n'))
+        # bulk_update no envía post_save: la importación descarta el snapshot
+        with self.assertNumQueries(1):
+            recepcion.pisos_activos()
+
+    def test_nombre_con_varios_registros_se_rechaza(self):
+        Proveedor.objects.bulk_create([Proveedor(nombre='Distribuidora Sur'), Proveedor(nombre='Distribuidora Sur')])
+        archivo = io.StringIO('nombre,telefono\nDistribuidora Sur,999000111\nLácteos Norte,\n')
+        resultado = importar.importar('proveedores', archivo)
+
+        self.assertEqual((resultado.creados, resultado.actualizados), (1, 0))
+        self.assertEqual([(linea, motivo) for linea, _, motivo in resultado.errores],
+                         [(2, 'nombre: hay varios registros con este valor')])
+        self.assertFalse(Proveedor.objects.filter(telefono='999000111').exists())
+
+    def test_faltan_columnas_obligatorias(self):
+        resultado = importar.importar('proveedores', io.StringIO('telefono\n123\n'))
+        self.assertEqual(resultado.errores, [(1, {}, 'faltan columnas: nombre')])
+
+    def test_vista_y_reporte_descargable(self):
+        self.client.force_login(self.user)
+        archivo = SimpleUploadedFile('clientes.csv', 'dni,nombrecompleto\n7000009,Ana Gil\n,Sin DNI\n'.encode())
+        respuesta = self.client.post(reverse('importar', args=['clientes']), {'archivo': archivo})
+        self.assertEqual(respuesta.context['resultado'].creados, 1)
+
+        reporte = self.client.get(reverse('importar_reporte', args=[respuesta.context['reporte']]))
+        self.assertEqual(reporte['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('Sin DNI', reporte.content.decode('utf-8-sig'))
+
+    def test_comando_escribe_reporte_de_errores(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'proveedores.csv')
+            with open(ruta, 'w', encoding='utf-8') as f:
+                f.write('nombre,email\nDistribuidora Sur,ventas@sur.pe\nMal Correo,no-es-email\n')
+            call_command('importar_csv', 'proveedores', ruta, stdout=io.StringIO())
+            with open(ruta + '.errores.csv', encoding='utf-8') as f:
+                self.assertIn('Mal Correo', f.read())
+        self.assertTrue(Proveedor.objects.filter(nombre='Distribuidora Sur').exists())
+
+
+class ClienteAutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('recepcion', 'rec@hotel.com', 'x')
+        Cliente.objects.bulk_create(
+            [Cliente(dni=f'4{i:07d}', nombrecompleto=f'Huésped {i:02d} Torres') for i in range(25)]
+            + [Cliente(dni='55500001', nombrecompleto='María José Quispe'),
+               Cliente(dni='55500002', nombrecompleto='José Quispe Mamani', activo=False)]
+        )
+        cls.maria = Cliente.objects.get(dni='55500001')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def buscar(self, q):
+        return self.client.get(reverse('cliente_buscar'), {'q': q}).json()
+
+    def test_busca_por_prefijo_de_dni_y_palabras_del_nombre(self):
+        self.assertEqual(self.buscar('5550')['results'], [{'id': self.maria.pk, 'text': '55500001 - María José Quispe'}])
+        # Cada palabra filtra por separado y los inactivos no aparecen
+        self.assertEqual([r['id'] for r in self.buscar('quispe josé')['results']], [self.maria.pk])
+        self.assertEqual(self.buscar('jo')['results'], [])
+
+    def test_pagina_de_resultados(self):
+        datos = self.buscar('torres')
+        self.assertEqual(len(datos['results']), 20)
+        self.assertTrue(datos['pagination']['more'])
+        self.assertEqual(datos['results'][0]['text'], '40000000 - Huésped 00 Torres')
+
+    def test_el_formulario_solo_renderiza_el_cliente_elegido(self):
+        vacio = str(ReservaForm()['cliente'])
+        self.assertEqual(vacio.count('<option'), 1)
+
+        form = ReservaForm(initial={'cliente': self.maria.pk})
+        with self.assertNumQueries(1):
+            html = str(form['cliente'])
+        self.assertEqual(html.count('<option'), 2)
+        self.assertIn('55500001 - María José Quispe', html)
+        self.assertIn(reverse('cliente_buscar'), html)
+
+
+class OpcionesProductoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = Producto.objects.bulk_create(
+            [Producto(nombre=f'Producto {i:02d}', precio_venta=1) for i in range(40)])
+
+    def setUp(self):
+        cache.clear()
+
+    def datos(self, lineas):
+        datos = {'detalleventa_set-TOTAL_FORMS': str(lineas), 'detalleventa_set-INITIAL_FORMS': '0'}
+        for i in range(lineas):
+            datos.update({f'detalleventa_set-{i}-producto': str(self.productos[i].pk),
+                          f'detalleventa_set-{i}-cantidad': '1',
+                          f'detalleventa_set-{i}-precio_unitario': '1.00'})
+        return datos
+
+    def test_treinta_lineas_consultan_el_catalogo_una_vez(self):
+        with self.assertNumQueries(2):  # catálogo + productos elegidos
+            fs = DetalleVentaFormSet(self.datos(30))
+            self.assertTrue(fs.is_valid())
+            html = [str(f['producto']) for f in fs]
+        self.assertEqual(fs.forms[3].cleaned_data['producto'], self.productos[3])
+        # Cada fila lleva solo su opción elegida, no el catálogo entero
+        self.assertEqual(html[3].count('<option'), 2)
+        self.assertIn('Producto 03', html[3])
+
+        with self.assertNumQueries(1):  # el catálogo ya está en memoria
+            self.assertTrue(DetalleVentaFormSet(self.datos(30)).is_valid())
+
+    def test_producto_inexistente_es_invalido(self):
+        datos = self.datos(1)
+        datos['detalleventa_set-0-producto'] = '999999'
+        fs = DetalleVentaFormSet(datos)
+        self.assertFalse(fs.is_valid())
+        self.assertIn('producto', fs.errors[0])
+
+    def test_guardar_un_producto_invalida_las_opciones(self):
+        self.assertEqual(len(opciones.productos()), 41)
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre='Agua mineral', precio_venta=2)
+        self.assertIn('Agua mineral', [nombre for _, nombre in opciones.productos()])
+
+
+
+class PermisosCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grupo = Group.objects.create(name='Recepción')
+        cls.grupo.permissions.add(Permission.objects.get(codename='view_cliente'))
+        cls.user = User.objects.create_user('caja', 'caja@hotel.com', 'x')
+        cls.user.groups.add(cls.grupo)
+
+    def setUp(self):
+        cache.clear()
+
+    def usuario(self):
+        # Instancia nueva: sin el _perm_cache que guarda cada objeto
+        return User.objects.get(pk=self.user.pk)
+
+    def test_los_permisos_se_leen_de_la_cache_compartida(self):
+        self.assertTrue(self.usuario().has_perm('Cristal_app.view_cliente'))
+        user = self.usuario()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('Cristal_app.view_cliente'))
+            self.assertFalse(user.has_perm('auth.view_user'))
+
+    def test_cambios_de_rol_y_de_usuario_invalidan(self):
+        self.assertFalse(self.usuario().has_perm('Cristal_app.view_venta'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grupo.permissions.add(Permission.objects.get(codename='view_venta'))
+        self.assertTrue(self.usuario().has_perm('Cristal_app.view_venta'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.grupo)
+        self.assertFalse(self.usuario().has_perm('Cristal_app.view_cliente'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grupo.user_set.add(self.user)
+        self.assertTrue(self.usuario().has_perm('Cristal_app.view_cliente'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            self.usuario().save()
+        self.assertFalse(self.usuario().has_perm('Cristal_app.view_cliente'))
+
+    def test_menu_lateral_filtrado_sin_consultas_de_permisos(self):
+        self.client.force_login(self.user)
+        self.usuario().has_perm('Cristal_app.view_cliente')
+        respuesta = self.client.get(reverse('cliente_list'))
+        self.assertContains(respuesta, reverse('cliente_list'))
+        self.assertNotContains(respuesta, reverse('user_list'))
+        self.assertNotContains(respuesta, reverse('producto_list'))
+        self.assertFalse(any('auth_permission' in forma for forma in respuesta.wsgi_request.consultas.formas))
+
+    def test_formulario_de_usuario_usa_las_opciones_compartidas(self):
+        CustomUserChangeForm(instance=self.user)
+        with self.assertNumQueries(2):  # solo los roles y permisos propios del usuario
+            form = CustomUserChangeForm(instance=self.user)
+            opciones_permisos = form.fields['user_permissions'].choices
+        self.assertEqual(len(opciones_permisos), Permission.objects.count())
+
+
+class ConfigurarCachesTests(TestCase):
+
+    def test_modos(self):
+        backends = {
+            modo: configurar_caches(modo, base_dir=Path('/srv/cristal'))['default']
+            for modo in ('local', 'archivo', 'bd', 'redis')
+        }
+        self.assertTrue(backends['local']['BACKEND'].endswith('LocMemCache'))
+        self.assertEqual(backends['archivo']['LOCATION'], '/srv/cristal/cache')
+        self.assertEqual(backends['bd']['LOCATION'], 'cristal_cache')
+        self.assertTrue(backends['redis']['LOCATION'].startswith('redis://'))
+        with self.assertRaises(ImproperlyConfigured):
+            configurar_caches('memcached')
+
+    def assertVersionCompartida(self, caches):
+        # Otro CacheHandler sobre la misma configuración hace de segundo worker
+        with override_settings(CACHES=caches):
+            otro_worker = CacheHandler()['default']
+            clave = permisos.clave_permisos(1)
+            self.assertEqual(otro_worker.get('permisos:usuario:1:ver'), int(clave.split(':')[-1]))
+            with self.captureOnCommitCallbacks(execute=True):
+                permisos.invalidar_usuario(1)
+            self.assertNotEqual(permisos.clave_permisos(1), clave)
+            self.assertEqual(otro_worker.get('permisos:usuario:1:ver'), int(clave.split(':')[-1]) + 1)
+            cache.clear()
+
+    def test_modo_archivo_se_comparte_entre_workers(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            self.assertVersionCompartida(configurar_caches('archivo', directorio))
+
+    def test_modo_bd_se_comparte_entre_workers(self):
+        caches = configurar_caches('bd')
+        with override_settings(CACHES=caches):
+            call_command('createcachetable', verbosity=0)
+        self.assertVersionCompartida(caches)
+
+
+class LayoutCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@hotel.com', 'x')
+        grupo = Group.objects.create(name='Recepción')
+        grupo.permissions.add(Permission.objects.get(codename='view_cliente'))
+        cls.cajeros = [User.objects.create_user(f'caja{i}', f'caja{i}@hotel.com', 'x') for i in range(2)]
+        for u in cls.cajeros:
+            u.groups.add(grupo)
+
+    def setUp(self):
+        cache.clear()
+
+    def clave_menu(self, user):
+        return make_template_fragment_key('layout_menu', [layout.rol(user), layout._version()])
+
+    def test_mismo_rol_comparte_el_fragmento(self):
+        primero, segundo = self.cajeros
+        self.assertEqual(layout.rol(primero), layout.rol(segundo))
+        self.assertNotEqual(layout.rol(primero), layout.rol(self.admin))
+
+        self.client.force_login(primero)
+        self.client.get(reverse('cliente_list'))
+        menu = cache.get(self.clave_menu(segundo))
+        self.assertIn(reverse('cliente_list'), menu)
+        self.assertNotIn(reverse('user_list'), menu)
+
+        self.client.force_login(segundo)
+        respuesta = self.client.get(reverse('cliente_list'))
+        self.assertContains(respuesta, menu, html=False)
+        self.assertContains(respuesta, 'caja1')  # el panel del usuario queda fuera del fragmento
+
+    def test_invalidar_descarta_los_fragmentos(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('home'))
+        clave = self.clave_menu(self.admin)
+        self.assertIsNotNone(cache.get(clave))
+        with self.captureOnCommitCallbacks(execute=True):
+            layout.invalidar()
+        self.assertNotEqual(self.clave_menu(self.admin), clave)
+        self.assertIsNone(cache.get(self.clave_menu(self.admin)))
+
+
+class EstaticosTests(SimpleTestCase):
+    """Recolecta una vez en un directorio temporal y sirve desde ahí."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directorio = tempfile.TemporaryDirectory()
+        cls.enterClassContext(cls.directorio)
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.directorio.name, ESTATICOS_SERVIR=True))
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def prefijo(self):
+        return '/' + settings.STATIC_URL.lstrip('/')
+
+    def test_solo_se_recolecta_lo_referenciado(self):
+        recolectados = {ruta for ruta, _ in estaticos.ReferenciadosFinder().list([])}
+        self.assertIn('adminlte/plugins/jquery/jquery.min.js', recolectados)
+        self.assertIn('js/cliente_autocomplete.js', recolectados)  # Media de un widget
+        self.assertIn('adminlte/plugins/fontawesome-free/webfonts/fa-solid-900.woff2', recolectados)  # url() del CSS
+        self.assertNotIn('adminlte/plugins/moment/moment.min.js', recolectados)
+        self.assertFalse(os.path.exists(os.path.join(self.directorio.name, 'adminlte/plugins/moment')))
+
+    def test_nombres_con_hash_comprimidos_e_inmutables(self):
+        url = static('adminlte/dist/css/adminlte.min.css')
+        self.assertRegex(url, r'adminlte\.min\.[0-9a-f]{12}\.css$')
+
+        respuesta = Client().get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(respuesta['Vary'], 'Accept-Encoding')
+        self.assertEqual(respuesta['Cache-Control'], estaticos.CACHE_INMUTABLE)
+        self.assertTrue(respuesta['Content-Type'].startswith('text/css'))
+        with open(os.path.join(self.directorio.name, url.removeprefix(self.prefijo())), 'rb') as original:
+            self.assertEqual(gzip.decompress(b''.join(respuesta.streaming_content)), original.read())
+
+    def test_sin_hash_o_sin_compresion(self):
+        respuesta = Client().get(self.prefijo() + 'js/producto_select.js')
+        self.assertNotIn('Content-Encoding', respuesta)
+        self.assertEqual(respuesta['Cache-Control'], estaticos.CACHE_CORTO)
+        self.assertEqual(Client().get(self.prefijo() + 'no/existe.js').status_code, 404)
+
+
+def imagen_png(ancho=1600, alto=1200):
+    salida = io.BytesIO()
+    Image.new('RGBA', (ancho, alto), (200, 30, 30, 128)).save(salida, 'PNG')
+    return salida.getvalue()
+
+
+class ImagenesProductoTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.enterClassContext(tempfile.TemporaryDirectory())))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('almacen', 'a@hotel.com', 'x')
+
+    def crear(self, nombre='Agua', contenido=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Producto.objects.create(
+                nombre=nombre, precio_venta=1,
+                imagen=SimpleUploadedFile(f'{nombre}.png', contenido or imagen_png(), content_type='image/png'),
+            )
+
+    def pedir(self, producto, ancho, formato):
+        self.client.force_login(self.user)
+        kwargs = {'huella': producto.imagen_huella, 'ancho': ancho, 'formato': formato}
+        return self.client.get(reverse('producto_imagen', kwargs=kwargs))
+
+    def test_al_subir_se_generan_las_miniaturas(self):
+        producto = self.crear()
+        self.assertEqual(len(producto.imagen_huella), 64)
+        for ancho in imagenes.ANCHOS:
+            for formato in imagenes.FORMATOS:
+                with default_storage.open(imagenes.nombre_derivada(producto.imagen_huella, ancho, formato)) as f:
+                    self.assertEqual(Image.open(f).width, ancho)
+        grande = default_storage.size(imagenes.nombre_derivada(producto.imagen_huella, 128, 'webp'))
+        self.assertLess(grande * 10, producto.imagen.size)
+
+    def test_el_listado_usa_srcset_y_no_el_original(self):
+        producto = self.crear()
+        self.client.force_login(self.user)
+        respuesta = self.client.get(reverse('producto_list'))
+        self.assertContains(respuesta, 'type="image/webp"')
+        self.assertContains(respuesta, default_storage.url(imagenes.nombre_derivada(producto.imagen_huella, 128, 'webp')))
+        self.assertNotContains(respuesta, producto.imagen.url)
+
+    def test_miniatura_faltante_se_genera_al_pedirla(self):
+        producto = self.crear()
+        nombre = imagenes.nombre_derivada(producto.imagen_huella, 320, 'jpeg')
+        default_storage.delete(nombre)
+        self.client.force_login(self.user)
+        kwargs = {'huella': producto.imagen_huella, 'ancho': 320, 'formato': 'jpeg'}
+        respuesta = self.client.get(reverse('producto_imagen', kwargs=kwargs))
+        self.assertEqual(respuesta['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertTrue(default_storage.exists(nombre))
+        kwargs['ancho'] = 100
+        self.assertEqual(self.client.get(reverse('producto_imagen', kwargs=kwargs)).status_code, 404)
+
+    def test_derivada_perdida_se_genera_aunque_exista_la_marca(self):
+        # Otra imagen (otra huella) para no afectar las derivadas de los demás tests
+        producto = self.crear('Jugo', imagen_png(800, 600))
+        nombre = imagenes.nombre_derivada(producto.imagen_huella, 64, 'webp')
+        default_storage.delete(nombre)
+        self.assertTrue(imagenes.generadas(producto.imagen_huella))
+
+        respuesta = self.pedir(producto, 64, 'webp')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(default_storage.exists(nombre))
+
+    def test_original_ilegible_responde_404(self):
+        producto = self.crear('Té', imagen_png(640, 480))
+        default_storage.delete(imagenes.nombre_derivada(producto.imagen_huella, 128, 'webp'))
+        default_storage.delete(producto.imagen.name)
+
+        with self.assertLogs('Cristal_app.imagenes', 'ERROR'):
+            respuesta = self.pedir(producto, 128, 'webp')
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_regenerar_imagenes_cubre_las_existentes(self):
+        nombre = default_storage.save('productos/vieja.png', ContentFile(imagen_png(300, 200)))
+        Producto.objects.create(nombre='Vieja', precio_venta=1)
+        Producto.objects.filter(nombre='Vieja').update(imagen=nombre)
+        salida = io.StringIO()
+        call_command('regenerar_imagenes', stdout=salida)
+        producto = Producto.objects.get(nombre='Vieja')
+        self.assertTrue(imagenes.generadas(producto.imagen_huella))
+        self.assertIn('6 miniaturas generadas', salida.getvalue())
@@ -5,10 +5,20 @@ from .views import (
     registrar_consumo,
     # Vistas de Recepción
     recepcion_view,
+    recepcion_cambios,
+    recepcion_eventos,
     ocupar_habitacion,
+    checkin_grupal,
     checkout_habitacion,
     marcar_limpieza,
     marcar_disponible,
+    disponibilidad_view,
+    # Reportes
+    reporte_ocupacion,
+    reporte_ventas,
+    exportar_view,
+    importar_view,
+    importar_reporte,
     # Usuarios
     UserListView, UserCreateView, UserUpdateView, UserDeleteView,
     # Roles
@@ -16,12 +26,12 @@ from .views import (
     # Almacén
     ProveedorListView, ProveedorCreateView, ProveedorUpdateView, ProveedorDeleteView,
     CategoriaListView, CategoriaCreateView, CategoriaUpdateView, CategoriaDeleteView,
-    ProductoListView, ProductoCreateView, ProductoUpdateView, ProductoDeleteView,
+    ProductoListView, ProductoCreateView, ProductoUpdateView, ProductoDeleteView, producto_imagen,
     # Compras/Ventas
     CompraListView, CompraCreateView, CompraUpdateView, CompraDeleteView,
     VentaListView, VentaCreateView, VentaUpdateView, VentaDeleteView,
     # Clientes
-    ClienteListView, ClienteCreateView, ClienteUpdateView, ClienteDeleteView,
+    ClienteListView, ClienteCreateView, ClienteUpdateView, ClienteDeleteView, cliente_buscar,
     # Mantenimiento
     TipoHabitacionListView, TipoHabitacionCreateView, TipoHabitacionUpdateView, TipoHabitacionDeleteView,
     PisoListView, PisoCreateView, PisoUpdateView, PisoDeleteView,
@@ -34,15 +44,32 @@ urlpatterns = [
 
     # RECEPCIÓN
     path('recepcion/', recepcion_view, name='recepcion'),
+    path('recepcion/cambios/<int:piso_id>/', recepcion_cambios, name='recepcion_cambios'),
+    path('recepcion/eventos/<int:piso_id>/', recepcion_eventos, name='recepcion_eventos'),
 
     # Consumos (desde la recepción)
     path('recepcion/<int:habitacion_id>/consumos/', registrar_consumo, name='registrar_consumo'),
 
     path('recepcion/ocupar/<int:pk>/', ocupar_habitacion, name='ocupar_habitacion'),
+    path('recepcion/checkin-grupal/', checkin_grupal, name='checkin_grupal'),
     path('recepcion/checkout/<int:pk>/', checkout_habitacion, name='checkout_habitacion'),
     path('recepcion/limpieza/<int:pk>/', marcar_limpieza, name='marcar_limpieza'),
     path('recepcion/disponible/<int:pk>/', marcar_disponible, name='marcar_disponible'),
 
+    # Disponibilidad por rango de fechas
+    path('recepcion/disponibilidad/', disponibilidad_view, name='disponibilidad'),
+
+    # Reportes
+    path('reportes/ocupacion/', reporte_ocupacion, name='reporte_ocupacion'),
+    path('reportes/ventas/',    reporte_ventas,    name='reporte_ventas'),
+
+    # Exportaciones (CSV/XLSX)
+    path('exportar/<slug:recurso>/', exportar_view, name='exportar'),
+
+    # Importaciones masivas (CSV)
+    path('importar/<slug:recurso>/', importar_view, name='importar'),
+    path('importar/reporte/<str:clave>/', importar_reporte, name='importar_reporte'),
+
     # CRUD Usuarios
     path('usuarios/',       UserListView.as_view(),   name='user_list'),
     path('usuarios/crear/', UserCreateView.as_view(), name='user_create'),
@@ -70,6 +97,7 @@ urlpatterns = [
     path('productos/crear/',  ProductoCreateView.as_view(), name='producto_create'),
     path('productos/editar/<int:pk>/',   ProductoUpdateView.as_view(), name='producto_update'),
     path('productos/eliminar/<int:pk>/', ProductoDeleteView.as_view(), name='producto_delete'),
+    path('productos/imagen/<slug:huella>/<int:ancho>.<str:formato>', producto_imagen, name='producto_imagen'),
 
     # CRUD Compras
     path('compras/',            CompraListView.as_view(),   name='compra_list'),
@@ -85,6 +113,7 @@ urlpatterns = [
 
     # CRUD Clientes
     path('clientes/',            ClienteListView.as_view(),   name='cliente_list'),
+    path('clientes/buscar/',     cliente_buscar,              name='cliente_buscar'),
     path('clientes/crear/',      ClienteCreateView.as_view(), name='cliente_create'),
     path('clientes/editar/<int:pk>/',   ClienteUpdateView.as_view(), name='cliente_update'),
     path('clientes/eliminar/<int:pk>/', ClienteDeleteView.as_view(), name='cliente_delete'),
@@ -1,4 +1,8 @@
 # Cristal_app/views.py
+import asyncio
+import io
+import json
+import uuid
 from decimal import Decimal
 from datetime import timedelta
 from django.urls import reverse
@@ -7,8 +11,16 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.models import Group
-from django.db import transaction
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, Sum
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.core.files.storage import default_storage
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.contrib.messages.views import SuccessMessageMixin
@@ -17,9 +29,11 @@ from django.views.generic import CreateView, DeleteView, ListView, UpdateView, V
 from django.views.decorators.http import require_POST
 from collections import defaultdict
 from django.db.models import Prefetch
+from . import disponibilidad, estadisticas, exportar, imagenes, importar, inventario, push, recepcion, reportes
+from .listados import ListadoKeysetMixin
 # Modelos
 from .models import (
-    Piso, Habitacion, Reserva,
+    Piso, Habitacion, Reserva, Pago, Acompanante,
     Proveedor, Categoria, Producto,
     Compra, DetalleCompra, Venta, DetalleVenta,
     Cliente, TipoHabitacion
@@ -30,47 +44,43 @@ from .forms import (
     CustomUserCreationForm, CustomUserChangeForm, GroupForm,
     CompraForm, DetalleCompraFormSet,
     VentaForm, DetalleVentaFormSet,
-    ClienteForm, ReservaForm, PagoForm, AcompananteFormSet
+    ClienteForm, ReservaForm, PagoForm, AcompananteFormSet, ProductoEdicionForm,
+    DisponibilidadForm, CheckinGrupalForm, ReporteForm, ImportarForm,
+    VentaFiltroForm, CompraFiltroForm, ClienteFiltroForm, ProductoFiltroForm, UserFiltroForm,
 )
 
 User = get_user_model()
 
+# Segundos sin eventos antes de enviar un keep-alive por SSE
+SSE_KEEPALIVE = 15
+
+
+class HabitacionNoDisponible(Exception):
+    """Una habitación dejó de estar disponible mientras se la ocupaba."""
+
 
 # =======================
 # HOME / DASHBOARD
 # =======================
 @login_required
 def home_view(request):
-    total_habitaciones = Habitacion.objects.count()
-    habitaciones_disponibles = Habitacion.objects.filter(estado='DISPONIBLE').count()
-    habitaciones_ocupadas = Habitacion.objects.filter(estado='OCUPADA').count()
-    habitaciones_limpieza = Habitacion.objects.filter(estado='LIMPIEZA').count()
+    # Estados en vivo con un solo agregado condicional
+    habitaciones = estadisticas.habitaciones_por_estado()
 
-    today = timezone.now().date()
+    today = timezone.localdate()
     start_of_week = today - timedelta(days=today.weekday())
     end_of_week = start_of_week + timedelta(days=6)
 
-    reservas_semanales = (
-        Reserva.objects
-        .filter(fecha_entrada__date__range=[start_of_week, end_of_week])
-        .exclude(estado='CANCELADA')
-        .count()
-    )
-
-    ingresos_semanales = (
-        Reserva.objects
-        .filter(fecha_entrada__date__range=[start_of_week, end_of_week])
-        .exclude(estado='CANCELADA')
-        .aggregate(total=Sum('costo_total'))['total'] or 0
-    )
+    # Reservas e ingresos de la semana desde los acumulados diarios
+    semana = estadisticas.semana(start_of_week, end_of_week)
 
     context = {
-        'total_habitaciones': total_habitaciones,
-        'habitaciones_disponibles': habitaciones_disponibles,
-        'habitaciones_ocupadas': habitaciones_ocupadas,
-        'habitaciones_limpieza': habitaciones_limpieza,
-        'reservas_semanales': reservas_semanales,
-        'ingresos_semanales': ingresos_semanales,
+        'total_habitaciones': habitaciones['total'],
+        'habitaciones_disponibles': habitaciones['disponibles'],
+        'habitaciones_ocupadas': habitaciones['ocupadas'],
+        'habitaciones_limpieza': habitaciones['limpieza'],
+        'reservas_semanales': semana['reservas'],
+        'ingresos_semanales': semana['ingresos'],
         'start_of_week': start_of_week,
         'end_of_week': end_of_week,
     }
@@ -81,54 +91,154 @@ def home_view(request):
 # RECEPCIÓN
 # =======================
 def recepcion_view(request):
-    pisos = Piso.objects.filter(activo=True).order_by('numero')
+    # Pisos y habitaciones salen del snapshot en caché (ver recepcion.py);
+    # solo se consulta la BD cuando cambió algo en el piso.
+    pisos = recepcion.pisos_activos()
 
     # Piso seleccionado en la URL (?piso=ID); si no, el primero activo
     piso_id = request.GET.get('piso')
     if piso_id:
-        piso_actual = get_object_or_404(Piso, pk=piso_id)
-    else:
-        piso_actual = pisos.first() if pisos.exists() else None
-
-    # Habitaciones del piso actual
-    if piso_actual:
-        habitaciones = (Habitacion.objects
-                        .filter(activo=True, piso=piso_actual)
-                        .select_related('tipo', 'piso')
-                        .order_by('numero'))
+        piso_actual = next((p for p in pisos if str(p.pk) == piso_id), None)
+        if piso_actual is None:
+            piso_actual = get_object_or_404(Piso, pk=piso_id)
     else:
-        habitaciones = Habitacion.objects.none()
-
-    # >>>>>>>>>> AQUÍ VA EL BLOQUE CLAVE <<<<<<<<<<
-    # Enlaza a cada habitación su reserva activa para evitar N+1 queries
-    if habitaciones.exists():
-        activas = (
-            Reserva.objects
-            .filter(estado='ACTIVA', habitacion__in=habitaciones)
-            .select_related('cliente', 'venta')  # objetos relacionados 1-1 / FK
-            .prefetch_related('acompanantes', 'venta__detalleventa_set__producto')  # m2m/one-to-many
-        )
-        mapa = {r.habitacion_id: r for r in activas}
-        for h in habitaciones:
-            h.reserva_activa = mapa.get(h.id)
-    else:
-        # Si no hay habitaciones, evita errores en plantilla
-        for h in habitaciones:
-            h.reserva_activa = None
-    # >>>>>>>>> FIN BLOQUE CLAVE <<<<<<<<<
+        piso_actual = pisos[0] if pisos else None
+
+    # Habitaciones del piso actual, cada una con su reserva activa enlazada
+    habitaciones = recepcion.habitaciones_piso(piso_actual.pk) if piso_actual else []
 
-    # Productos disponibles (para el modal de Consumos)
-    productos = Producto.objects.filter(activo=True, stock__gt=0).order_by('nombre')
+    # Catálogo para los modales de Consumos: se envía una sola vez por página
+    catalogo_version, catalogo = recepcion.catalogo_consumos()
 
     context = {
         'pisos': pisos,
         'piso_actual': piso_actual,
         'piso_sel': piso_actual.pk if piso_actual else None,
         'habitaciones': habitaciones,
-        'productos': productos,
+        'catalogo': catalogo,
+        'catalogo_version': catalogo_version,
+        # sin ASGI no hay canal en vivo: el tablero consulta los cambios
+        'canal_en_vivo': isinstance(request, ASGIRequest),
     }
     return render(request, 'Cristal_app/Recepcion/recepcion.html', context)
 
+@login_required
+def recepcion_cambios(request, piso_id):
+    """
+    Delta JSON del piso para tablets que consultan periódicamente.
+
+    ``?desde=<version>`` devuelve solo las habitaciones y reservas que cambiaron
+    después de esa versión, o 304 si el piso no cambió. Sin ``desde``, con una
+    versión desconocida o si desde entonces alguna fila salió del piso (borrada
+    o movida a otro, que el delta no puede listar) devuelve el estado completo.
+    """
+    piso = get_object_or_404(Piso.objects.only('id', 'version', 'version_bajas'), pk=piso_id)
+    try:
+        desde = int(request.GET.get('desde', ''))
+    except ValueError:
+        desde = None
+    if desde is not None and not piso.version_bajas <= desde <= piso.version:
+        desde = None
+
+    if desde == piso.version:
+        response = HttpResponseNotModified()
+        response['ETag'] = f'"{piso.version}"'
+        return response
+
+    habitaciones = Habitacion.objects.filter(piso_id=piso.pk)
+    reservas = Reserva.objects.filter(habitacion__piso_id=piso.pk)
+    if desde is None:
+        habitaciones = habitaciones.filter(activo=True)
+        reservas = reservas.filter(estado='ACTIVA')
+    else:
+        habitaciones = habitaciones.filter(version__gt=desde)
+        reservas = reservas.filter(version__gt=desde)
+
+    response = JsonResponse({
+        'piso': piso.pk,
+        'version': piso.version,
+        'completo': desde is None,
+        'habitaciones': list(
+            habitaciones.order_by('numero')
+            .values('id', 'numero', 'estado', 'activo', 'tipo__nombre', 'precio_noche', 'version')
+        ),
+        'reservas': list(
+            reservas.order_by('habitacion_id')
+            .values('id', 'habitacion_id', 'estado', 'cliente__nombrecompleto',
+                    'fecha_entrada', 'fecha_salida', 'costo_productos', 'costo_total', 'version')
+        ),
+    })
+    response['ETag'] = f'"{piso.version}"'
+    return response
+
+
+@login_required
+async def recepcion_eventos(request, piso_id):
+    """
+    Server-Sent Events con los cambios de habitaciones y consumos del piso.
+
+    Requiere servir la app por ASGI (``Cristal/asgi.py``): cada conexión queda
+    abierta y recibe lo que se publica en ``push.grupo_piso(piso_id)``. Bajo
+    WSGI cada pestaña ocuparía un hilo del servidor para siempre sin recibir
+    nada, así que se responde 204, con lo que ``EventSource`` deja de
+    reconectar; el tablero consulta entonces ``recepcion_cambios``.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    canal = push.get_canal()
+    grupo = push.grupo_piso(piso_id)
+    cola = canal.suscribir(grupo)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(cola.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # comentario SSE para mantener viva la conexión tras proxies
+                    yield ': ping\n\n'
+                    continue
+                yield f"event: {mensaje['tipo']}\ndata: {json.dumps(mensaje)}\n\n"
+        finally:
+            canal.desuscribir(grupo, cola)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _calcular_costos(reserva, precio_noche, descuento):
+    """Fija costo_habitacion/productos/total de una reserva nueva."""
+    # calcular noches (al menos 1)
+    delta = reserva.fecha_salida - reserva.fecha_entrada
+    noches = delta.days + (1 if delta.seconds > 0 else 0)
+    if noches <= 0:
+        noches = 1
+
+    reserva.costo_habitacion = Decimal(precio_noche) * noches
+    reserva.costo_productos = Decimal("0.00")
+
+    desc = Decimal(str(descuento or 0))
+    factor_desc = (Decimal("100.00") - desc) / Decimal("100.00")
+    reserva.costo_total = (reserva.costo_habitacion * factor_desc).quantize(Decimal("0.01"))
+
+
+def _tomar_habitaciones(habitaciones):
+    """
+    Pasa a OCUPADA todas las habitaciones dadas con un único UPDATE condicional
+    (compare-and-set sobre ``estado``). Devuelve False si alguna ya no estaba
+    DISPONIBLE; en ese caso el llamador debe revertir la transacción.
+    """
+    tomadas = (Habitacion.objects
+               .filter(pk__in=[h.pk for h in habitaciones], estado="DISPONIBLE")
+               .update(estado="OCUPADA"))
+    for hab in habitaciones:
+        hab.estado = "OCUPADA"
+    return tomadas == len(habitaciones)
+
+
 @login_required
 def ocupar_habitacion(request, pk):
     hab = get_object_or_404(Habitacion, pk=pk)
@@ -142,42 +252,39 @@ def ocupar_habitacion(request, pk):
         aformset = AcompananteFormSet(request.POST, prefix="acompanantes")
 
         if rform.is_valid() and pform.is_valid() and aformset.is_valid():
-            with transaction.atomic():
-                # 1) Reserva
-                reserva = rform.save(commit=False)
-                reserva.habitacion = hab
-                reserva.estado = "ACTIVA"
-                reserva.fecha_entrada = timezone.now()
-
-                # calcular noches (al menos 1)
-                delta = rform.cleaned_data["fecha_salida"] - reserva.fecha_entrada
-                noches = delta.days + (1 if delta.seconds > 0 else 0)
-                if noches <= 0:
-                    noches = 1
-
-                # costos
-                precio_noche = Decimal(hab.precio_noche)
-                reserva.costo_habitacion = precio_noche * noches
-                reserva.costo_productos = Decimal("0.00")
-
-                desc = Decimal(str(rform.cleaned_data.get("descuento_porcentaje") or 0))
-                factor_desc = (Decimal("100.00") - desc) / Decimal("100.00")
-                reserva.costo_total = (reserva.costo_habitacion * factor_desc).quantize(Decimal("0.01"))
-
-                reserva.save()
-
-                # 2) Pago
-                pago = pform.save(commit=False)
-                pago.reserva = reserva
-                pago.save()
-
-                # 3) Acompañantes
-                aformset.instance = reserva
-                aformset.save()
-
-                # 4) Cambiar estado habitación
-                hab.estado = "OCUPADA"
-                hab.save()
+            try:
+                with transaction.atomic():
+                    # 1) Tomar la habitación: UPDATE condicional sobre su fila. Solo
+                    #    una transacción concurrente puede pasarla de DISPONIBLE a
+                    #    OCUPADA; las demás ven 0 filas y salen sin esperar al resto.
+                    if not _tomar_habitaciones([hab]):
+                        raise HabitacionNoDisponible
+
+                    # 2) Reserva (la restricción reserva_activa_unica respalda lo anterior)
+                    reserva = rform.save(commit=False)
+                    reserva.habitacion = hab
+                    reserva.estado = "ACTIVA"
+                    reserva.fecha_entrada = timezone.now()
+
+                    # costos
+                    _calcular_costos(reserva, hab.precio_noche, rform.cleaned_data.get("descuento_porcentaje"))
+
+                    reserva.save()
+
+                    # 3) Pago
+                    pago = pform.save(commit=False)
+                    pago.reserva = reserva
+                    pago.save()
+
+                    # 4) Acompañantes
+                    aformset.instance = reserva
+                    aformset.save()
+
+                    recepcion.registrar_cambios_masivos([hab])
+                    estadisticas.registrar_checkins([reserva])
+            except (HabitacionNoDisponible, IntegrityError):
+                messages.error(request, f"La habitación {hab.numero} acaba de ser ocupada por otro usuario.")
+                return redirect("recepcion")
 
             messages.success(request, f"Habitación {hab.numero} ocupada correctamente.")
             return redirect("recepcion")
@@ -197,10 +304,79 @@ def ocupar_habitacion(request, pk):
         "aformset": aformset,
     })
 
+@login_required
+def checkin_grupal(request):
+    """
+    Ocupa varias habitaciones para un mismo cliente en una sola transacción:
+    las reservas, pagos y acompañantes se insertan con ``bulk_create`` y las
+    habitaciones cambian de estado con un único UPDATE.
+    """
+    piso = get_object_or_404(Piso, pk=request.GET['piso']) if request.GET.get('piso') else None
+
+    if request.method == "POST":
+        form = CheckinGrupalForm(request.POST, piso=piso)
+        if form.is_valid():
+            datos = form.cleaned_data
+            habitaciones = list(datos["habitaciones"])
+            ahora = timezone.now()
+            try:
+                with transaction.atomic():
+                    # Solo se ocupan si siguen DISPONIBLES; si alguna la tomó
+                    # otro recepcionista se revierte todo el grupo.
+                    if not _tomar_habitaciones(habitaciones):
+                        raise HabitacionNoDisponible
+
+                    reservas = []
+                    for hab in habitaciones:
+                        reserva = Reserva(
+                            habitacion=hab,
+                            cliente=datos["cliente"],
+                            estado="ACTIVA",
+                            fecha_entrada=ahora,
+                            fecha_salida=datos["fecha_salida"],
+                            descuento_porcentaje=datos["descuento_porcentaje"] or 0,
+                            observaciones=datos["observaciones"],
+                        )
+                        _calcular_costos(reserva, hab.precio_noche, datos["descuento_porcentaje"])
+                        reservas.append(reserva)
+                    Reserva.objects.bulk_create(reservas)
+                    recepcion.enlazar_reservas(reservas)
+
+                    Pago.objects.bulk_create([
+                        Pago(reserva=r, tipo_pago=datos["tipo_pago"], monto_recibido=datos["monto_recibido"])
+                        for r in reservas
+                    ])
+                    Acompanante.objects.bulk_create([
+                        Acompanante(reserva=r, dni=dni, nombre_completo=nombre)
+                        for r in reservas
+                        for dni, nombre in datos["acompanantes"][r.habitacion_id]
+                    ])
+
+                    recepcion.registrar_cambios_masivos(habitaciones, reservas)
+                    estadisticas.registrar_checkins(reservas)
+            except (HabitacionNoDisponible, IntegrityError):
+                messages.error(request, "Alguna de las habitaciones ya no está disponible. Vuelve a seleccionarlas.")
+            else:
+                numeros = ", ".join(h.numero for h in habitaciones)
+                messages.success(request, f"Check-in grupal registrado: habitaciones {numeros}.")
+                return redirect("recepcion")
+        else:
+            messages.error(request, "Revisa los datos del formulario.")
+    else:
+        salida_inicial = (timezone.now() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M")
+        form = CheckinGrupalForm(initial={"fecha_salida": salida_inicial}, piso=piso)
+
+    return render(request, "Cristal_app/Recepcion/checkin_grupal_form.html", {
+        "form": form,
+        "piso": piso,
+        "pisos": recepcion.pisos_activos(),
+    })
+
+
 @login_required
 def checkout_habitacion(request, pk):
-    hab = get_object_or_404(Habitacion, pk=pk)
-    reserva = Reserva.objects.filter(habitacion=hab, estado='ACTIVA').first()
+    hab = get_object_or_404(Habitacion.objects.select_related('reserva_activa'), pk=pk)
+    reserva = hab.reserva_activa
     if not reserva:
         messages.error(request, 'No hay una reserva activa para esta habitación.')
         return redirect('recepcion')
@@ -211,7 +387,9 @@ def checkout_habitacion(request, pk):
             reserva.fecha_salida = timezone.now()
             reserva.save()
             hab.estado = 'LIMPIEZA'
+            hab.reserva_activa = None
             hab.save()
+            estadisticas.registrar(estadisticas.dia(reserva.fecha_salida), checkouts=1)
         messages.success(request, f'Checkout realizado. Habitación {hab.numero} en limpieza.')
         return redirect('recepcion')
 
@@ -248,64 +426,207 @@ def marcar_disponible(request, pk):
 @require_POST
 def registrar_consumo(request, habitacion_id):
     hab = get_object_or_404(Habitacion, pk=habitacion_id)
-    reserva = get_object_or_404(Reserva, habitacion=hab, estado='ACTIVA')
 
     prod_ids = request.POST.getlist('producto_id[]')
     cantidades = request.POST.getlist('cantidad[]')
 
     next_url = request.POST.get('next') or reverse('recepcion')
 
+    # Cantidad total pedida por producto (un producto puede venir en varias filas)
+    pedido = defaultdict(int)
+    try:
+        for pid, cant in zip(prod_ids, cantidades):
+            if pid:
+                pedido[int(pid)] += max(int(cant or 1), 1)
+    except ValueError:
+        messages.error(request, 'Cantidad o producto inválido.')
+        return redirect(next_url)
+    if not pedido:
+        return redirect(next_url)
+
     with transaction.atomic():
+        reserva = get_object_or_404(
+            Reserva.objects.select_for_update(of=('self',)).select_related('habitacion', 'venta'),
+            pk=hab.reserva_activa_id, estado='ACTIVA',
+        )
+        # Los consumos solo insertan movimientos: el bloqueo de la fila del
+        # producto es lo que ordena a dos consumos del mismo producto. Se toma
+        # primero (en orden de pk, sin cruces) y el stock se lee en otra
+        # sentencia: en READ COMMITTED cada una ve lo confirmado antes de
+        # empezar, así incluye los movimientos de quien tenía el bloqueo.
+        list(Producto.objects.select_for_update().filter(pk__in=pedido).order_by('pk').values_list('pk'))
+        productos = {
+            p.pk: p for p in Producto.objects.con_stock_actual().filter(pk__in=pedido, activo=True)
+        }
+        faltantes = [pid for pid in pedido if pid not in productos]
+        if faltantes:
+            messages.error(request, 'Algún producto ya no está disponible.')
+            return redirect(next_url)
+        sin_stock = [productos[pid].nombre for pid, c in pedido.items() if productos[pid].stock_actual < c]
+        if sin_stock:
+            messages.error(request, f"Stock insuficiente: {', '.join(sin_stock)}.")
+            return redirect(next_url)
+
         # Crear o usar la venta asociada a la reserva
-        venta = reserva.venta or Venta.objects.create(cliente=reserva.cliente, usuario=request.user)
+        venta = reserva.venta or Venta.objects.create(cliente_id=reserva.cliente_id, usuario=request.user)
         if reserva.venta_id is None:
             reserva.venta = venta
-            reserva.save(update_fields=['venta'])
 
-        total_lineas = 0
-        for pid, cant in zip(prod_ids, cantidades):
-            if not pid:
-                continue
-            p = get_object_or_404(Producto, pk=pid)
-            c = max(int(cant or 1), 1)
-
-            # Crear detalle de venta
-            DetalleVenta.objects.create(
-                venta=venta,
-                producto=p,
-                cantidad=c,
-                precio_unitario=p.precio_venta
-            )
+        DetalleVenta.objects.bulk_create([
+            DetalleVenta(venta=venta, producto_id=pid, cantidad=c, precio_unitario=productos[pid].precio_venta)
+            for pid, c in pedido.items()
+        ])
 
-            # Descontar stock
-            p.stock = F('stock') - c
-            p.save(update_fields=['stock'])
+        # Descontar stock: un movimiento por producto en un solo INSERT
+        inventario.registrar([(pid, -c) for pid, c in pedido.items()], 'CONSUMO', venta.pk, request.user)
 
-            total_lineas += float(p.precio_venta) * c
+        total_lineas = sum((productos[pid].precio_venta * c for pid, c in pedido.items()), Decimal('0.00'))
 
         # Actualizar total de la venta y de la reserva (costo_productos / costo_total)
-        venta.total_venta = (venta.total_venta or 0) + total_lineas
-        venta.save(update_fields=['total_venta'])
+        Venta.objects.filter(pk=venta.pk).update(total_venta=F('total_venta') + total_lineas)
 
-        reserva.costo_productos = (reserva.costo_productos or 0) + total_lineas
-        # Si manejas costo_total, actualízalo aquí
+        reserva.costo_productos = (reserva.costo_productos or Decimal('0.00')) + total_lineas
         if reserva.costo_total is not None:
-            reserva.costo_total = float(reserva.costo_total) + total_lineas
-        reserva.save(update_fields=['costo_productos', 'costo_total'])
+            reserva.costo_total += total_lineas
+        reserva.save(update_fields=['venta', 'costo_productos', 'costo_total'])
+        estadisticas.registrar(estadisticas.dia(reserva.fecha_entrada), ingresos_productos=total_lineas)
 
     return redirect(next_url)
-@property
-def reserva_activa(self):
-    return self.reservas.filter(estado='ACTIVA').order_by('-fecha_entrada').first()
+
+
+@login_required
+def disponibilidad_view(request):
+    form = DisponibilidadForm(request.GET or None)
+    habitaciones = None
+    if form.is_valid():
+        habitaciones = disponibilidad.habitaciones_libres(
+            form.cleaned_data['entrada'],
+            form.cleaned_data['salida'],
+            tipo=form.cleaned_data['tipo'],
+            piso=form.cleaned_data['piso'],
+        )
+    return render(request, 'Cristal_app/Recepcion/disponibilidad.html', {
+        'form': form,
+        'habitaciones': habitaciones,
+    })
+
+
+# =======================
+# REPORTES
+# =======================
+@login_required
+def reporte_ocupacion(request):
+    form = ReporteForm(request.GET)
+    filas = None
+    if form.is_valid():
+        filas = reportes.ocupacion(
+            form.cleaned_data['desde'], form.cleaned_data['hasta'],
+            periodo=form.cleaned_data['periodo'], por=form.cleaned_data['agrupar'] or None,
+        )
+    return render(request, 'Cristal_app/Reportes/ocupacion.html', {'form': form, 'filas': filas})
+
+
+@login_required
+def reporte_ventas(request):
+    form = ReporteForm(request.GET)
+    filas = None
+    if form.is_valid():
+        filas = reportes.ventas_por_categoria(
+            form.cleaned_data['desde'], form.cleaned_data['hasta'], periodo=form.cleaned_data['periodo'],
+        )
+    return render(request, 'Cristal_app/Reportes/ventas.html', {'form': form, 'filas': filas})
+
+
+# =======================
+# EXPORTACIONES
+# =======================
+@login_required
+def exportar_view(request, recurso):
+    """CSV/XLSX en streaming; acepta los mismos filtros que el listado."""
+    exportacion = exportar.EXPORTACIONES.get(recurso)
+    if exportacion is None:
+        raise Http404
+    if not request.user.has_perm(exportacion.permiso):
+        raise PermissionDenied
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportar.FORMATOS:
+        return HttpResponseBadRequest("Formato no soportado.")
+    form = exportacion.form_class(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Filtros inválidos.")
+    return exportar.respuesta(recurso, exportacion, form.cleaned_data, formato,
+                              asincrono=isinstance(request, ASGIRequest))
+
+
+# =======================
+# IMPORTACIONES
+# =======================
+# Tiempo que queda disponible para descargar el reporte de errores
+IMPORTAR_REPORTE_TIMEOUT = 60 * 60
+IMPORTAR_REPORTE_KEY = 'importar:reporte:{usuario}:{clave}'
+
+_LISTADO_DE_IMPORTACION = {'clientes': 'cliente_list', 'proveedores': 'proveedor_list', 'productos': 'producto_list'}
+
+
+@login_required
+def importar_view(request, recurso):
+    importacion = importar.IMPORTACIONES.get(recurso)
+    if importacion is None:
+        raise Http404
+    if not request.user.has_perm(importacion.permiso):
+        raise PermissionDenied
+
+    form = ImportarForm(request.POST or None, request.FILES or None)
+    resultado = reporte = None
+    if request.method == 'POST' and form.is_valid():
+        archivo = io.TextIOWrapper(form.cleaned_data['archivo'].file, encoding='utf-8-sig', newline='')
+        try:
+            resultado = importar.importar(recurso, archivo, usuario=request.user)
+        except UnicodeDecodeError:
+            form.add_error('archivo', "El archivo debe estar codificado en UTF-8.")
+        if resultado and resultado.errores:
+            # El reporte completo se descarga aparte; la página muestra solo el inicio
+            destino = io.StringIO()
+            resultado.escribir_reporte(destino)
+            reporte = uuid.uuid4().hex
+            cache.set(IMPORTAR_REPORTE_KEY.format(usuario=request.user.pk, clave=reporte),
+                      destino.getvalue(), IMPORTAR_REPORTE_TIMEOUT)
+
+    return render(request, 'Cristal_app/Importacion/importar.html', {
+        'form': form,
+        'recurso': recurso,
+        'listado_url': reverse(_LISTADO_DE_IMPORTACION[recurso]),
+        'columnas': list(importacion.form_class.base_fields),
+        'resultado': resultado,
+        'errores': resultado.errores[:200] if resultado else [],
+        'reporte': reporte,
+    })
+
+
+@login_required
+def importar_reporte(request, clave):
+    contenido = cache.get(IMPORTAR_REPORTE_KEY.format(usuario=request.user.pk, clave=clave))
+    if contenido is None:
+        raise Http404
+    response = HttpResponse('\ufeff' + contenido, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="errores-importacion.csv"'
+    return response
+
 
 # =======================
 # CRUD USUARIOS
 # =======================
-class UserListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class UserListView(LoginRequiredMixin, PermissionRequiredMixin, ListadoKeysetMixin, ListView):
     model = User
+    queryset = User.objects.prefetch_related('groups')
     template_name = 'Cristal_app/Acceso/usuarios/user_list.html'
     context_object_name = 'users'
     permission_required = 'auth.view_user'
+    orden_campos = {'id': 'pk', 'usuario': 'username'}
+    orden_defecto = 'usuario'
+    filtro_form_class = UserFiltroForm
+    filtro_lookups = {'grupo': 'groups', 'activo': 'is_active'}
+    json_campos = ('id', 'username', 'email', 'is_active')
 
 
 class UserCreateView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessageMixin, CreateView):
@@ -480,11 +801,17 @@ class CategoriaDeleteView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMe
     permission_required = 'Cristal_app.delete_categoria'
 
 
-class ProductoListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class ProductoListView(LoginRequiredMixin, PermissionRequiredMixin, ListadoKeysetMixin, ListView):
     model = Producto
+    queryset = Producto.objects.con_stock_actual().select_related('categoria')
     template_name = 'Cristal_app/Almacen/Productos/producto_list.html'
     context_object_name = 'productos'
     permission_required = 'Cristal_app.view_producto'
+    orden_campos = {'id': 'pk', 'nombre': 'nombre', 'precio': 'precio_venta'}
+    orden_defecto = 'nombre'
+    filtro_form_class = ProductoFiltroForm
+    filtro_lookups = {'categoria': 'categoria', 'activo': 'activo'}
+    json_campos = ('id', 'nombre', 'categoria__nombre', 'precio_venta', 'stock_actual', 'activo')
 
 
 class ProductoCreateView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessageMixin, CreateView):
@@ -495,16 +822,46 @@ class ProductoCreateView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMes
     success_message = "Producto '%(nombre)s' creado exitosamente."
     permission_required = 'Cristal_app.add_producto'
 
+    def form_valid(self, form):
+        # El stock inicial entra como ajuste en el libro de movimientos
+        inicial = form.instance.stock
+        form.instance.stock = 0
+        with transaction.atomic():
+            response = super().form_valid(form)
+            inventario.registrar([(self.object.pk, inicial)], 'AJUSTE', usuario=self.request.user)
+        return response
+
 
 class ProductoUpdateView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessageMixin, UpdateView):
     model = Producto
-    fields = ['nombre', 'categoria', 'precio_venta', 'stock', 'descripcion', 'imagen', 'activo']
+    form_class = ProductoEdicionForm
     template_name = 'Cristal_app/Almacen/Productos/producto_form.html'
     context_object_name = 'producto'
     success_url = reverse_lazy('producto_list')
     success_message = "Producto '%(nombre)s' actualizado exitosamente."
     permission_required = 'Cristal_app.change_producto'
 
+    def get_queryset(self):
+        return Producto.objects.con_stock_actual()
+
+    def get_initial(self):
+        # El formulario edita el stock real, no el snapshot
+        stock = self.object.stock_actual
+        return {**super().get_initial(), 'stock': stock, 'stock_original': stock}
+
+    def form_valid(self, form):
+        # Producto.save() no escribe el snapshot: lo que el usuario cambió
+        # respecto de lo que vio se registra como ajuste (registrar omite el
+        # cero) y la compactación lo sumará. Los consumos hechos mientras el
+        # formulario estaba abierto se conservan.
+        with transaction.atomic():
+            response = super().form_valid(form)
+            inventario.registrar(
+                [(self.object.pk, form.cleaned_data['stock'] - form.cleaned_data['stock_original'])],
+                'AJUSTE', usuario=self.request.user,
+            )
+        return response
+
 
 class ProductoDeleteView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessageMixin, DeleteView):
     model = Producto
@@ -515,14 +872,62 @@ class ProductoDeleteView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMes
     permission_required = 'Cristal_app.delete_producto'
 
 
+@login_required
+def producto_imagen(request, huella, ancho, formato):
+    """Miniatura por huella; la genera si falta. El contenido de una URL nunca cambia."""
+    if ancho not in imagenes.ANCHOS or formato not in imagenes.FORMATOS:
+        raise Http404
+    nombre = imagenes.nombre_derivada(huella, ancho, formato)
+    if not default_storage.exists(nombre):
+        producto = Producto.objects.filter(imagen_huella=huella).only('imagen', 'imagen_huella').first()
+        if producto is None:
+            raise Http404
+        # Solo la pedida: las demás pueden existir aunque esta se haya perdido
+        imagenes.generar_o_registrar(producto, derivadas=[(ancho, formato)])
+    try:
+        archivo = default_storage.open(nombre)
+    except OSError:
+        # Original ilegible o borrado: la derivada no se pudo generar
+        raise Http404
+    response = FileResponse(archivo, content_type=f'image/{formato}')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 # =======================
 # COMPRAS
 # =======================
-class CompraListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+def _lineas_por_producto(detalles, precio):
+    """
+    ``({producto_id: cantidad}, total)`` de un queryset de detalles, agregado en
+    la BD con una sola consulta. ``precio`` es el campo de precio por unidad.
+    """
+    filas = (detalles.order_by()
+             .values('producto')
+             .annotate(unidades=Sum('cantidad'),
+                       importe=Sum(F('cantidad') * F(precio),
+                                   output_field=DecimalField(max_digits=12, decimal_places=2))))
+    cantidades, total = {}, Decimal('0')
+    for f in filas:
+        cantidades[f['producto']] = f['unidades']
+        total += f['importe']
+    return cantidades, total
+
+
+class CompraListView(LoginRequiredMixin, PermissionRequiredMixin, ListadoKeysetMixin, ListView):
     model = Compra
+    queryset = Compra.objects.select_related('proveedor', 'usuario')
     template_name = 'Cristal_app/Almacen/Compra/compra_list.html'
     context_object_name = 'compras'
     permission_required = 'Cristal_app.view_compra'
+    orden_campos = {'id': 'pk', 'fecha': 'fecha_compra', 'total': 'total_compra'}
+    orden_defecto = '-fecha'
+    filtro_form_class = CompraFiltroForm
+    filtro_lookups = {
+        'desde': 'fecha_compra__gte', 'hasta': 'fecha_compra__lt',
+        'proveedor': 'proveedor', 'usuario': 'usuario',
+    }
+    json_campos = ('id', 'proveedor__nombre', 'usuario__username', 'fecha_compra', 'total_compra')
 
 
 class CompraCreateView(LoginRequiredMixin, PermissionRequiredMixin, View):
@@ -543,16 +948,17 @@ class CompraCreateView(LoginRequiredMixin, PermissionRequiredMixin, View):
                 c.usuario = request.user
                 c.save()
                 total = Decimal('0')
+                movimientos = []
                 for df in fs:
                     if df.cleaned_data and not df.cleaned_data.get('DELETE'):
                         d = df.save(commit=False)
                         d.compra = c
                         d.save()
-                        d.producto.stock += d.cantidad
-                        d.producto.save()
+                        movimientos.append((d.producto_id, d.cantidad))
                         total += Decimal(d.cantidad) * Decimal(d.costo_unitario)
                 c.total_compra = total
                 c.save()
+                inventario.registrar(movimientos, 'COMPRA', c.pk, request.user)
             messages.success(request, f"Compra #{c.pk} creada.")
             return redirect('compra_list')
         messages.error(request, "Error en el formulario.")
@@ -577,19 +983,14 @@ class CompraUpdateView(LoginRequiredMixin, PermissionRequiredMixin, View):
         fs = DetalleCompraFormSet(request.POST, instance=c)
         if form.is_valid() and fs.is_valid():
             with transaction.atomic():
-                # revertir stock anterior
-                for d in DetalleCompra.objects.filter(compra=c):
-                    d.producto.stock -= d.cantidad
-                    d.producto.save()
+                # Solo la diferencia neta por producto entre las líneas viejas y las nuevas
+                antes, _ = _lineas_por_producto(DetalleCompra.objects.filter(compra=c), 'costo_unitario')
                 form.save()
                 fs.save()
-                total = Decimal('0')
-                for d in DetalleCompra.objects.filter(compra=c):
-                    d.producto.stock += d.cantidad
-                    d.producto.save()
-                    total += Decimal(d.cantidad) * Decimal(d.costo_unitario)
-                c.total_compra = total
-                c.save()
+                despues, c.total_compra = _lineas_por_producto(
+                    DetalleCompra.objects.filter(compra=c), 'costo_unitario')
+                c.save(update_fields=['total_compra'])
+                inventario.registrar(inventario.diferencia(antes, despues), 'COMPRA', c.pk, request.user)
             messages.success(request, f"Compra #{c.pk} actualizada.")
             return redirect('compra_list')
         messages.error(request, "Error en el formulario.")
@@ -603,24 +1004,31 @@ class CompraDeleteView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessa
     context_object_name = 'compra'
     permission_required = 'Cristal_app.delete_compra'
 
-    def delete(self, request, *args, **kwargs):
-        c = self.get_object()
-        for d in DetalleCompra.objects.filter(compra=c):
-            d.producto.stock -= d.cantidad
-            d.producto.save()
-        c.delete()
-        messages.success(request, "Compra eliminada.")
+    def form_valid(self, form):
+        # DeleteView confirma por form_valid(); aquí se devuelve el stock
+        c = self.object
+        with transaction.atomic():
+            cantidades, _ = _lineas_por_producto(DetalleCompra.objects.filter(compra=c), 'costo_unitario')
+            inventario.registrar(inventario.diferencia(cantidades, {}), 'COMPRA', c.pk, self.request.user)
+            c.delete()
+        messages.success(self.request, "Compra eliminada.")
         return redirect(self.success_url)
 
 
 # =======================
 # VENTAS
 # =======================
-class VentaListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class VentaListView(LoginRequiredMixin, PermissionRequiredMixin, ListadoKeysetMixin, ListView):
     model = Venta
+    queryset = Venta.objects.select_related('usuario')
     template_name = 'Cristal_app/Almacen/Venta/venta_list.html'
     context_object_name = 'ventas'
     permission_required = 'Cristal_app.view_venta'
+    orden_campos = {'id': 'pk', 'fecha': 'fecha_venta', 'total': 'total_venta'}
+    orden_defecto = '-fecha'
+    filtro_form_class = VentaFiltroForm
+    filtro_lookups = {'desde': 'fecha_venta__gte', 'hasta': 'fecha_venta__lt', 'usuario': 'usuario'}
+    json_campos = ('id', 'usuario__username', 'fecha_venta', 'total_venta')
 
 
 class VentaCreateView(LoginRequiredMixin, PermissionRequiredMixin, View):
@@ -641,16 +1049,17 @@ class VentaCreateView(LoginRequiredMixin, PermissionRequiredMixin, View):
                 v.usuario = request.user
                 v.save()
                 total = Decimal('0')
+                movimientos = []
                 for df in fs:
                     if df.cleaned_data and not df.cleaned_data.get('DELETE'):
                         d = df.save(commit=False)
                         d.venta = v
                         d.save()
-                        d.producto.stock -= d.cantidad
-                        d.producto.save()
+                        movimientos.append((d.producto_id, -d.cantidad))
                         total += Decimal(d.cantidad) * Decimal(d.precio_unitario)
                 v.total_venta = total
                 v.save()
+                inventario.registrar(movimientos, 'VENTA', v.pk, request.user)
             messages.success(request, f"Venta #{v.pk} creada.")
             return redirect('venta_list')
         messages.error(request, "Error en el formulario.")
@@ -675,18 +1084,14 @@ class VentaUpdateView(LoginRequiredMixin, PermissionRequiredMixin, View):
         fs = DetalleVentaFormSet(request.POST, instance=v)
         if form.is_valid() and fs.is_valid():
             with transaction.atomic():
-                for d in DetalleVenta.objects.filter(venta=v):
-                    d.producto.stock += d.cantidad
-                    d.producto.save()
+                # Lo vendido sale del stock: el movimiento es la diferencia con signo invertido
+                antes, _ = _lineas_por_producto(DetalleVenta.objects.filter(venta=v), 'precio_unitario')
                 form.save()
                 fs.save()
-                total = Decimal('0')
-                for d in DetalleVenta.objects.filter(venta=v):
-                    d.producto.stock -= d.cantidad
-                    d.producto.save()
-                    total += Decimal(d.cantidad) * Decimal(d.precio_unitario)
-                v.total_venta = total
-                v.save()
+                despues, v.total_venta = _lineas_por_producto(
+                    DetalleVenta.objects.filter(venta=v), 'precio_unitario')
+                v.save(update_fields=['total_venta'])
+                inventario.registrar(inventario.diferencia(despues, antes), 'VENTA', v.pk, request.user)
             messages.success(request, f"Venta #{v.pk} actualizada.")
             return redirect('venta_list')
         messages.error(request, "Error en el formulario.")
@@ -700,24 +1105,50 @@ class VentaDeleteView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessag
     context_object_name = 'venta'
     permission_required = 'Cristal_app.delete_venta'
 
-    def delete(self, request, *args, **kwargs):
-        v = self.get_object()
-        for d in DetalleVenta.objects.filter(venta=v):
-            d.producto.stock += d.cantidad
-            d.producto.save()
-        v.delete()
-        messages.success(request, "Venta eliminada.")
+    def form_valid(self, form):
+        # DeleteView confirma por form_valid(); aquí se devuelve el stock
+        v = self.object
+        with transaction.atomic():
+            cantidades, _ = _lineas_por_producto(DetalleVenta.objects.filter(venta=v), 'precio_unitario')
+            inventario.registrar(inventario.diferencia({}, cantidades), 'VENTA', v.pk, self.request.user)
+            v.delete()
+        messages.success(self.request, "Venta eliminada.")
         return redirect(self.success_url)
 
 
 # =======================
 # CLIENTES
 # =======================
-class ClienteListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class ClienteListView(LoginRequiredMixin, PermissionRequiredMixin, ListadoKeysetMixin, ListView):
     model = Cliente
     template_name = 'Cristal_app/Cliente/cliente_list.html'
     context_object_name = 'clientes'
     permission_required = 'Cristal_app.view_cliente'
+    orden_campos = {'id': 'pk', 'dni': 'dni', 'nombre': 'nombrecompleto'}
+    orden_defecto = 'nombre'
+    filtro_form_class = ClienteFiltroForm
+    filtro_lookups = {'desde': 'fecha_creacion__gte', 'hasta': 'fecha_creacion__lt', 'activo': 'activo'}
+    json_campos = ('id', 'dni', 'nombrecompleto', 'telefono', 'email', 'activo')
+
+
+# Resultados por página del autocompletado; los nombres necesitan 3 letras
+# para que el índice trigram pueda usarse
+CLIENTE_BUSCAR_LIMITE = 20
+CLIENTE_BUSCAR_MIN_NOMBRE = 3
+
+
+@login_required
+def cliente_buscar(request):
+    """Autocompletado de clientes activos en el formato de Select2."""
+    texto = request.GET.get('q', '').strip()
+    if len(texto) < (2 if texto.isdigit() else CLIENTE_BUSCAR_MIN_NOMBRE):
+        return JsonResponse({'results': [], 'pagination': {'more': False}})
+    filas = list(Cliente.objects.filter(activo=True).buscar(texto)
+                 .values_list('pk', 'dni', 'nombrecompleto')[:CLIENTE_BUSCAR_LIMITE + 1])
+    return JsonResponse({
+        'results': [{'id': pk, 'text': f'{dni} - {nombre}'} for pk, dni, nombre in filas[:CLIENTE_BUSCAR_LIMITE]],
+        'pagination': {'more': len(filas) > CLIENTE_BUSCAR_LIMITE},
+    })
 
 
 class ClienteCreateView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessageMixin, CreateView):
@@ -849,6 +1280,7 @@ class PisoDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
 
 class HabitacionListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     model = Habitacion
+    queryset = Habitacion.objects.select_related('piso', 'tipo')
     template_name = 'Cristal_app/Mantenimiento/Habitacion/habitacion_list.html'
     context_object_name = 'habitaciones'
     permission_required = 'Cristal_app.view_habitacion'
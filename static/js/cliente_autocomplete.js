@@ -0,0 +1,21 @@
+// Autocompletado de clientes (ClienteAutocompleteSelect): busca por DNI o
+// nombre en el servidor en lugar de cargar todos los clientes en el <select>.
+$(function () {
+  $('select.cliente-autocomplete').each(function () {
+    var $select = $(this);
+    $select.select2({
+      theme: 'bootstrap4',
+      language: 'es',
+      width: '100%',
+      allowClear: true,
+      placeholder: $select.data('placeholder'),
+      minimumInputLength: 2,
+      ajax: {
+        url: $select.data('url'),
+        dataType: 'json',
+        delay: 200,
+        data: function (params) { return {q: params.term}; }
+      }
+    });
+  });
+});
@@ -0,0 +1,27 @@
+// Buscador de productos de los formsets de compra y venta (ProductoSelect).
+// El catálogo llega una sola vez en #opciones-productos y todas las filas
+// buscan en él, en lugar de repetir cada <option> en cada fila.
+$(function () {
+  var fuente = document.getElementById('opciones-productos');
+  if (!fuente) return;
+  var productos = JSON.parse(fuente.textContent)
+    .filter(function (o) { return o[0] !== ''; })
+    .map(function (o) { return {id: o[0], text: o[1]}; });
+
+  function buscar(params, success) {
+    var texto = (params.data.q || '').toLowerCase();
+    var resultados = productos.filter(function (p) {
+      return p.text.toLowerCase().indexOf(texto) !== -1;
+    });
+    success({results: resultados.slice(0, 50)});
+  }
+
+  $('select.producto-select').select2({
+    theme: 'bootstrap4',
+    language: 'es',
+    width: '100%',
+    placeholder: 'Buscar producto',
+    allowClear: true,
+    ajax: {transport: buscar, delay: 0}
+  });
+});